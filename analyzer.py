@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Local mirror of the Elasticsearch language analyzers used by dictionary indices
+
+Vocabularies are indexed with the analyzer of their language, so Elasticsearch returns `hotel` for a text with
+`hotels`. Candidates are confirmed by comparing analyzed terms of the vocabulary and the text, with the same
+stemmers and stopwords where NLTK has them:
+
+* english uses the original Porter algorithm as `porter_stem`, danish, dutch, finnish, hungarian, norwegian,
+  romanian, russian and swedish use the same Snowball stemmers as Elasticsearch
+* arabic, french, german, italian, portuguese and spanish use Snowball stemmers, Elasticsearch uses light stemmers
+  of these languages which strip fewer suffixes
+* other languages, and languages which are not supported (`standard` analyzer), are not stemmed
+
+Unlike the Elasticsearch tokenizer, punctuation is kept as terms, so `c++` does not match `c`.
+"""
+import re
+
+from nltk.stem.porter import PorterStemmer
+from nltk.stem.snowball import SnowballStemmer
+
+from matcher import Matcher
+from util.utils import get_logger
+
+STEMMERS = {
+    'english': lambda: PorterStemmer(mode=PorterStemmer.ORIGINAL_ALGORITHM)
+}
+for _lang in ('arabic', 'danish', 'dutch', 'finnish', 'french', 'german', 'hungarian', 'italian', 'norwegian',
+              'portuguese', 'romanian', 'russian', 'spanish', 'swedish'):
+    STEMMERS[_lang] = lambda lang=_lang: SnowballStemmer(lang)
+
+# `_english_` stopwords of Elasticsearch, other languages use the Snowball lists which NLTK also ships
+ENGLISH_STOPWORDS = {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in', 'into', 'is', 'it',
+                     'no', 'not', 'of', 'on', 'or', 'such', 'that', 'the', 'their', 'then', 'there', 'these', 'they',
+                     'this', 'to', 'was', 'will', 'with'}
+
+# articles removed by the `elision` filter of the language analyzers
+ELISIONS = {
+    'catalan': {'d', 'l', 'm', 'n', 's', 't'},
+    'french': {'l', 'm', 't', 'qu', 'n', 's', 'j', 'd', 'c', 'jusqu', 'quoiqu', 'lorsqu', 'puisqu'},
+    'irish': {'d', 'm', 'b'},
+    'italian': {'c', 'l', 'all', 'dall', 'dell', 'nell', 'sull', 'coll', 'pell', 'gl', 'agl', 'dagl', 'degl', 'negl',
+                'sugl', 'un', 'm', 't', 's', 'v', 'd'}
+}
+
+_analyzers = {}
+
+
+def get_analyzer(lang):
+    """Analyzer of a language shared by the process, its stems are cached"""
+    if lang not in _analyzers:
+        _analyzers[lang] = LanguageAnalyzer(lang)
+    return _analyzers[lang]
+
+
+class LanguageAnalyzer(object):
+    # words with inner apostrophes as the standard tokenizer, or runs of punctuation
+    token_pattern = re.compile(u"(\\w+(?:['’]\\w+)*)|[^\\w\\s]+", re.UNICODE)
+
+    def __init__(self, lang, cache_size=100000):
+        self.logger = get_logger(self.__class__.__name__)
+        self.lang = lang
+        self.cache_size = cache_size
+        self.stemmer = STEMMERS[lang]() if lang in STEMMERS else None
+        self.stopwords = self._load_stopwords(lang)
+        self.elisions = ELISIONS.get(lang, set())
+        self._stems = {}
+        self._vocs = {}
+
+    def _load_stopwords(self, lang):
+        if lang == 'english':
+            return ENGLISH_STOPWORDS
+        if lang not in STEMMERS:
+            return set()
+        try:
+            from nltk.corpus import stopwords
+            return set(stopwords.words(lang))
+        except (LookupError, IOError):
+            self.logger.warning("NLTK stopwords of '%s' are not installed, run `nltk.download('stopwords')`" % lang)
+            return set()
+
+    def _stem(self, word):
+        stem = self._stems.get(word)
+        if stem is None:
+            if len(self._stems) >= self.cache_size:
+                self._stems.clear()
+            stem = self.stemmer.stem(word) if self.stemmer else word
+            self._stems[word] = stem
+        return stem
+
+    def tokenize(self, text):
+        """(start, end, term, indexed) of a normalized text, term of a word is its stem, `indexed` is False for
+        punctuation and stopwords which Elasticsearch does not index"""
+        result = []
+        for m in self.token_pattern.finditer(text):
+            word = m.group(1)
+            start, end = m.start(), m.end()
+            if word is None:
+                result.append((start, end, m.group(), False))
+                continue
+            if u"'" in word or u'’' in word:
+                word = word.replace(u'’', u"'")
+                head, _, tail = word.partition(u"'")
+                if head in self.elisions:
+                    start += len(head) + 1
+                    word = tail
+                if self.lang == 'english' and word.endswith(u"'s"):
+                    end -= 2
+                    word = word[:-2]
+            result.append((start, end, self._stem(word), word not in self.stopwords))
+        return result
+
+    def analyze(self, voc):
+        """Terms of a vocabulary, None if Elasticsearch would not index any term for it, e.g. only stopwords"""
+        terms = self._vocs.get(voc)
+        if terms is None:
+            if len(self._vocs) >= self.cache_size:
+                self._vocs.clear()
+            tokens = self.tokenize(voc)
+            terms = tuple(t[2] for t in tokens) if any(t[3] for t in tokens) else ()
+            self._vocs[voc] = terms
+        return terms or None
+
+
+class AnalyzedMatcher(Matcher):
+    """Match vocabularies on analyzed terms, e.g. `hotels` matches `hotel` in english"""
+    def __init__(self, vocs=(), lang='english', analyzer=None):
+        self.analyzer = analyzer or get_analyzer(lang)
+        # first term -> [(terms, voc)]
+        self._forms = {}
+        self._size = 0
+        for voc in vocs:
+            self.add(voc)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, voc):
+        terms = self.analyzer.analyze(voc)
+        if not terms:
+            return
+        self._forms.setdefault(terms[0], []).append((terms, voc))
+        self._size += 1
+
+    def find_all(self, text, tokens=None):
+        """`tokens` of the text could be given when it is matched by several matchers of the same language"""
+        result = []
+        if tokens is None:
+            tokens = self.analyzer.tokenize(text)
+        terms = [t[2] for t in tokens]
+        for idx, term in enumerate(terms):
+            for form, voc in self._forms.get(term, ()):
+                end = idx + len(form)
+                if len(form) == 1 or tuple(terms[idx:end]) == form:
+                    result.append((tokens[idx][0], tokens[end - 1][1], voc))
+        return result
@@ -1,9 +1,17 @@
-from flask import Flask, request
+import cProfile
+import json
+from functools import wraps
+
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_restplus import Api, Resource, fields
 
-from dictionary import DictionaryES
-from text_stats import TextStats
-from util.utils import get_logger
+from dictionary_cache import dictionary_cache
+from services import Services
+from util.admission import admission, deadline_scope
+from util.metrics import format_profile, metrics, profile_header
+from util.stream import iter_chunks, iter_lines
+from util.utils import get_logger, get_memory_usage
+from warmup import Warmup
 
 logger = get_logger(__name__)
 
@@ -12,6 +20,12 @@ api = Api(app, doc='/doc/', version='1.0', title='Named entity tagging')
 
 ns_dic = api.namespace('dictionary', 'Manage dictionaries')
 
+# built once at app startup, injected into resources
+services = Services()
+service_kwargs = {'services': services}
+# run by `main` before serving, see `warmup`
+warmup = Warmup(services)
+
 support_languages = ['arabic', 'armenian', 'basque', 'brazilian', 'bulgarian', 'catalan', 'cjk', 'czech',
                      'danish', 'dutch', 'english', 'finnish', 'french', 'galician', 'german', 'greek',
                      'hindi',
@@ -21,8 +35,69 @@ support_languages = ['arabic', 'armenian', 'basque', 'brazilian', 'bulgarian', '
                      'thai']
 
 
-@ns_dic.route('/manage')
-class DictionaryManageResource(Resource):
+@app.before_request
+def begin_request():
+    metrics.begin_request()
+
+
+@app.after_request
+def end_request(response):
+    # streamed responses are measured until their last chunk is sent
+    endpoint = request.url_rule.rule if request.url_rule else 'unknown'
+    method, status = request.method, response.status_code
+    response.call_on_close(lambda: metrics.end_request(endpoint, method, status))
+    return response
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Metrics of all workers in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/health/ready')
+def get_ready():
+    """Readiness of the worker, 503 until the warm-up succeeded, a failed warm-up is retried"""
+    ready = warmup.retry()
+    response = jsonify(warmup.to_dict())
+    response.status_code = 200 if ready else 503
+    return response
+
+
+def profiled(func):
+    """Add stage timings and counters of the request to its result as `profile` if the profile header is sent,
+    header value `cprofile` also adds the functions with the most cumulative time"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        mode = request.headers.get(profile_header, '').lower() if profile_header else ''
+        if not mode:
+            return func(*args, **kwargs)
+        profiler = cProfile.Profile() if mode == 'cprofile' else None
+        if profiler:
+            profiler.enable()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            if profiler:
+                profiler.disable()
+        if isinstance(result, dict) and metrics.scope is not None:
+            result['profile'] = metrics.scope.to_dict()
+            if profiler:
+                result['profile']['cprofile'] = format_profile(profiler)
+        return result
+
+    return wrapper
+
+
+class ServiceResource(Resource):
+    """Resource using the shared services"""
+    def __init__(self, api=None, services=None, *args, **kwargs):
+        super(ServiceResource, self).__init__(api, *args, **kwargs)
+        self.services = services
+
+
+@ns_dic.route('/manage', resource_class_kwargs=service_kwargs)
+class DictionaryManageResource(ServiceResource):
     """Manage dictionaries"""
     @api.doc(params={'vocs': 'The vocabularies for adding, if many, separate by comma',
                      'dic': 'The dictionary name for vocabularies',
@@ -52,14 +127,19 @@ class DictionaryManageResource(Resource):
 
         lang = request.values.get('lang', 'english')
 
-        d = DictionaryES()
+        d = self.services.dictionary
         success, fail = d.add_voc(vocs, dic, lang)
         result['message'] = "%s vocabularies was added to dictionary '%s' successfully, %s failed" \
                             % (success, dic, fail)
         return result
 
     @api.doc(params={'dics': 'The dictionaries for getting vocabularies, if many, separate by comma, if empty, get all',
-                     'lang': 'The dictionary language, default is `english`'})
+                     'lang': 'The dictionary language, default is `english`',
+                     'count_only': 'If `true`, only return `num_voc` of each dictionary, without vocabularies',
+                     'prefix': 'Only vocabularies starting with this prefix',
+                     'size': 'Max number of vocabularies per dictionary in a page, a page is returned if `size`, '
+                             '`after` or `prefix` is set, otherwise all vocabularies',
+                     'after': 'Return vocabularies after this one, the `next` of a dictionary in the previous page'})
     @api.response(200, 'Success')
     def get(self):
         """Get dictionary vocabularies"""
@@ -71,9 +151,21 @@ class DictionaryManageResource(Resource):
         dics = [u.strip().lower() for u in dics.split(',') if u]
 
         lang = request.values.get('lang', 'english')
+        prefix = request.values.get('prefix', '')
+        after = request.values.get('after', '')
+        size = request.values.get('size', '')
+        if size and not (size.isdigit() and 0 < int(size) <= 10000):
+            result['error'] = True
+            result['message'] = 'size must be between 1 and 10000'
+            return result
 
-        d = DictionaryES()
-        result['dics'] = d.get_voc(dics, lang)
+        d = self.services.dictionary
+        if request.values.get('count_only', '').lower() in ('1', 'true', 'yes'):
+            result['dics'] = d.count_voc(dics, lang, prefix)
+        elif size or after or prefix:
+            result['dics'] = d.get_voc_page(dics, lang, int(size or 1000), after, prefix)
+        else:
+            result['dics'] = d.get_voc(dics, lang)
         return result
 
     @api.doc(params={'dics': 'The dictionaries name to be deleted, if many, separate by comma',
@@ -94,13 +186,13 @@ class DictionaryManageResource(Resource):
 
         lang = request.values.get('lang', 'english')
 
-        d = DictionaryES()
+        d = self.services.dictionary
         result['dics'] = d.remove_dic(dics, lang)
         return result
 
 
-@ns_dic.route('/vocab/delete')
-class VocabularyResource(Resource):
+@ns_dic.route('/vocab/delete', resource_class_kwargs=service_kwargs)
+class VocabularyResource(ServiceResource):
     @api.doc(params={'dic': 'The dictionaries name',
                      'vocs': 'The vocabularies to be deleted, if many, separate by comma',
                      'lang': 'The dictionary language, default is `english`'})
@@ -126,41 +218,232 @@ class VocabularyResource(Resource):
 
         lang = request.values.get('lang', 'english')
 
-        d = DictionaryES()
+        d = self.services.dictionary
         success, fail = d.remove_voc(dic, vocs, lang)
         result['message'] = '%s was removed successfully, %s failed' % (success, fail)
         return result
 
+@ns_dic.route('/import', resource_class_kwargs=service_kwargs)
+class DictionaryImportResource(ServiceResource):
+    @api.doc(params={'dic': 'The dictionary name for vocabularies',
+                     'lang': 'The dictionary language, default is `english`',
+                     'batch_size': 'Number of vocabularies indexed at once, default is `1000`'},
+             description='Upload a file as `file` form field or send it as request body, one vocabulary per line, '
+                         'gzip compressed if file name ends with `.gz` or header `Content-Encoding: gzip` is sent. '
+                         'Response is newline-delimited JSON progress, one line per batch')
+    @api.response(200, 'Success')
+    def put(self):
+        """Import vocabularies from a large file"""
+        dic = request.args.get('dic', '').strip().lower()
+        if not dic:
+            return {'error': True, 'message': 'dic is empty'}
+
+        lang = request.args.get('lang', 'english')
+        batch_size = request.args.get('batch_size', '1000')
+        if not (batch_size.isdigit() and int(batch_size) > 0):
+            return {'error': True, 'message': 'batch_size must be a positive integer'}
+        batch_size = int(batch_size)
+        upload = request.files.get('file')
+        if upload:
+            stream, gzipped = upload.stream, upload.filename.endswith('.gz')
+        else:
+            stream, gzipped = request.stream, request.headers.get('Content-Encoding', '').lower() == 'gzip'
+
+        def generate():
+            d = self.services.dictionary
+            for stats in d.iter_import_voc(iter_lines(stream, gzipped), dic, lang, batch_size):
+                yield json.dumps(stats) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@ns_dic.route('/export', resource_class_kwargs=service_kwargs)
+class DictionaryExportResource(ServiceResource):
+    @api.doc(params={'dic': 'The dictionary name',
+                     'lang': 'The dictionary language, default is `english`'})
+    @api.response(200, 'Success')
+    def get(self):
+        """Export dictionary vocabularies, one vocabulary per line"""
+        dic = request.values.get('dic', '').strip().lower()
+        if not dic:
+            return {'error': True, 'message': 'dic is empty'}
+
+        lang = request.values.get('lang', 'english')
+        d = self.services.dictionary
+        vocs = (voc + u'\n' for _, voc in d.export_voc([dic], lang))
+        return Response(stream_with_context(v.encode('utf-8') for v in vocs), mimetype='text/plain')
+
 ns_ne = api.namespace('stats', 'Named entity recognition')
 
 
-@ns_ne.route('/ner')
-class NamedEntityTaggingResource(Resource):
+@ns_ne.route('/ner', resource_class_kwargs=service_kwargs)
+class NamedEntityTaggingResource(ServiceResource):
     """Named entity tagging"""
     @api.doc(params={'texts': 'The texts for NER, if many, separate by comma',
                      'count_only': 'Specific string for counting in each text',
                      'lookup': 'Dictionaries for tagging, if empty, get all',
-                     'lang': 'The dictionary language, default is `english`'})
+                     'lang': 'The dictionary language, default is `english`, if many, separate by comma',
+                     'spans': 'If `true`, add matched entities as `spans`, each with `start` and `end` offsets in '
+                              '`text`, `dic`, `term` and the edit `distance` of fuzzy matches',
+                     'timeout': 'Seconds to tag the texts, at most and by default `%s`, texts which are not '
+                                'completely tagged in time have `timed_out` and the result is `partial`, as well as '
+                                'when texts have `failed` dictionaries' % admission.request_timeout},
+             description='Send header `X-Profile: 1` to get timings of the tagging stages as `profile`, '
+                         '`X-Profile: cprofile` also profiles functions')
     @api.response(200, 'Success')
+    @api.response(413, 'More than `MAX_TEXTS` texts or `MAX_REQUEST_BYTES` bytes')
+    @api.response(429, 'Too many requests in the worker, retry later')
+    @profiled
     def post(self):
         """Post texts for named entity recognition"""
         result = {
             'error': False,
             'message': ''
         }
+        if len(request.query_string) + (request.content_length or 0) > admission.max_request_bytes:
+            admission.reject('too_large')
+            result['error'] = True
+            result['message'] = 'request is larger than %s bytes' % admission.max_request_bytes
+            return result, 413
+
         texts = request.values.get('texts', '')
         texts = [t.strip().lower() for t in texts.split(',') if t]
         if not texts:
             result['error'] = True
             result['message'] = 'texts is empty'
             return result
+        if len(texts) > admission.max_texts:
+            admission.reject('too_many_texts')
+            result['error'] = True
+            result['message'] = 'at most %s texts per request' % admission.max_texts
+            return result, 413
+
+        timeout = request.values.get('timeout', '')
+        try:
+            timeout = min(float(timeout), admission.request_timeout) if timeout else admission.request_timeout
+        except ValueError:
+            timeout = -1
+        if timeout <= 0:
+            result['error'] = True
+            result['message'] = 'timeout must be a positive number of seconds'
+            return result
 
         count_only = request.values.get('count_only', '')
         lookup = request.values.get('lookup', '')
         lookup = [l.strip().lower() for l in lookup.split(',') if l]
 
         lang = request.values.get('lang', 'english')
+        spans = request.values.get('spans', '').lower() in ('1', 'true', 'yes')
 
-        stats = TextStats()
-        result['texts'] = stats.get_stats(texts, count_only, lookup, lang)
+        stats = self.services.text_stats
+        with admission.slot() as admitted:
+            if not admitted:
+                result['error'] = True
+                result['message'] = 'too many requests, retry later'
+                return result, 429, {'Retry-After': str(int(admission.queue_timeout) or 1)}
+            with deadline_scope(timeout) as deadline:
+                result['texts'] = stats.get_stats(texts, count_only, lookup, lang, spans)
+        if deadline.exceeded:
+            result['partial'] = True
+            result['message'] = 'timed out after %s sec, texts with `timed_out` are not completely tagged' % timeout
+        elif any('failed' in text for text in result['texts']):
+            result['partial'] = True
+            result['message'] = 'texts with `failed` were not tagged by some dictionaries'
         return result
+
+
+@ns_ne.route('/cache', resource_class_kwargs=service_kwargs)
+class CacheStatsResource(ServiceResource):
+    @api.response(200, 'Success')
+    def get(self):
+        """Get hit rate of tagging result cache and dictionary cache, and memory usage of the worker"""
+        return {
+            'error': False,
+            'message': '',
+            'result_cache': self.services.result_cache.stats(),
+            'dictionary_cache': dictionary_cache.stats(),
+            'memory': get_memory_usage()
+        }
+
+
+@ns_ne.route('/admission')
+class AdmissionStatsResource(Resource):
+    @api.response(200, 'Success')
+    def get(self):
+        """Get limits of tagging requests, and requests running, queued, admitted and rejected by the worker"""
+        return {
+            'error': False,
+            'message': '',
+            'admission': admission.stats()
+        }
+
+
+@ns_ne.route('/ner/bulk', resource_class_kwargs=service_kwargs)
+class NamedEntityTaggingBulkResource(ServiceResource):
+    """Named entity tagging of many documents"""
+    @api.doc(params={'count_only': 'Specific string for counting in each text',
+                     'lookup': 'Dictionaries for tagging, if empty, get all',
+                     'lang': 'The dictionary language, default is `english`, if many, separate by comma',
+                     'chunk_size': 'Number of documents tagged at once, default is `500`, at most `MAX_TEXTS`',
+                     'spans': 'If `true`, add matched entities with offsets in `text` as `spans`'},
+             description='Request body is newline-delimited JSON, each line is a text string or an object with '
+                         '`text` and optional `id` field, send `Content-Encoding: gzip` for gzip compressed body. '
+                         'Response is newline-delimited JSON, one result per document in the same order. '
+                         'Each chunk is tagged within `REQUEST_TIMEOUT` seconds, documents which are not completely '
+                         'tagged in time have `timed_out`, documents which some dictionaries failed to tag have '
+                         '`failed`')
+    @api.response(200, 'Success')
+    @api.response(429, 'Too many requests in the worker, retry later')
+    def post(self):
+        """Post newline-delimited JSON documents for named entity recognition, results are streamed back"""
+        count_only = request.args.get('count_only', '')
+        lookup = request.args.get('lookup', '')
+        lookup = [l.strip().lower() for l in lookup.split(',') if l]
+        lang = request.args.get('lang', 'english')
+        chunk_size = request.args.get('chunk_size', '500')
+        if not (chunk_size.isdigit() and int(chunk_size) > 0):
+            return {'error': True, 'message': 'chunk_size must be a positive integer'}
+        chunk_size = min(int(chunk_size), admission.max_texts)
+        spans = request.args.get('spans', '').lower() in ('1', 'true', 'yes')
+        gzipped = request.headers.get('Content-Encoding', '').lower() == 'gzip'
+        lines = iter_lines(request.stream, gzipped)
+
+        def generate():
+            stats = self.services.text_stats
+            for chunk in iter_chunks(enumerate(lines, 1), chunk_size):
+                # (doc, error) of each line, invalid documents are kept in place so results are in the same
+                # order as documents, documents may have any field of their own
+                docs = []
+                texts = []
+                for line_no, line in chunk:
+                    if not line.strip():
+                        continue
+                    try:
+                        doc = json.loads(line)
+                        if not isinstance(doc, dict):
+                            doc = {'text': doc}
+                        doc['text'] = doc['text'].strip().lower()
+                    except (ValueError, KeyError, AttributeError) as ex:
+                        docs.append((None, 'Invalid document at line %s: %s' % (line_no, ex)))
+                    else:
+                        docs.append((doc, None))
+                        texts.append(doc['text'])
+
+                with deadline_scope(admission.request_timeout):
+                    results = iter(stats.get_stats(texts, count_only, lookup, lang, spans) if texts else [])
+                for doc, error in docs:
+                    if error:
+                        yield json.dumps({'error': True, 'message': error}) + '\n'
+                        continue
+                    ret = next(results)
+                    if 'id' in doc:
+                        ret['id'] = doc['id']
+                    yield json.dumps(ret) + '\n'
+
+        if not admission.acquire():
+            return {'error': True, 'message': 'too many requests, retry later'}, 429, \
+                {'Retry-After': str(int(admission.queue_timeout) or 1)}
+        # the slot is held until the last chunk is sent or the client is gone
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        response.call_on_close(admission.release)
+        return response
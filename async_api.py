@@ -0,0 +1,225 @@
+"""Asynchronous serving mode of the `/dictionary/*` and `/stats/ner` APIs with the same responses as `api.py`.
+
+Tagging queries Elasticsearch with a non-blocking client, one multi-search per chunk of texts as
+`DictionaryES.tag_batch`, all chunks awaited concurrently, so a slow query does not stall other requests.
+Dictionary management is run on a thread pool.
+
+Usage: python async_api.py --port 1999 --processes 2
+"""
+import argparse
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from elasticsearch import NotFoundError, TransportError
+from tornado import gen, httpserver, ioloop, netutil, process, web
+from tornado.concurrent import run_on_executor
+
+from dictionary import DictionaryES
+from text_stats import TextAnalyzer
+from util.async_es import AsyncElasticsearch
+from util.database import es_pool_size
+from util.utils import get_logger
+
+
+class AsyncDictionary(object):
+    """Tag texts like `DictionaryES.tag_batch` with non-blocking multi-searches of `chunk_size` texts"""
+    def __init__(self, es, dictionary, chunk_size=100, size=500):
+        self.logger = get_logger(self.__class__.__name__)
+        self.es = es
+        self.dictionary = dictionary
+        self.chunk_size = chunk_size
+        self.size = size
+
+    @gen.coroutine
+    def get_index_list(self, dics, lang):
+        catalog = self.dictionary.catalog
+        if time.time() - catalog.loaded_at >= catalog.ttl:
+            yield self.reload_catalog()
+        if not dics:
+            raise gen.Return(catalog.match(self.dictionary._get_index_list_str(dics, lang)))
+        index_list = [self.dictionary._get_index_name(dic, lang) for dic in dics]
+        if any(idx not in catalog for idx in index_list) and \
+                time.time() - catalog.loaded_at >= catalog.min_reload_interval:
+            yield self.reload_catalog()
+        raise gen.Return([idx for idx in index_list if idx in catalog])
+
+    @gen.coroutine
+    def reload_catalog(self):
+        """Reload the index catalog of the dictionary without blocking the IO loop"""
+        catalog = self.dictionary.catalog
+        try:
+            indices = yield self.es.get_alias(catalog.pattern)
+        except NotFoundError:
+            indices = {}
+        catalog.set_indices(indices.keys())
+
+    @gen.coroutine
+    def _search_hits(self, index_name, n_texts):
+        """Hits of each text with one multi-search"""
+        body = self.dictionary._get_msearch_body(index_name, n_texts, self.size)
+        try:
+            res = yield self.es.msearch(body)
+        except TransportError as ex:
+            self.logger.error('multi search error: %s' % ex)
+            raise gen.Return([[] for _ in n_texts])
+        result = []
+        for response in res['responses']:
+            if 'error' in response:
+                self.logger.error('multi search error: %s' % response['error'])
+            result.append(response.get('hits', {}).get('hits', []))
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def tag(self, texts, dics, lang):
+        index_list = yield self.get_index_list(dics, lang)
+        if not index_list:
+            raise gen.Return([])
+        n_texts = [self.dictionary._normalize(text) for text in texts]
+        # one multi-search per chunk, all in flight together, capped by the client semaphore
+        index_name = ','.join(index_list)
+        chunks = yield [self._search_hits(index_name, n_texts[i:i + self.chunk_size])
+                        for i in range(0, len(n_texts), self.chunk_size)]
+        hits = [text_hits for chunk in chunks for text_hits in chunk]
+        raise gen.Return([self.dictionary._tag_hits(n_text, text_hits, dics, lang)
+                          for n_text, text_hits in zip(n_texts, hits)])
+
+
+class BaseHandler(web.RequestHandler):
+    executor = ThreadPoolExecutor(4)
+
+    def initialize(self, dictionary, async_dictionary, analyzer):
+        self.dictionary = dictionary
+        self.async_dictionary = async_dictionary
+        self.analyzer = analyzer
+
+    def get_list(self, name):
+        values = self.get_argument(name, '')
+        return [v.strip().lower() for v in values.split(',') if v]
+
+    def get_lang(self):
+        return self.get_argument('lang', 'english')
+
+    def error(self, message):
+        self.write({'error': True, 'message': message})
+
+    @run_on_executor
+    def run_blocking(self, func, *args):
+        return func(*args)
+
+
+class DictionaryManageHandler(BaseHandler):
+    @gen.coroutine
+    def put(self):
+        vocs = self.get_list('vocs')
+        if not vocs:
+            self.error('vocs is empty')
+            return
+        dic = self.get_argument('dic', '').strip().lower()
+        if not dic:
+            self.error('dic is empty')
+            return
+        success, fail = yield self.run_blocking(self.dictionary.add_voc, vocs, dic, self.get_lang())
+        self.write({'error': False, 'message': "%s vocabularies was added to dictionary '%s' successfully, %s failed"
+                                               % (success, dic, fail)})
+
+    @gen.coroutine
+    def get(self):
+        prefix = self.get_argument('prefix', '')
+        after = self.get_argument('after', '')
+        size = self.get_argument('size', '')
+        if size and not (size.isdigit() and 0 < int(size) <= 10000):
+            self.error('size must be between 1 and 10000')
+            return
+        if self.get_argument('count_only', '').lower() in ('1', 'true', 'yes'):
+            dics = yield self.run_blocking(self.dictionary.count_voc, self.get_list('dics'), self.get_lang(), prefix)
+        elif size or after or prefix:
+            dics = yield self.run_blocking(self.dictionary.get_voc_page, self.get_list('dics'), self.get_lang(),
+                                           int(size or 1000), after, prefix)
+        else:
+            dics = yield self.run_blocking(self.dictionary.get_voc, self.get_list('dics'), self.get_lang())
+        self.write({'error': False, 'message': '', 'dics': dics})
+
+    @gen.coroutine
+    def delete(self):
+        dics = self.get_list('dics')
+        if not dics:
+            self.error('Dictionaries name is empty')
+            return
+        dics = yield self.run_blocking(self.dictionary.remove_dic, dics, self.get_lang())
+        self.write({'error': False, 'message': '', 'dics': dics})
+
+
+class VocabularyHandler(BaseHandler):
+    @gen.coroutine
+    def delete(self):
+        dic = self.get_argument('dic', '').strip().lower()
+        if not dic:
+            self.error('dic is empty')
+            return
+        vocs = self.get_list('vocs')
+        if not vocs:
+            self.error('vocs is empty')
+            return
+        success, fail = yield self.run_blocking(self.dictionary.remove_voc, dic, vocs, self.get_lang())
+        self.write({'error': False, 'message': '%s was removed successfully, %s failed' % (success, fail)})
+
+
+class NamedEntityTaggingHandler(BaseHandler):
+    @gen.coroutine
+    def post(self):
+        texts = self.get_list('texts')
+        if not texts:
+            self.error('texts is empty')
+            return
+        count_only = self.get_argument('count_only', '')
+        spans = self.get_argument('spans', '').lower() in ('1', 'true', 'yes')
+        result = []
+        for text in texts:
+            stats = self.analyzer.analyze(text, count_only)
+            del stats['tokens']
+            stats['text'] = text
+            result.append(stats)
+
+        tags = yield self.async_dictionary.tag(texts, self.get_list('lookup'), self.get_lang())
+        for idx, tag in enumerate(tags):
+            result[idx]['norm_text'] = tag['norm_text']
+            result[idx]['tag'] = tag['tag']
+            if spans:
+                result[idx]['spans'] = self.dictionary.get_spans(texts[idx], tag)
+        self.write({'error': False, 'message': '', 'texts': result})
+
+
+def make_app(max_in_flight=es_pool_size, dictionary=None, es=None):
+    dictionary = dictionary or DictionaryES()
+    kwargs = {
+        'dictionary': dictionary,
+        'async_dictionary': AsyncDictionary(es or AsyncElasticsearch(max_in_flight=max_in_flight), dictionary),
+        'analyzer': TextAnalyzer()
+    }
+    return web.Application([
+        (r'/dictionary/manage', DictionaryManageHandler, kwargs),
+        (r'/dictionary/vocab/delete', VocabularyHandler, kwargs),
+        (r'/stats/ner', NamedEntityTaggingHandler, kwargs),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=1999)
+    parser.add_argument('--processes', type=int, default=1, help='Number of forked processes, 0 for one per CPU')
+    parser.add_argument('--max-in-flight', type=int, default=es_pool_size,
+                        help='Max concurrent Elasticsearch requests per process')
+    args = parser.parse_args()
+
+    sockets = netutil.bind_sockets(args.port, args.host)
+    if args.processes != 1:
+        process.fork_processes(args.processes)
+    # the app and its clients are created after fork
+    server = httpserver.HTTPServer(make_app(args.max_in_flight))
+    server.add_sockets(sockets)
+    ioloop.IOLoop.current().start()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark startup time, memory per worker and tagging throughput of in-process dictionaries: vocabularies
+as Python objects with an Aho-Corasick automaton against the memory mapped compact file, no Elasticsearch needed
+
+Each worker is a separate process which loads the dictionary and tags the same texts, PSS splits the pages
+shared by workers (the mapped file) between them, so it is the memory one more worker really costs.
+
+Usage: python -m benchmark.bench_compact --vocs 200000 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmark.bench_pattern import make_texts, make_vocs
+from compact_dictionary import CompactDictionary, write_compact
+from matcher import AhoCorasick
+from util.utils import get_memory_usage
+
+
+def run_worker(engine, path, texts, queue, ready, num_workers):
+    before = get_memory_usage()
+    start = time.time()
+    if engine == 'compact':
+        matcher = CompactDictionary(path)
+    else:
+        with open(path) as f:
+            matcher = AhoCorasick(set(line.decode('utf-8').rstrip(u'\n') for line in f))
+    load_time = time.time() - start
+
+    start = time.time()
+    num_spans = sum(len(matcher.find(text)) for text in texts)
+    tag_time = time.time() - start
+    # measure once every worker has touched the dictionary so shared pages are counted by all of them
+    with ready.get_lock():
+        ready.value += 1
+    while ready.value < num_workers:
+        time.sleep(0.01)
+    after = get_memory_usage()
+    queue.put({
+        'load_ms': load_time * 1000,
+        'texts_per_sec': len(texts) / tag_time,
+        'rss_mb': (after['rss'] - before['rss']) / 1048576.0,
+        'pss_mb': (after.get('pss', after['rss']) - before.get('pss', before['rss'])) / 1048576.0,
+        'spans': num_spans
+    })
+
+
+def run(engine, path, texts, num_workers):
+    queue = multiprocessing.Queue()
+    ready = multiprocessing.Value('i', 0)
+    workers = [multiprocessing.Process(target=run_worker, args=(engine, path, texts, queue, ready, num_workers))
+               for _ in range(num_workers)]
+    for w in workers:
+        w.start()
+    results = [queue.get() for _ in workers]
+    for w in workers:
+        w.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vocs', type=int, default=200000)
+    parser.add_argument('--texts', type=int, default=200)
+    parser.add_argument('--words', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    vocs = make_vocs(args.vocs)
+    texts = make_texts(vocs, args.texts, args.words)
+    data_dir = tempfile.mkdtemp()
+    try:
+        text_path = os.path.join(data_dir, 'vocs.txt')
+        with open(text_path, 'w') as f:
+            for voc in vocs:
+                f.write((voc + u'\n').encode('utf-8'))
+        compact_path = os.path.join(data_dir, 'bench-english.ndic')
+        start = time.time()
+        write_compact(compact_path, vocs, 'bench', 'english', 1)
+        print('%s vocabularies, compact file %.1f MB written in %.1f sec' % (
+            len(vocs), os.path.getsize(compact_path) / 1048576.0, time.time() - start))
+
+        for engine, path in (('aho_corasick', text_path), ('compact', compact_path)):
+            results = run(engine, path, texts, args.workers)
+            assert len(set(r['spans'] for r in results)) == 1
+            print('%-12s load %9.1f ms  %8.1f texts/sec  RSS %7.1f MB  PSS %7.1f MB per worker, %s spans' % (
+                engine,
+                sum(r['load_ms'] for r in results) / len(results),
+                sum(r['texts_per_sec'] for r in results) / len(results),
+                sum(r['rss_mb'] for r in results) / len(results),
+                sum(r['pss_mb'] for r in results) / len(results),
+                results[0]['spans']))
+    finally:
+        shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    main()
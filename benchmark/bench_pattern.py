@@ -0,0 +1,102 @@
+"""Microbenchmark of vocabulary verification: one regex per hit (previous `DictionaryES.tag`)
+against one trie-built alternation per dictionary, no Elasticsearch needed
+
+Usage: python -m benchmark.bench_pattern --vocs 10000 --texts 200 --words 200
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from analyzer import AnalyzedMatcher
+from fuzzy import FuzzyMatcher
+from matcher import AhoCorasick, TrieRegex, find_vocs
+
+
+def make_vocs(num_vocs):
+    vocs = set()
+    while len(vocs) < num_vocs:
+        words = [''.join(random.choice(string.ascii_lowercase) for _ in range(random.randint(3, 8)))
+                 for _ in range(random.randint(1, 3))]
+        vocs.add(u' '.join(words))
+    return sorted(vocs)
+
+
+def make_texts(vocs, num_texts, num_words):
+    fillers = [w for voc in random.sample(vocs, 200) for w in voc.split()]
+    texts = []
+    for _ in range(num_texts):
+        words = [random.choice(fillers) for _ in range(num_words)]
+        for voc in random.sample(vocs, 10):
+            words.insert(random.randint(0, len(words)), voc)
+        texts.append(u' '.join(words))
+    return texts
+
+
+def get_candidates(texts, token_index):
+    # vocabularies sharing a token with the text, as Elasticsearch `match` would return
+    result = []
+    for text in texts:
+        candidates = set()
+        for token in set(text.split()):
+            candidates.update(token_index.get(token, ()))
+        result.append(candidates)
+    return result
+
+
+def per_hit(text, candidates):
+    for voc in candidates:
+        pattern = re.compile(r'\b(%s)\b' % voc, re.IGNORECASE)
+        if pattern.search(text):
+            text = pattern.sub('[dic]', text)
+    return text
+
+
+def timeit(name, func, texts, candidates):
+    start = time.time()
+    for text, cands in zip(texts, candidates):
+        func(text, cands)
+    elapsed = time.time() - start
+    print('%-30s %10.3f ms/text' % (name, elapsed * 1000 / len(texts)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vocs', type=int, default=10000, help='Number of vocabularies in the dictionary')
+    parser.add_argument('--texts', type=int, default=200)
+    parser.add_argument('--words', type=int, default=200, help='Number of words per text')
+    args = parser.parse_args()
+
+    random.seed(0)
+    vocs = make_vocs(args.vocs)
+    texts = make_texts(vocs, args.texts, args.words)
+    token_index = {}
+    for voc in vocs:
+        for token in voc.split():
+            token_index.setdefault(token, set()).add(voc)
+    candidates = get_candidates(texts, token_index)
+    print('%s vocabularies, %s texts of %s words, %.1f candidates/text' % (
+        len(vocs), len(texts), args.words, float(sum(len(c) for c in candidates)) / len(candidates)))
+
+    start = time.time()
+    trie_regex = TrieRegex(vocs)
+    print('%-30s %10.3f ms' % ('build trie regex', (time.time() - start) * 1000))
+    start = time.time()
+    aho_corasick = AhoCorasick(vocs)
+    print('%-30s %10.3f ms' % ('build aho-corasick', (time.time() - start) * 1000))
+    start = time.time()
+    fuzzy = FuzzyMatcher(vocs, max_distance=1)
+    print('%-30s %10.3f ms' % ('build fuzzy (1 edit)', (time.time() - start) * 1000))
+
+    timeit('per-hit re.compile', per_hit, texts, candidates)
+    timeit('trie regex of candidates', lambda text, cands: TrieRegex(cands).find(text), texts, candidates)
+    timeit('find_vocs of candidates', find_vocs, texts, candidates)
+    timeit('analyzed of candidates', lambda text, cands: AnalyzedMatcher(cands).find_all(text), texts, candidates)
+    timeit('trie regex of dictionary', lambda text, cands: trie_regex.find(text), texts, candidates)
+    timeit('aho-corasick of dictionary', lambda text, cands: aho_corasick.find(text), texts, candidates)
+    timeit('fuzzy of dictionary', lambda text, cands: fuzzy.find(text), texts, candidates)
+
+
+if __name__ == '__main__':
+    main()
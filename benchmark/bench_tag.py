@@ -0,0 +1,78 @@
+"""Compare `DictionaryES.tag` (one scroll per text) with `DictionaryES.tag_batch` (multi-search)
+
+Usage: python -m benchmark.bench_tag --dics city,color --lang english --texts 500 --repeat 20
+"""
+import argparse
+import random
+import time
+
+from dictionary import DictionaryES
+
+
+class RoundTripCounter(object):
+    """Count HTTP round-trips made by an Elasticsearch client"""
+    def __init__(self, es):
+        self.count = 0
+        self._perform_request = es.transport.perform_request
+        es.transport.perform_request = self
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+        return self._perform_request(*args, **kwargs)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    idx = int(round(p / 100.0 * (len(values) - 1)))
+    return values[idx]
+
+
+def make_texts(vocs, num_texts, num_words=20):
+    fillers = ['hotel', 'in', 'the', 'a', 'beautiful', 'sky', 'cheap', 'flight', 'to', 'from', 'near', 'best']
+    texts = []
+    for _ in range(num_texts):
+        words = [random.choice(fillers) for _ in range(num_words)]
+        for voc in random.sample(vocs, min(3, len(vocs))):
+            words.insert(random.randint(0, len(words)), voc)
+        texts.append(' '.join(words))
+    return texts
+
+
+def run(name, func, counter, repeat):
+    latencies = []
+    counter.count = 0
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        latencies.append((time.time() - start) * 1000)
+    print('%-10s round-trips/request: %8.1f  p50: %8.2f ms  p99: %8.2f ms' % (
+        name, float(counter.count) / repeat, percentile(latencies, 50), percentile(latencies, 99)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dics', default='', help='Dictionaries for tagging, separate by comma, if empty, get all')
+    parser.add_argument('--lang', default='english')
+    parser.add_argument('--texts', type=int, default=500, help='Number of texts per request')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of requests')
+    parser.add_argument('--chunk-size', type=int, default=100)
+    parser.add_argument('--size', type=int, default=500)
+    args = parser.parse_args()
+
+    dics = [d.strip().lower() for d in args.dics.split(',') if d]
+    d = DictionaryES()
+    vocs = [voc for dic in d.get_voc(dics, args.lang) for voc in dic['vocs']]
+    if not vocs:
+        parser.error('no vocabularies found for dics %s, lang %s' % (dics, args.lang))
+    texts = make_texts(vocs, args.texts)
+    counter = RoundTripCounter(d.es)
+
+    print('%s texts/request, %s requests, %s vocabularies' % (len(texts), args.repeat, len(vocs)))
+    run('tag', lambda: d.tag(texts, dics, args.lang), counter, args.repeat)
+    run('tag_batch', lambda: d.tag_batch(texts, dics, args.lang, args.chunk_size, args.size), counter, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
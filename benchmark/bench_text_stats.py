@@ -0,0 +1,62 @@
+"""Benchmark basic text stats: previous NLTK tokenization with two url scans against `TextAnalyzer`
+
+Usage: python -m benchmark.bench_text_stats --texts 200 --words 10000
+"""
+import argparse
+import random
+import re
+import time
+
+from text_stats import TextAnalyzer, get_type
+from tokenizer import GeneralTokenizer
+
+previous_url_pattern = re.compile(
+    r'(?:http[s]?://|www)(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+
+WORDS = ['hotel', 'in', 'chicago', 'a', 'beautiful', 'blue', 'sky', 'new', 'york', 'weiss', 'cheap', 'flight', 'to',
+         'from', 'the', 'best', 'price', 'review', 'with', 'and']
+# one in ten words has punctuation or is an url
+PUNCT_WORDS = ['(blau)', 'c++', 'u.s.', '$100.00', '!!!', 'york,', 'www.abc.com', 'http://abc.com/x?y=1']
+
+
+def random_word():
+    return random.choice(PUNCT_WORDS) if random.random() < 0.1 else random.choice(WORDS)
+
+
+def previous_stats(tokenizer, text, count_only):
+    return {
+        'num_word': len(tokenizer.tokenize(previous_url_pattern.sub('[url]', text))),
+        'num_char': len(text),
+        'num_count_only': text.lower().count(count_only.lower()) if count_only else 0,
+        'type': get_type(text, previous_url_pattern.findall(text))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--texts', type=int, default=200)
+    parser.add_argument('--words', type=int, default=10000, help='Number of words per text')
+    args = parser.parse_args()
+
+    random.seed(0)
+    texts = [u' '.join(random_word() for _ in range(args.words)) for _ in range(args.texts)]
+    tokenizer = GeneralTokenizer()
+    analyzer = TextAnalyzer()
+
+    start = time.time()
+    for text in texts:
+        previous_stats(tokenizer, text, 'blue')
+    previous = time.time() - start
+
+    start = time.time()
+    for text in texts:
+        analyzer.analyze(text, 'blue')
+    current = time.time() - start
+
+    print('%s texts of %s words' % (args.texts, args.words))
+    print('%-15s %10.3f ms/text' % ('previous', previous * 1000 / len(texts)))
+    print('%-15s %10.3f ms/text  (%.1fx)' % ('TextAnalyzer', current * 1000 / len(texts), previous / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,473 @@
+"""In-process Elasticsearch stand-in for benchmarks and tests, no server or socket is needed
+
+`FakeConnection` replaces the HTTP connection of a real `Elasticsearch` client, so requests still go through the
+client, its serializer and the `scan` and `bulk` helpers. `FakeServer` keeps indices in memory and implements the
+APIs used by this project on Elasticsearch 2.x: index management and `_alias`, `_bulk`, document index and
+`_mget`, `_search` with scan/scroll, `_msearch`, `_analyze`, `_cat/indices`, and the `match`, `match_all`, `term`,
+`terms`, `ids`, `prefix`, `range`, `bool` and `filtered` queries. Text fields are analyzed with `analyzer.LanguageAnalyzer`.
+
+`make_http_app` serves a `FakeServer` over HTTP on a tornado IO loop for non-blocking clients.
+
+Writes are visible immediately, as if every request refreshed. `latency` adds a delay to every request to
+simulate network round-trips, `fail` makes the next requests of an API fail.
+
+    server = FakeServer()
+    es = make_client(server)
+    dictionary = DictionaryES(es)
+"""
+import fnmatch
+import itertools
+import json
+import time
+from urlparse import parse_qs
+
+from elasticsearch import Elasticsearch
+from elasticsearch.connection import Connection
+
+from analyzer import get_analyzer
+from util.database import instrument_connection
+
+
+class FakeIndex(object):
+    def __init__(self, name, analyzers=None):
+        self.name = name
+        # field -> language of the analyzer, `standard` is not stemmed
+        self.analyzers = analyzers or {}
+        # id -> (type, source, version), in insertion order of new ids
+        self.docs = {}
+        self.order = []
+        # (field, term) -> set of ids
+        self.postings = {}
+
+    def _terms(self, field, value):
+        if field not in self.analyzers:
+            return [value] if isinstance(value, basestring) else [json.dumps(value)]
+        analyzer = get_analyzer(self.analyzers[field])
+        return [t[2] for t in analyzer.tokenize(value.lower()) if t[3]]
+
+    def put(self, doc_type, doc_id, source):
+        if doc_id in self.docs:
+            # keep the position of the updated document
+            version = self.delete(doc_id) + 1
+        else:
+            version = 1
+            self.order.append(doc_id)
+        self.docs[doc_id] = (doc_type, source, version)
+        for field, value in source.items():
+            if isinstance(value, basestring):
+                for term in self._terms(field, value):
+                    self.postings.setdefault((field, term), set()).add(doc_id)
+        return version
+
+    def delete(self, doc_id):
+        if doc_id not in self.docs:
+            return None
+        doc_type, source, version = self.docs.pop(doc_id)
+        for field, value in source.items():
+            if isinstance(value, basestring):
+                for term in self._terms(field, value):
+                    self.postings.get((field, term), set()).discard(doc_id)
+        return version
+
+    def ids(self):
+        # insertion order, deleted ids are dropped lazily
+        if len(self.order) > len(self.docs):
+            self.order = [doc_id for doc_id in self.order if doc_id in self.docs]
+        return self.order
+
+    def hit(self, doc_id, score=1.0, source=True):
+        doc_type, doc, version = self.docs[doc_id]
+        hit = {'_index': self.name, '_type': doc_type, '_id': doc_id, '_score': score}
+        if source:
+            hit['_source'] = doc
+        return hit
+
+    def search(self, query):
+        """(id, score) of documents matching a query"""
+        if not query or 'match_all' in query:
+            return [(doc_id, 1.0) for doc_id in self.ids()]
+        if 'match' in query:
+            field, value = query['match'].items()[0]
+            if isinstance(value, dict):
+                value = value['query']
+            scores = {}
+            for term in self._terms(field, value):
+                for doc_id in self.postings.get((field, term), ()):
+                    scores[doc_id] = scores.get(doc_id, 0) + 1.0
+            return sorted(scores.items(), key=lambda item: -item[1])
+        if 'filtered' in query:
+            filtered = query['filtered']
+            matched = self.search(filtered.get('query'))
+            if 'filter' in filtered:
+                allowed = set(doc_id for doc_id, _ in self.search(filtered['filter']))
+                matched = [m for m in matched if m[0] in allowed]
+            return matched
+        if 'bool' in query:
+            clauses = query['bool']
+            matched = None
+            for clause in self._as_list(clauses.get('must')) + self._as_list(clauses.get('filter')):
+                ids = set(doc_id for doc_id, _ in self.search(clause))
+                matched = ids if matched is None else matched & ids
+            for clause in self._as_list(clauses.get('must_not')):
+                matched = (set(self.docs) if matched is None else matched) - \
+                    set(doc_id for doc_id, _ in self.search(clause))
+            if clauses.get('should'):
+                should = set(doc_id for clause in self._as_list(clauses['should'])
+                             for doc_id, _ in self.search(clause))
+                matched = should if matched is None else matched & should
+            matched = set(self.docs) if matched is None else matched
+            return [(doc_id, 1.0) for doc_id in self.ids() if doc_id in matched]
+        if 'ids' in query:
+            return [(doc_id, 1.0) for doc_id in query['ids']['values'] if doc_id in self.docs]
+        if 'terms' in query or 'term' in query:
+            field, values = (query.get('terms') or query['term']).items()[0]
+            values = set(values if isinstance(values, list) else [values])
+            if field == '_id':
+                return [(doc_id, 1.0) for doc_id in values if doc_id in self.docs]
+            return [(doc_id, 1.0) for doc_id in self.ids() if self._value(doc_id, field) in values]
+        if 'prefix' in query:
+            field, prefix = query['prefix'].items()[0]
+            if isinstance(prefix, dict):
+                prefix = prefix.get('value', prefix.get('prefix'))
+            return [(doc_id, 1.0) for doc_id in self.ids()
+                    if (self._value(doc_id, field) or '').startswith(prefix)]
+        if 'range' in query:
+            field, bounds = query['range'].items()[0]
+            ops = {'gt': lambda v, b: v > b, 'gte': lambda v, b: v >= b, 'lt': lambda v, b: v < b,
+                   'lte': lambda v, b: v <= b}
+            return [(doc_id, 1.0) for doc_id in self.ids()
+                    if all(ops[op](self._value(doc_id, field), bound) for op, bound in bounds.items() if op in ops)]
+        raise FakeError(400, 'query_parsing_exception', 'Unsupported query: %s' % query.keys())
+
+    @staticmethod
+    def _as_list(value):
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+    def _value(self, doc_id, field):
+        doc_type, source, _ = self.docs[doc_id]
+        if field == '_id':
+            return doc_id
+        if field == '_uid':
+            return '%s#%s' % (doc_type, doc_id)
+        return source.get(field)
+
+
+def sort_matched(matched, sort):
+    """Sort (index, id, score) by a search `sort` clause"""
+    for spec in reversed(FakeIndex._as_list(sort)):
+        if isinstance(spec, dict):
+            field, order = spec.items()[0]
+            order = order.get('order', 'asc') if isinstance(order, dict) else order
+        else:
+            field, order = spec, 'desc' if spec == '_score' else 'asc'
+        if field == '_score':
+            matched = sorted(matched, key=lambda m: m[2], reverse=order == 'desc')
+        elif field != '_doc':
+            matched = sorted(matched, key=lambda m: m[0]._value(m[1], field), reverse=order == 'desc')
+    return matched
+
+
+class FakeError(Exception):
+    def __init__(self, status, error_type, reason=''):
+        super(FakeError, self).__init__(reason or error_type)
+        self.status = status
+        self.error_type = error_type
+        self.reason = reason
+
+
+class FakeServer(object):
+    """Indices and scroll contexts shared by every client connected to the fake server"""
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.indices = {}
+        self.scrolls = {}
+        self.requests = 0
+        # API, e.g. `_msearch`, -> statuses of its next requests
+        self.failures = {}
+        self._scroll_ids = itertools.count(1)
+
+    # management helpers, not part of the HTTP API
+    def load(self, index_name, doc_type, docs, analyzers=None):
+        """Index (id, source) pairs directly, e.g. to set up large dictionaries quickly"""
+        index = self.indices.get(index_name) or self.indices.setdefault(index_name, FakeIndex(index_name, analyzers))
+        for doc_id, source in docs:
+            index.put(doc_type, doc_id, source)
+        return index
+
+    def reset(self):
+        self.indices.clear()
+        self.scrolls.clear()
+        self.failures.clear()
+
+    def fail(self, api, status=503, times=1):
+        """Answer the next `times` requests of `api`, e.g. `_msearch` or `_search`, with an error `status`"""
+        self.failures.setdefault(api, []).extend([status] * times)
+
+    def handle(self, method, path, params, body):
+        """Return (status, response) of a request"""
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        parts = [p for p in path.split('/') if p]
+        failures = self.failures.get(parts[-1] if parts else '')
+        if failures:
+            status = failures.pop(0)
+            return status, {'error': {'type': 'unavailable', 'reason': 'injected failure'}, 'status': status}
+        try:
+            return self._route(method, parts, params, body)
+        except FakeError as ex:
+            return ex.status, {'error': {'type': ex.error_type, 'reason': ex.reason or ex.error_type},
+                               'status': ex.status}
+
+    def _route(self, method, parts, params, body):
+        if not parts:
+            return 200, {'version': {'number': '2.4.1'}, 'tagline': 'You Know, for Search'}
+        if parts[-1] == '_bulk':
+            return 200, self._bulk(body, parts[0] if len(parts) > 1 else None)
+        if parts[-1] == '_msearch':
+            return 200, self._msearch(body, parts[0] if len(parts) > 1 else None)
+        if parts[0] == '_analyze':
+            return 200, self._analyze(self._json(body), params)
+        if parts[:2] == ['_search', 'scroll']:
+            if method == 'DELETE':
+                return 200, self._clear_scroll(body)
+            return self._scroll(body, params)
+        if parts[-1] == '_search':
+            return 200, self._search(parts[0] if len(parts) > 1 else '_all', self._json(body), params)
+        if parts[-1] == '_mget':
+            return 200, self._mget(parts[0], self._json(body), params)
+        if parts[-1] == '_alias' or parts[-1] == '_aliases':
+            return 200, self._get_alias(parts[0] if len(parts) > 1 else '*')
+        if parts[:2] == ['_cat', 'indices']:
+            return 200, self._cat_indices(parts[2] if len(parts) > 2 else '_all', params)
+        if parts[-1] == '_refresh':
+            return 200, {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+        if len(parts) == 1:
+            return self._index_api(method, parts[0], self._json(body))
+        if len(parts) in (2, 3) and method in ('PUT', 'POST'):
+            return self._put_doc(parts[0], parts[1], parts[2] if len(parts) == 3 else None, self._json(body))
+        raise FakeError(400, 'illegal_argument_exception', 'Unsupported request %s /%s' % (method, '/'.join(parts)))
+
+    @staticmethod
+    def _json(body):
+        if not body:
+            return {}
+        return json.loads(body) if isinstance(body, basestring) else body
+
+    @staticmethod
+    def _lines(body):
+        if not isinstance(body, basestring):
+            body = '\n'.join(json.dumps(line) for line in body)
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+    def _resolve(self, expression, ignore_unavailable=False):
+        names = []
+        for name in (expression or '_all').split(','):
+            if name in ('_all', '*'):
+                names.extend(sorted(self.indices))
+            elif '*' in name:
+                names.extend(sorted(n for n in self.indices if fnmatch.fnmatch(n, name)))
+            elif name in self.indices:
+                names.append(name)
+            elif not ignore_unavailable:
+                raise FakeError(404, 'index_not_found_exception', 'no such index [%s]' % name)
+        return names
+
+    def _index_api(self, method, name, body):
+        if method == 'HEAD':
+            return (200 if name in self.indices else 404), None
+        if method == 'PUT':
+            if name in self.indices:
+                raise FakeError(400, 'index_already_exists_exception', 'already exists [%s]' % name)
+            analyzers = {}
+            for mapping in body.get('mappings', {}).values():
+                for field, prop in mapping.get('properties', {}).items():
+                    if prop.get('type') == 'string' and prop.get('index') != 'not_analyzed':
+                        analyzers[field] = prop.get('analyzer', 'standard')
+            self.indices[name] = FakeIndex(name, analyzers)
+            return 200, {'acknowledged': True}
+        if method == 'DELETE':
+            for index_name in self._resolve(name):
+                del self.indices[index_name]
+            return 200, {'acknowledged': True}
+        raise FakeError(400, 'illegal_argument_exception', 'Unsupported request %s /%s' % (method, name))
+
+    def _get_alias(self, expression):
+        return dict((name, {'aliases': {}}) for name in self._resolve(expression))
+
+    def _put_doc(self, index_name, doc_type, doc_id, source):
+        index = self.indices.get(index_name) or self.indices.setdefault(index_name, FakeIndex(index_name))
+        doc_id = doc_id or str(len(index.docs) + 1)
+        version = index.put(doc_type, doc_id, source)
+        return (201 if version == 1 else 200), {'_index': index_name, '_type': doc_type, '_id': doc_id,
+                                                '_version': version, 'created': version == 1}
+
+    def _mget(self, index_name, body, params):
+        if index_name not in self.indices:
+            raise FakeError(404, 'index_not_found_exception', 'no such index [%s]' % index_name)
+        index = self.indices[index_name]
+        source = params.get('_source', 'true') != 'false'
+        docs = []
+        for doc_id in body.get('ids', []):
+            if doc_id in index.docs:
+                doc = index.hit(doc_id, source=source)
+                del doc['_score']
+                doc.update({'found': True, '_version': index.docs[doc_id][2]})
+            else:
+                doc = {'_index': index_name, '_id': doc_id, 'found': False}
+            docs.append(doc)
+        return {'docs': docs}
+
+    def _bulk(self, body, default_index):
+        items = []
+        errors = False
+        lines = self._lines(body)
+        idx = 0
+        while idx < len(lines):
+            op, meta = lines[idx].items()[0]
+            idx += 1
+            index_name = meta.get('_index', default_index)
+            if op in ('index', 'create'):
+                source = lines[idx]
+                idx += 1
+                status, res = self._put_doc(index_name, meta.get('_type'), meta.get('_id'), source)
+                res['status'] = status
+            elif op == 'delete':
+                index = self.indices.get(index_name)
+                version = index.delete(meta['_id']) if index else None
+                res = {'_index': index_name, '_type': meta.get('_type'), '_id': meta['_id'],
+                       'found': version is not None, 'status': 200 if version is not None else 404}
+            else:
+                raise FakeError(400, 'illegal_argument_exception', 'Unsupported bulk action %s' % op)
+            errors = errors or not 200 <= res['status'] < 300
+            items.append({op: res})
+        return {'took': 1, 'errors': errors, 'items': items}
+
+    def _search(self, expression, body, params):
+        names = self._resolve(expression, params.get('ignore_unavailable') == 'true')
+        matched = []
+        for name in names:
+            index = self.indices[name]
+            matched.extend((index, doc_id, score) for doc_id, score in index.search(body.get('query')))
+        if 'sort' in body:
+            matched = sort_matched(matched, body['sort'])
+        else:
+            matched.sort(key=lambda m: -m[2])
+        source = body.get('_source', params.get('_source', True)) not in (False, 'false')
+        size = int(params.get('size', body.get('size', 10)))
+        start = int(params.get('from', body.get('from', 0)))
+        hits = [idx.hit(doc_id, score, source) for idx, doc_id, score in matched]
+        shards = {'total': len(names), 'successful': len(names), 'failed': 0}
+        if 'scroll' in params:
+            scroll_id = str(next(self._scroll_ids))
+            scan = params.get('search_type') == 'scan'
+            # a scan returns no hits at first, then `size` hits per shard
+            self.scrolls[scroll_id] = (hits if scan else hits[size:], size * max(len(names), 1) if scan else size)
+            first = [] if scan else hits[:size]
+            return {'_scroll_id': scroll_id, 'took': 1, 'timed_out': False, '_shards': shards,
+                    'hits': {'total': len(hits), 'max_score': 1.0, 'hits': first}}
+        return {'took': 1, 'timed_out': False, '_shards': shards,
+                'hits': {'total': len(hits), 'max_score': 1.0, 'hits': hits[start:start + size]}}
+
+    def _cat_indices(self, expression, params):
+        # plain text table, only the `index` and `docs.count` columns
+        columns = params.get('h', 'index,docs.count').split(',')
+        lines = []
+        for name in self._resolve(expression):
+            values = {'index': name, 'docs.count': len(self.indices[name].docs)}
+            lines.append(' '.join(str(values.get(column, '')) for column in columns))
+        return '\n'.join(lines) + '\n'
+
+    def _scroll(self, body, params):
+        scroll_id = body if isinstance(body, basestring) and not body.startswith('{') else \
+            self._json(body).get('scroll_id')
+        if scroll_id not in self.scrolls:
+            raise FakeError(404, 'search_context_missing_exception', 'No search context found for id [%s]'
+                            % scroll_id)
+        hits, size = self.scrolls[scroll_id]
+        self.scrolls[scroll_id] = (hits[size:], size)
+        return 200, {'_scroll_id': scroll_id, 'took': 1, 'timed_out': False,
+                     '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+                     'hits': {'total': len(hits), 'max_score': 1.0, 'hits': hits[:size]}}
+
+    def _clear_scroll(self, body):
+        body = self._json(body)
+        for scroll_id in body.get('scroll_id', []):
+            self.scrolls.pop(scroll_id, None)
+        return {'succeeded': True}
+
+    def _msearch(self, body, default_index):
+        lines = self._lines(body)
+        responses = []
+        for header, query in zip(lines[::2], lines[1::2]):
+            params = {}
+            if header.get('ignore_unavailable'):
+                params['ignore_unavailable'] = 'true'
+            try:
+                responses.append(self._search(header.get('index', default_index), query, params))
+            except FakeError as ex:
+                responses.append({'error': {'type': ex.error_type, 'reason': ex.reason}, 'status': ex.status})
+        return {'responses': responses}
+
+    def _analyze(self, body, params):
+        lang = body.get('analyzer', params.get('analyzer', 'standard'))
+        text = body.get('text', params.get('text', ''))
+        tokens = [t for t in get_analyzer(lang).tokenize(text.lower()) if t[3]]
+        return {'tokens': [{'token': term, 'start_offset': start, 'end_offset': end, 'type': '<ALPHANUM>',
+                            'position': pos} for pos, (start, end, term, _) in enumerate(tokens)]}
+
+
+class FakeConnection(Connection):
+    """Connection of an `Elasticsearch` client to a `FakeServer`"""
+    def __init__(self, server=None, **kwargs):
+        super(FakeConnection, self).__init__(**kwargs)
+        self.server = server
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=()):
+        path, _, query = url.partition('?')
+        merged = dict((k, v[-1]) for k, v in parse_qs(query).items())
+        for key, value in (params or {}).items():
+            merged[key] = str(value).lower() if isinstance(value, bool) else str(value)
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        start = time.time()
+        status, response = self.server.handle(method, path, merged, body)
+        content_type = 'application/json'
+        if isinstance(response, basestring):
+            raw_data, content_type = response, 'text/plain'
+        else:
+            raw_data = json.dumps(response) if response is not None else ''
+        if not (200 <= status < 300) and status not in ignore:
+            self.log_request_fail(method, url, body, time.time() - start, status, raw_data)
+            self._raise_error(status, raw_data)
+        return status, {'content-type': content_type}, raw_data
+
+
+def make_client(server, **kwargs):
+    """Elasticsearch client connected to a fake server, round-trips are instrumented as with a real server"""
+    return Elasticsearch([{'host': 'fake'}], connection_class=instrument_connection(FakeConnection), server=server,
+                         **kwargs)
+
+
+def make_http_app(server):
+    """tornado application serving a fake server over HTTP, for non-blocking clients such as `AsyncElasticsearch`"""
+    from tornado import web
+
+    class FakeHandler(web.RequestHandler):
+        def handle(self, path):
+            params = dict((k, v[-1]) for k, v in parse_qs(self.request.query).items())
+            body = self.request.body.decode('utf-8') if self.request.body else None
+            status, response = server.handle(self.request.method, '/' + path, params, body)
+            self.set_status(status)
+            if isinstance(response, basestring):
+                self.set_header('Content-Type', 'text/plain')
+                self.write(response)
+            elif response is not None:
+                self.set_header('Content-Type', 'application/json')
+                self.write(json.dumps(response))
+
+        get = post = put = delete = head = handle
+
+    return web.Application([(r'/(.*)', FakeHandler)])
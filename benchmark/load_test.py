@@ -0,0 +1,65 @@
+"""Load test `/stats/ner` and report latency and Elasticsearch connection churn
+
+The number of HTTP connections opened on the Elasticsearch nodes is read from `_nodes/stats/http` before and after
+the run, with one pooled client per worker it stays flat instead of growing with the number of requests.
+
+Usage: python -m benchmark.load_test --api http://localhost:1999 --es http://localhost:9200 --requests 1000 --concurrency 8
+"""
+import argparse
+import json
+import threading
+import time
+import urllib
+import urllib2
+
+from benchmark.bench_tag import percentile
+
+
+def get_opened_connections(es_url):
+    stats = json.load(urllib2.urlopen(es_url.rstrip('/') + '/_nodes/stats/http'))
+    return sum(node['http']['total_opened'] for node in stats['nodes'].values())
+
+
+def worker(url, body, num_requests, latencies, errors):
+    for _ in range(num_requests):
+        start = time.time()
+        try:
+            urllib2.urlopen(url, body).read()
+            latencies.append((time.time() - start) * 1000)
+        except urllib2.URLError:
+            errors.append(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--api', default='http://localhost:1999')
+    parser.add_argument('--es', default='http://localhost:9200')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--texts', default='hotel in chicago,a beautiful blue sky,blue sky in beijing')
+    parser.add_argument('--lookup', default='')
+    parser.add_argument('--lang', default='english')
+    args = parser.parse_args()
+
+    url = args.api.rstrip('/') + '/stats/ner'
+    body = urllib.urlencode({'texts': args.texts, 'lookup': args.lookup, 'lang': args.lang})
+    latencies, errors = [], []
+    opened_before = get_opened_connections(args.es)
+    start = time.time()
+    threads = [threading.Thread(target=worker, args=(url, body, args.requests // args.concurrency, latencies, errors))
+               for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+    opened = get_opened_connections(args.es) - opened_before
+
+    print('%s requests, %s errors in %.1f sec, %.1f requests/sec' % (
+        len(latencies), len(errors), elapsed, len(latencies) / elapsed))
+    print('p50: %.2f ms  p99: %.2f ms' % (percentile(latencies, 50), percentile(latencies, 99)))
+    print('Elasticsearch connections opened: %s (%.3f per request)' % (opened, float(opened) / max(len(latencies), 1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Reproducible benchmark suite of tagging, dictionary management, text stats and tokenization, run against an
+in-process fake Elasticsearch (see `benchmark.fake_es`) on synthetic dictionaries and texts
+
+Each case runs for at least `--min-time` seconds and reports throughput and latency percentiles. Results could be
+saved as a JSON baseline, a run compared with a baseline fails (exit code 1) when the median latency of a case is
+more than `--threshold` above the baseline.
+
+Usage:
+    python -m benchmark.suite --profile quick --save baseline.json
+    python -m benchmark.suite --profile quick --compare baseline.json --threshold 0.25
+    python -m benchmark.suite --profile full --filter tag --latency 1
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import re
+import sys
+import time
+
+from benchmark.bench_tag import percentile
+from benchmark.fake_es import FakeServer, make_client
+from dictionary import DictionaryES
+from text_stats import TextStats
+from tokenizer import FastTokenizer, GeneralTokenizer
+
+PROFILES = {
+    'quick': {'dictionary_sizes': [1000], 'text_words': [10, 100, 1000]},
+    'full': {'dictionary_sizes': [1000, 100000, 1000000], 'text_words': [10, 100, 1000, 10000]}
+}
+LANG = 'english'
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'shi', 'po', 'an', 'el', 'or', 'qu', 'ix', 'ber', 'don', 'ville']
+PUNCTUATION = ['(', ')', ',', '.', '!', '?', '-', 'c++', 'u.s.', 'www.abc.com']
+
+
+class Corpus(object):
+    """Synthetic words, vocabularies and texts, the same for a given seed"""
+    def __init__(self, seed=0, num_words=20000):
+        self.random = random.Random(seed)
+        words = set()
+        while len(words) < num_words:
+            words.add(''.join(self.random.choice(SYLLABLES) for _ in range(self.random.randint(2, 4))))
+        self.words = sorted(words)
+
+    def make_vocs(self, num_vocs):
+        vocs = set()
+        while len(vocs) < num_vocs:
+            vocs.add(' '.join(self.random.choice(self.words) for _ in range(self.random.randint(1, 3))))
+        return sorted(vocs)
+
+    def make_texts(self, vocs, num_texts, num_words):
+        texts = []
+        for _ in range(num_texts):
+            words = []
+            while len(words) < num_words:
+                rnd = self.random.random()
+                if rnd < 0.05:
+                    words.extend(self.random.choice(vocs).split())
+                elif rnd < 0.1:
+                    words.append(self.random.choice(PUNCTUATION))
+                else:
+                    words.append(self.random.choice(self.words))
+            texts.append(' '.join(words[:num_words]))
+        return texts
+
+
+class Case(object):
+    def __init__(self, name, func, items=1, unit='op'):
+        self.name = name
+        self.func = func
+        self.items = items
+        self.unit = unit
+
+    def run(self, min_time, min_runs=3, max_runs=1000):
+        self.func()
+        latencies = []
+        start = time.time()
+        while len(latencies) < max_runs and (len(latencies) < min_runs or time.time() - start < min_time):
+            begin = time.time()
+            self.func()
+            latencies.append((time.time() - begin) * 1000)
+        mean = sum(latencies) / len(latencies)
+        return {
+            'runs': len(latencies),
+            'p50_ms': percentile(latencies, 50),
+            'p90_ms': percentile(latencies, 90),
+            'p99_ms': percentile(latencies, 99),
+            'ops_per_sec': 1000 / mean if mean else 0.0,
+            'items_per_sec': self.items * 1000 / mean if mean else 0.0,
+            'unit': self.unit
+        }
+
+
+def make_cases(profile, num_texts, latency, seed):
+    corpus = Corpus(seed)
+    server = FakeServer()
+    dictionary = DictionaryES(make_client(server))
+    fanout = DictionaryES(make_client(server), fanout_threads=4)
+    general, fast = GeneralTokenizer(), FastTokenizer()
+    stats = TextStats(dictionary=dictionary, tokenizer=fast)
+    cases = []
+
+    sample_vocs = corpus.make_vocs(1000)
+    for words in profile['text_words']:
+        texts = corpus.make_texts(sample_vocs, num_texts, words)
+        cases.append(Case('tokenize/general/%sw' % words, lambda t=texts: [general.tokenize(x) for x in t],
+                          len(texts), 'text'))
+        cases.append(Case('tokenize/fast/%sw' % words, lambda t=texts: [fast.tokenize(x) for x in t],
+                          len(texts), 'text'))
+        cases.append(Case('analyze_batch/%sw' % words, lambda t=texts: stats.analyzer.analyze_batch(t, 'ka'),
+                          len(texts), 'text'))
+
+    for size in profile['dictionary_sizes']:
+        dic = 'bench%s' % size
+        vocs = corpus.make_vocs(size)
+        server.load(dictionary._get_index_name(dic, LANG), dictionary.doc_type,
+                    ((voc, {'voc': voc}) for voc in vocs), analyzers={'voc': LANG})
+        for words in profile['text_words']:
+            texts = corpus.make_texts(vocs, num_texts, words)
+            cases.append(Case('tag/%s/%sw' % (size, words), lambda t=texts, d=dic: dictionary.tag(t, [d], LANG),
+                              len(texts), 'text'))
+            cases.append(Case('tag_batch/%s/%sw' % (size, words),
+                              lambda t=texts, d=dic: dictionary.tag_batch(t, [d], LANG), len(texts), 'text'))
+            cases.append(Case('tag_fanout/%s/%sw' % (size, words),
+                              lambda t=texts, d=dic: fanout.tag_langs(t, [d], [LANG]), len(texts), 'text'))
+            cases.append(Case('get_stats/%s/%sw' % (size, words),
+                              lambda t=texts, d=dic: stats.get_stats(t, '', [d], LANG), len(texts), 'text'))
+
+        counter = iter(xrange(sys.maxint))
+
+        def add_voc(d=dic):
+            batch = next(counter)
+            dictionary.add_voc(['added %s %s' % (batch, i) for i in range(100)], d, LANG)
+
+        cases.append(Case('add_voc/%s' % size, add_voc, 100, 'voc'))
+        cases.append(Case('get_voc/%s' % size, lambda d=dic: dictionary.get_voc([d], LANG), size, 'voc'))
+
+    # latency only applies to measured requests, dictionaries are loaded without requests
+    server.latency = latency / 1000.0
+    return cases, server
+
+
+def compare(results, baseline, threshold):
+    """Print the change of median latencies, return names of cases slower than the baseline by more than threshold"""
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline['cases'].get(name)
+        if not base:
+            continue
+        change = result['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print('%-28s %10.3f ms -> %10.3f ms  %+7.1f%%%s' % (
+            name, base['p50_ms'], result['p50_ms'], change * 100, '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', default='quick', choices=sorted(PROFILES))
+    parser.add_argument('--sizes', default='', help='Dictionary sizes, separate by comma, override the profile')
+    parser.add_argument('--words', default='', help='Words per text, separate by comma, override the profile')
+    parser.add_argument('--texts', type=int, default=20, help='Number of texts per request')
+    parser.add_argument('--filter', default='', help='Regex of case names to run')
+    parser.add_argument('--min-time', type=float, default=1.0, help='Min seconds per case')
+    parser.add_argument('--latency', type=float, default=0, help='Simulated Elasticsearch latency per request, ms')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='Save results as a JSON baseline')
+    parser.add_argument('--compare', help='Compare results with a JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.3,
+                        help='Max allowed increase of median latency, 0.3 is 30%%')
+    parser.add_argument('--verbose', action='store_true', help='Keep debug and info logs, they slow down the cases')
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    profile = dict(PROFILES[args.profile])
+    if args.sizes:
+        profile['dictionary_sizes'] = [int(s) for s in args.sizes.split(',')]
+    if args.words:
+        profile['text_words'] = [int(w) for w in args.words.split(',')]
+
+    start = time.time()
+    cases, server = make_cases(profile, args.texts, args.latency, args.seed)
+    print('Set up %s cases in %.1f sec' % (len(cases), time.time() - start))
+    print('%-28s %6s %10s %10s %10s %12s' % ('case', 'runs', 'p50 ms', 'p90 ms', 'p99 ms', 'throughput'))
+    results = {}
+    for case in cases:
+        if args.filter and not re.search(args.filter, case.name):
+            continue
+        requests = server.requests
+        result = case.run(args.min_time)
+        result['es_requests'] = float(server.requests - requests) / (result['runs'] + 1)
+        results[case.name] = result
+        print('%-28s %6s %10.3f %10.3f %10.3f %10.1f %s/s' % (
+            case.name, result['runs'], result['p50_ms'], result['p90_ms'], result['p99_ms'],
+            result['items_per_sec'], result['unit']))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'created_at': time.time(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'profile': profile,
+                'texts': args.texts,
+                'latency_ms': args.latency,
+                'cases': results
+            }, f, indent=2, sort_keys=True)
+        print('Saved baseline to %s' % args.save)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('%s cases regressed more than %.0f%%: %s' % (len(regressions), args.threshold * 100,
+                                                             ', '.join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
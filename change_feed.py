@@ -0,0 +1,108 @@
+"""Dictionary change feed over Redis pub/sub
+
+Every change of a dictionary bumps its version, which is the sequence number of the change (see
+`DictionaryVersionStore`). Writers publish (dic, lang, op, terms, seq) events, every worker process subscribes and
+applies `add` and `remove` events to its cached snapshots, so matchers are updated without loading the whole
+dictionary again. A snapshot which sees a gap in sequence numbers, or another change, e.g. an import, is reloaded
+from Elasticsearch on next use.
+
+While subscribed, versions are still checked every `CHANGE_FEED_CHECK_INTERVAL` seconds in case an event is lost.
+"""
+import json
+import os
+import threading
+import time
+
+from redis import RedisError
+
+from dictionary_cache import dictionary_cache
+from util.database import get_redis_conn
+from util.metrics import metrics
+from util.utils import get_logger
+
+# change feed settings, could be overridden by environment variables
+change_feed_enabled = os.environ.get('CHANGE_FEED', '').lower() in ('1', 'true', 'yes')
+change_feed_channel = os.environ.get('CHANGE_FEED_CHANNEL', 'ner:dic:changes')
+change_feed_check_interval = float(os.environ.get('CHANGE_FEED_CHECK_INTERVAL', 60))
+
+
+class ChangeFeed(object):
+    """Publish dictionary changes and apply the changes published by other workers to the dictionary cache.
+
+    Events with more than `max_terms` terms are published as `reload`.
+    """
+    def __init__(self, cache=dictionary_cache, enabled=change_feed_enabled, channel=change_feed_channel,
+                 check_interval=change_feed_check_interval, max_terms=10000, retry_interval=5):
+        self.logger = get_logger(self.__class__.__name__)
+        self.cache = cache
+        self.enabled = enabled
+        self.channel = channel
+        self.max_terms = max_terms
+        self.retry_interval = retry_interval
+        self.cache.feed_check_interval = check_interval
+        self.received = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def publish(self, dic, lang, op, terms, seq):
+        if not self.enabled:
+            return
+        terms = list(terms or ())
+        if len(terms) > self.max_terms:
+            op, terms = 'reload', []
+        event = {'dic': dic, 'lang': lang, 'op': op, 'terms': terms, 'seq': seq}
+        try:
+            get_redis_conn().publish(self.channel, json.dumps(event))
+        except RedisError as ex:
+            self.logger.error('Publish dictionary change error: %s' % ex)
+
+    def handle(self, data):
+        """Apply a published event to the cache"""
+        try:
+            event = json.loads(data)
+            applied = self.cache.apply_change(event['dic'], event['lang'], event['op'], event['terms'], event['seq'])
+        except (ValueError, KeyError, TypeError) as ex:
+            self.logger.error('Invalid dictionary change %r: %s' % (data, ex))
+            return
+        self.received += 1
+        metrics.inc('ner_change_feed_events_total', result='applied' if applied else 'reload')
+
+    def subscribe(self):
+        """Start listening in a background thread of the current process, once per process"""
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            thread = threading.Thread(target=self._listen, name='change-feed')
+            thread.daemon = True
+            thread.start()
+
+    def _listen(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            pubsub = None
+            try:
+                pubsub = get_redis_conn().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # changes could have been missed while not subscribed
+                self.cache.subscribed = True
+                self.cache.expire()
+                self.logger.info('Subscribed to dictionary changes on %s' % self.channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.handle(message['data'])
+            except RedisError as ex:
+                self.logger.error('Dictionary change feed error: %s' % ex)
+            finally:
+                self.cache.subscribed = False
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except RedisError:
+                        pass
+            time.sleep(self.retry_interval)
+
+
+change_feed = ChangeFeed()
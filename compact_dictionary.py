@@ -0,0 +1,200 @@
+"""Compact on-disk dictionary format, memory mapped read-only so its pages are shared by all worker processes
+
+A file holds the vocabularies of one dictionary at one version as a sorted string table:
+
+    magic       8 bytes, `NERDIC01`
+    header      int64 dictionary version, uint32 number of vocabularies, uint32 length of the longest vocabulary,
+                uint32 metadata length
+    metadata    JSON object with `dic`, `lang` and `created_at`, padded to 4 bytes
+    index       uint32 * (256 * 257 + 1), index of the first vocabulary in each bucket of its first two bytes,
+                see `get_bucket`
+    offsets     uint32 * (count + 1), offset of each vocabulary in the data section
+    data        UTF-8 vocabularies sorted by their bytes, concatenated
+
+Texts are matched straight against the mapped file, no vocabulary is loaded into Python objects. From every word
+boundary, vocabularies which are prefixes of the rest of the text are found by binary search, see `_find_prefixes`.
+"""
+import json
+import mmap
+import os
+import struct
+import time
+
+from matcher import Matcher, is_boundary
+
+MAGIC = b'NERDIC01'
+HEADER = struct.Struct('<qIII')
+OFFSET = struct.Struct('<I')
+# start and end offsets of a vocabulary, or first and last + 1 vocabulary of a bucket
+SPAN = struct.Struct('<2I')
+NUM_BUCKETS = 256 * 257
+
+compact_dir = os.environ.get('COMPACT_DIR', os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data'))
+
+
+def get_compact_path(dic, lang, data_dir=compact_dir):
+    return os.path.join(data_dir, '%s-%s.ndic' % (dic, lang))
+
+
+def get_bucket(term):
+    """Bucket of the first two bytes of a vocabulary, buckets are in the same order as sorted vocabularies,
+    one byte vocabularies sort before the longer ones starting with the same byte"""
+    return ord(term[0]) * 257 + (ord(term[1]) + 1 if len(term) > 1 else 0)
+
+
+def write_compact(path, vocs, dic, lang, version):
+    """Write vocabularies to a compact dictionary file, the file is replaced atomically so workers which
+    mapped the previous file keep reading it. Return the number of vocabularies written"""
+    terms = sorted(set(voc.encode('utf-8') for voc in vocs if voc))
+    meta = json.dumps({'dic': dic, 'lang': lang, 'created_at': time.time()}).encode('utf-8')
+    meta += b' ' * (-(len(MAGIC) + HEADER.size + len(meta)) % 4)
+    index = [0] * (NUM_BUCKETS + 1)
+    offsets = [0]
+    for idx, term in enumerate(terms):
+        offsets.append(offsets[-1] + len(term))
+        index[get_bucket(term) + 1] = idx + 1
+    for bucket in range(1, NUM_BUCKETS + 1):
+        index[bucket] = max(index[bucket], index[bucket - 1])
+    if offsets[-1] > 0xffffffff:
+        raise ValueError('Dictionary %s-%s is too large for the compact format' % (dic, lang))
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp_path = '%s.tmp.%s' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(HEADER.pack(version or 0, len(terms), max(len(term) for term in terms) if terms else 0, len(meta)))
+        f.write(meta)
+        f.write(struct.pack('<%sI' % len(index), *index))
+        f.write(struct.pack('<%sI' % len(offsets), *offsets))
+        for term in terms:
+            f.write(term)
+    os.rename(tmp_path, path)
+    return len(terms)
+
+
+class CompactDictionary(Matcher):
+    """Read-only memory mapped compact dictionary, opening it only reads the header"""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a compact dictionary file: %s' % path)
+        self.version, self._size, self._max_len, meta_len = HEADER.unpack_from(self._mm, len(MAGIC))
+        start = len(MAGIC) + HEADER.size
+        meta = json.loads(self._mm[start:start + meta_len].decode('utf-8'))
+        self.dic = meta['dic']
+        self.lang = meta['lang']
+        self._index = start + meta_len
+        self._offsets = self._index + OFFSET.size * (NUM_BUCKETS + 1)
+        self._data = self._offsets + OFFSET.size * (self._size + 1)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for idx in range(self._size):
+            yield self._get_term(idx)
+
+    def __contains__(self, voc):
+        term = voc.encode('utf-8')
+        if not term:
+            return False
+        idx = self._bisect_left(term, *self._get_bucket_range(get_bucket(term)))
+        return idx < self._size and self._get_bytes(idx) == term
+
+    @property
+    def size_bytes(self):
+        return len(self._mm)
+
+    def _get_bytes(self, idx):
+        start, end = SPAN.unpack_from(self._mm, self._offsets + OFFSET.size * idx)
+        return self._mm[self._data + start:self._data + end]
+
+    def _get_bucket_range(self, bucket):
+        return SPAN.unpack_from(self._mm, self._index + OFFSET.size * bucket)
+
+    def _get_term(self, idx):
+        return self._get_bytes(idx).decode('utf-8')
+
+    def _bisect_left(self, key, lo, hi):
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._get_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _bisect_right(self, key, lo, hi):
+        # hot path of matching, `_get_bytes` is inlined
+        mm, unpack, offsets, data = self._mm, SPAN.unpack_from, self._offsets, self._data
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, end = unpack(mm, offsets + 4 * mid)
+            if key < mm[data + start:data + end]:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def _find_prefixes(self, key):
+        """Vocabularies which are prefixes of `key` bytes, longest first"""
+        lo, end = self._get_bucket_range(get_bucket(key)) if len(key) > 1 else (0, 0)
+        while lo < end:
+            # the last vocabulary not after key shares the longest prefix with it, vocabularies sharing a longer
+            # prefix would sort between them, so the next prefix is at most as long as the common prefix
+            end = self._bisect_right(key, lo, end)
+            if end == lo:
+                break
+            term = self._get_bytes(end - 1)
+            common = 0
+            for a, b in zip(term, key):
+                if a != b:
+                    break
+                common += 1
+            if common == len(term):
+                yield term
+                common -= 1
+                end -= 1
+            # vocabularies in the bucket share at least two bytes with key
+            if common < 2:
+                break
+            key = key[:common]
+        lo, end = self._get_bucket_range(get_bucket(key[0]))
+        if lo < end:
+            yield key[0]
+
+    def find_all(self, text):
+        result = []
+        if not self._size:
+            return result
+        data = text.encode('utf-8')
+        # character index of each byte offset, None inside a multi-byte character
+        char_at = [None] * (len(data) + 1)
+        pos = 0
+        for idx, ch in enumerate(text):
+            char_at[pos] = idx
+            pos += len(ch.encode('utf-8'))
+        char_at[pos] = len(text)
+
+        mm, unpack, index = self._mm, OFFSET.unpack_from, self._index
+        for start in range(len(data)):
+            char_start = char_at[start]
+            if char_start is None:
+                continue
+            # skip bytes no vocabulary starts with, buckets of a first byte are contiguous
+            bucket = ord(data[start]) * 257
+            if unpack(mm, index + 4 * bucket) == unpack(mm, index + 4 * (bucket + 257)) or \
+                    not is_boundary(text, char_start):
+                continue
+            for term in self._find_prefixes(data[start:start + self._max_len]):
+                char_end = char_at[start + len(term)]
+                if char_end is not None and is_boundary(text, char_end):
+                    result.append((char_start, char_end, term.decode('utf-8')))
+        return result
+
+    def close(self):
+        self._mm.close()
@@ -1,12 +1,34 @@
 import logging
+import os
 from abc import abstractmethod, ABCMeta
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 import re
+import time
 
-from elasticsearch import NotFoundError, TransportError
+from elasticsearch import ConnectionTimeout, NotFoundError, TransportError
 from elasticsearch.helpers import bulk, scan
-from util.database import get_es_client
+
+from analyzer import AnalyzedMatcher, get_analyzer
+from change_feed import change_feed
+from compact_dictionary import CompactDictionary, compact_dir, get_compact_path, write_compact
+from dictionary_cache import DictionaryVersionStore, IndexCatalog, dictionary_cache
+from matcher import select_spans
+from util.admission import expired, get_deadline
+from util.database import get_es_client, without_retries
+from util.metrics import metrics
+from util.stream import iter_chunks
 from util.utils import get_logger, get_unicode
 
+# fan-out of tagging, one multi-search per dictionary index in a thread pool, 0 threads searches all indices at once
+fanout_threads = int(os.environ.get('TAG_FANOUT_THREADS', 0))
+# seconds each dictionary has to answer, dictionaries answering later are left out of the result
+fanout_timeout = float(os.environ.get('TAG_FANOUT_TIMEOUT', 10))
+
+# fields of a tag listing the dictionaries which did not answer in time, or whose search failed
+TIMED_OUT = 'timed_out'
+FAILED = 'failed'
+
 
 class Dictionary(object):
     __metaclass__ = ABCMeta
@@ -23,15 +45,112 @@ class Dictionary(object):
     def tag(self, texts, dics, lang):
         pass
 
+    def tag_batch(self, texts, dics, lang):
+        return self.tag(texts, dics, lang)
+
+    def tag_langs(self, texts, dics, langs):
+        """Tag texts with dictionaries of several languages, matches of all languages are merged, longest
+        match wins"""
+        if len(langs) == 1:
+            return self.tag_batch(texts, dics, langs[0])
+        results = [tags for tags in (self.tag_batch(texts, dics, lang) for lang in langs) if tags]
+        if not results:
+            return []
+        merged = []
+        for idx, text in enumerate(texts):
+            spans = [(s['start'], s['end'], s['term'], s['dic']) + ((s['distance'],) if 'distance' in s else ())
+                     for tags in results for s in tags[idx]['spans']]
+            tag = self._build_tag(self._normalize(text), select_spans(spans), dics)
+            for reason in (TIMED_OUT, FAILED):
+                incomplete = set(d for tags in results for d in tags[idx].get(reason, ()))
+                if incomplete:
+                    tag[reason] = sorted(incomplete)
+            merged.append(tag)
+        return merged
+
     @staticmethod
     def _normalize(text):
         return re.sub(r'\s+', ' ', get_unicode(text).strip().lower())
 
+    @staticmethod
+    def _get_offsets(text):
+        """Offset in `text` of each character of its normalized text, and of the end of it"""
+        text = get_unicode(text)
+        stripped = text.strip()
+        start = len(text) - len(text.lstrip())
+        offsets = []
+        last = 0
+        # same whitespace as `_normalize`, a run of whitespace is one space at the start of the run
+        for match in re.finditer(r'\s+', stripped):
+            offsets.extend(xrange(start + last, start + match.start() + 1))
+            last = match.end()
+        offsets.extend(xrange(start + last, start + len(stripped) + 1))
+        return offsets
+
+    @classmethod
+    def get_spans(cls, text, tag):
+        """Spans of a tagging result of `text` with offsets of `text` instead of its normalized text"""
+        offsets = cls._get_offsets(text)
+        return [dict(span, start=offsets[span['start']], end=offsets[span['end']]) for span in tag['spans']]
+
+    @classmethod
+    def _timed_out_tag(cls, n_text, spans, dics, reason=TIMED_OUT):
+        """Tag of a text cut by the deadline of the request, or with `reason` FAILED by a failed search, with the
+        matches found so far"""
+        tag = cls._build_tag(n_text, select_spans(spans), dics)
+        tag[reason] = sorted(dics) or ['*']
+        return tag
+
+    @staticmethod
+    def _build_tag(n_text, spans, dics):
+        # spans are non-overlapping (start, end, voc, dic), or (start, end, voc, dic, distance) of fuzzy matches,
+        # replace them by `[dic]` in one pass
+        tag_voc = {}
+        parts = []
+        entities = []
+        last = 0
+        for span in sorted(spans):
+            start, end, voc, dic = span[:4]
+            parts.append(n_text[last:start])
+            parts.append('[' + dic + ']')
+            last = end
+            entity = {'start': start, 'end': end, 'dic': dic, 'term': voc}
+            if len(span) > 4:
+                entity['distance'] = span[4]
+            entities.append(entity)
+            if dic in tag_voc:
+                tag_voc[dic]['matches'].add(voc)
+            else:
+                tag_voc[dic] = {'matches': {voc}}
+        parts.append(n_text[last:])
+
+        # convert set to list for json serialize
+        for t in tag_voc:
+            tag_voc[t]['matches'] = list(tag_voc[t]['matches'])
+            tag_voc[t]['count'] = len(tag_voc[t]['matches'])
+
+        # append empty tag
+        for dic in dics:
+            if dic not in tag_voc:
+                tag_voc[dic] = {'count': 0, 'matches': []}
+
+        return {
+            'norm_text': ''.join(parts),
+            'tag': tag_voc,
+            # offsets of the normalized text, see `get_spans`
+            'spans': entities
+        }
+
 
 class DictionaryES(Dictionary):
-    def __init__(self):
+    def __init__(self, es=None, fanout_threads=fanout_threads, fanout_timeout=fanout_timeout):
         self.logger = get_logger(self.__class__.__name__)
-        self.es = get_es_client()
+        self._es = es
+        self.fanout_threads = fanout_threads
+        self.fanout_timeout = fanout_timeout
+        self._pool = None
+        self._pool_pid = None
+        self._no_retry = None
         self.prefix_index_name = 'dic'
         self.doc_type = 'vocab'
         self.support_languages = {'arabic', 'armenian', 'basque', 'brazilian', 'bulgarian', 'catalan', 'cjk', 'czech',
@@ -41,108 +160,356 @@ class DictionaryES(Dictionary):
                                   'persian',
                                   'portuguese', 'romanian', 'russian', 'sorani', 'spanish', 'swedish', 'turkish',
                                   'thai'}
+        self.versions = DictionaryVersionStore(es)
+        self.catalog = IndexCatalog(es, '%s-*' % self.prefix_index_name)
         logging.getLogger('elasticsearch').setLevel(logging.CRITICAL)
 
+    @property
+    def es(self):
+        # the shared client of the current worker process unless a client was given
+        return self._es or get_es_client()
+
+    @property
+    def es_no_retry(self):
+        # searches bound to a deadline are not retried, a retry would wait for the timeout again
+        es = self.es
+        if self._no_retry is None or self._no_retry[0] is not es:
+            self._no_retry = (es, without_retries(es))
+        return self._no_retry[1]
+
     def _get_index_list_str(self, dics, lang):
         if not dics:
             return '%s-*-%s' % (self.prefix_index_name, lang)
         index_list = [self._get_index_name(dic, lang) for dic in dics]
         # filter non-exists indices
-        index_list = [idx for idx in index_list if self.es.indices.exists(idx)]
+        index_list = [idx for idx in index_list if self.catalog.exists(idx)]
         return ','.join(index_list)
 
+    def _get_index_list(self, dics, lang):
+        if dics:
+            return [idx for idx in self._get_index_list_str(dics, lang).split(',') if idx]
+        return self.catalog.match(self._get_index_list_str(dics, lang))
+
     def tag(self, texts, dics, lang):
         result = []
         index_name = self._get_index_list_str(dics, lang)
         if not index_name:
             return []
-        for text in texts:
-            n_text = self._normalize(text)
-            query = {
-                'query': {
-                    'match': {
-                        'voc': n_text
-                    }
-                }
-            }
-            hits = scan(client=self.es, query=query, index=index_name, doc_type=self.doc_type)
-            tag_voc = {}
+        with metrics.timer('normalize'):
+            n_texts = [self._normalize(text) for text in texts]
+        deadline = get_deadline()
+        for n_text in n_texts:
+            # texts left at the deadline of the request are not searched
+            if expired():
+                result.append(self._timed_out_tag(n_text, [], dics))
+                continue
+            client, params = self.es, {}
+            if deadline is not None:
+                client, params = self.es_no_retry, {'request_timeout': max(deadline.remaining(), 0.001)}
+            hits = []
+            incomplete = None
             try:
-                for hit in hits:
-                    doc = hit['_source']
-                    voc = doc['voc']
-                    pattern = re.compile(r'\b(%s)\b' % voc, re.IGNORECASE)
-                    if pattern.search(n_text):
-                        dic = hit['_index'].split('-')[1]
-                        if dic in tag_voc:
-                            tag_voc[dic]['matches'].add(voc)
-                            tag_voc[dic]['count'] += 1
-                        else:
-                            tag_voc[dic] = {'matches': {voc}, 'count': 1}
-
-                        n_text = pattern.sub('[' + dic + ']', n_text)
+                # one search and a scroll page per `size` hits, no page is fetched after the deadline
+                with metrics.timer('es_query'):
+                    for hit in scan(client=client, query=self._get_tag_query(n_text), index=index_name,
+                                    doc_type=self.doc_type, ignore_unavailable=True, **params):
+                        hits.append(hit)
+                        if expired():
+                            incomplete = TIMED_OUT
+                            break
+            except ConnectionTimeout as ex:
+                self.logger.error('Search timed out: %s' % ex)
+                incomplete = TIMED_OUT
+            except TransportError as ex:
+                self.logger.error('Search error: %s' % ex)
+                incomplete = FAILED
+            if incomplete:
+                result.append(self._timed_out_tag(n_text, self._confirm_hits(n_text, hits, lang), dics, incomplete))
+            else:
+                result.append(self._tag_hits(n_text, hits, dics, lang))
+        return result
 
+    def tag_batch(self, texts, dics, lang, chunk_size=100, size=500):
+        """Tag texts with one multi-search per `chunk_size` texts, each search returns at most `size` hits"""
+        if self.fanout_threads:
+            return self.tag_langs(texts, dics, [lang])
+        index_name = self._get_index_list_str(dics, lang)
+        if not index_name:
+            return []
+        with metrics.timer('normalize'):
+            n_texts = [self._normalize(text) for text in texts]
+        with metrics.timer('es_query'):
+            hits = self._search_hits(index_name, n_texts, chunk_size, size)
+        return [self._timed_out_tag(n_text, [], dics, text_hits) if text_hits in (TIMED_OUT, FAILED) else
+                self._tag_hits(n_text, text_hits, dics, lang) for n_text, text_hits in zip(n_texts, hits)]
+
+    def _search_hits(self, index_name, n_texts, chunk_size=100, size=500, **params):
+        """Hits of each text, one multi-search per `chunk_size` texts, TIMED_OUT for texts left at the deadline of
+        the request or whose search timed out, FAILED for texts whose search failed. Searches with a
+        `request_timeout` are not retried"""
+        result = []
+        deadline = get_deadline()
+        for i in range(0, len(n_texts), chunk_size):
+            chunk = n_texts[i:i + chunk_size]
+            if deadline is not None:
+                if deadline.expired():
+                    result.extend(TIMED_OUT for _ in chunk)
+                    continue
+                params['request_timeout'] = min(params.get('request_timeout', deadline.seconds), deadline.remaining())
+            client = self.es_no_retry if 'request_timeout' in params else self.es
+            try:
+                responses = client.msearch(body=self._get_msearch_body(index_name, chunk, size), **params)['responses']
+            except ConnectionTimeout as ex:
+                self.logger.error('Multi search timed out: %s' % ex)
+                if deadline is not None:
+                    deadline.expired()
+                result.extend(TIMED_OUT for _ in chunk)
+                continue
             except TransportError as ex:
-                self.logger.error('index not found: %s' % ex.message)
+                self.logger.error('Multi search error: %s' % ex)
+                result.extend(FAILED for _ in chunk)
+                continue
+
+            for response in responses:
+                if 'error' in response:
+                    self.logger.error('Multi search error: %s' % response['error'])
+                    result.append(FAILED)
+                else:
+                    result.append(response.get('hits', {}).get('hits', []))
+        return result
 
-            # convert set to list for json serialize
-            for t in tag_voc:
-                tag_voc[t]['matches'] = list(tag_voc[t]['matches'])
+    def _get_msearch_body(self, index_name, n_texts, size=500):
+        """Multi-search of the candidate vocabularies of each text, at most `size` hits each"""
+        body = []
+        for n_text in n_texts:
+            query = self._get_tag_query(n_text)
+            query['size'] = size
+            # indices deleted by another worker may still be in the catalog until it reloads
+            body.append({'index': index_name, 'type': self.doc_type, 'ignore_unavailable': True})
+            body.append(query)
+        return body
+
+    def _get_pool(self):
+        # threads do not survive a fork, each worker process has its own pool
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ThreadPool(self.fanout_threads)
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def tag_langs(self, texts, dics, langs):
+        """Search each dictionary index of each language concurrently in the thread pool and merge the matches,
+        dictionaries which do not answer within `fanout_timeout` seconds are listed as `timed_out` in each result,
+        dictionaries whose search failed as `failed`"""
+        if not self.fanout_threads:
+            return super(DictionaryES, self).tag_langs(texts, dics, langs)
+        indices = [(index_name, lang) for lang in langs for index_name in self._get_index_list(dics, lang)]
+        if not indices:
+            return []
+        with metrics.timer('normalize'):
+            n_texts = [self._normalize(text) for text in texts]
+
+        pool = self._get_pool()
+        deadline = time.time() + self.fanout_timeout
+        # the deadline of the request is not seen by pool threads, it cuts the wait for them
+        request_deadline = get_deadline()
+        if request_deadline is not None:
+            deadline = min(deadline, request_deadline.expires_at)
+        search = metrics.bind(self._search_hits)
+        request_timeout = max(deadline - time.time(), 0.001)
+        tasks = [(index_name, lang, pool.apply_async(search, (index_name, n_texts),
+                                                     {'request_timeout': request_timeout}))
+                 for index_name, lang in indices]
+        # hits of each text by language
+        lang_hits = [dict((lang, []) for lang in langs) for _ in n_texts]
+        # dictionaries of each text which timed out or failed
+        incomplete = [{TIMED_OUT: set(), FAILED: set()} for _ in n_texts]
+        timed_out = []
+        with metrics.timer('es_query'):
+            for index_name, lang, task in tasks:
+                dic = self._get_dic_name(index_name)
+                try:
+                    hits = task.get(max(deadline - time.time(), 0))
+                except TimeoutError:
+                    timed_out.append(dic)
+                    metrics.inc('ner_fanout_timeouts_total')
+                    hits = [TIMED_OUT] * len(n_texts)
+                except TransportError as ex:
+                    self.logger.error('Search %s error: %s' % (index_name, ex))
+                    hits = [FAILED] * len(n_texts)
+                for idx, text_hits in enumerate(hits):
+                    if text_hits in (TIMED_OUT, FAILED):
+                        incomplete[idx][text_hits].add(dic)
+                    else:
+                        lang_hits[idx][lang].extend(text_hits)
+        if timed_out:
+            self.logger.warning('Dictionaries timed out after %.3f sec: %s' % (request_timeout, timed_out))
+        if timed_out or any(text_incomplete[TIMED_OUT] for text_incomplete in incomplete):
+            # records a cut by the deadline of the request
+            expired()
 
-            # append empty tag
-            for dic in dics:
-                if dic not in tag_voc:
-                    tag_voc[dic] = {'count': 0, 'matches': []}
+        result = []
+        for n_text, hits, text_incomplete in zip(n_texts, lang_hits, incomplete):
+            spans = []
+            for lang, text_hits in hits.items():
+                spans.extend(self._confirm_hits(n_text, text_hits, lang))
+            tag = self._build_tag(n_text, select_spans(spans), dics)
+            for reason, incomplete_dics in text_incomplete.items():
+                if incomplete_dics:
+                    tag[reason] = sorted(incomplete_dics)
+            result.append(tag)
+        return result
 
+    @staticmethod
+    def _get_tag_query(n_text):
+        return {
+            'query': {
+                'match': {
+                    'voc': n_text
+                }
+            }
+        }
+
+    def _tag_hits(self, n_text, hits, dics, lang):
+        # replace confirmed matches in one pass
+        return self._build_tag(n_text, select_spans(self._confirm_hits(n_text, hits, lang)), dics)
+
+    def _confirm_hits(self, n_text, hits, lang):
+        # group candidate vocabularies by dictionary, confirm them on analyzed terms as Elasticsearch matched them
+        dic_vocs = {}
+        for hit in hits:
+            dic = self._get_dic_name(hit['_index'])
+            voc = get_unicode(hit['_source']['voc'])
+            if dic in dic_vocs:
+                dic_vocs[dic].add(voc)
+            else:
+                dic_vocs[dic] = {voc}
+
+        with metrics.timer('verify'):
+            spans = []
+            if dic_vocs:
+                analyzer = get_analyzer(lang)
+                tokens = analyzer.tokenize(n_text)
+                for dic, vocs in dic_vocs.items():
+                    matcher = AnalyzedMatcher(vocs, analyzer=analyzer)
+                    spans.extend((start, end, voc, dic) for start, end, voc in matcher.find_all(n_text, tokens))
+        metrics.inc('ner_hits_scanned_total', len(hits))
+        metrics.inc('ner_hits_confirmed_total', len(set((dic, voc) for _, _, voc, dic in spans)))
+        return spans
+
+    def get_voc(self, dics, lang):
+        result = []
+        dic_vocs = {}
+        for dic_name, voc in self.export_voc(dics, lang):
+            if dic_name in dic_vocs:
+                dic_vocs[dic_name].append(voc)
+            else:
+                dic_vocs[dic_name] = [voc]
+
+        for dic, vocs in dic_vocs.items():
             result.append({
-                'norm_text': n_text,
-                'tag': tag_voc
+                'dic': dic,
+                'num_voc': len(vocs),
+                'vocs': vocs
             })
+
         return result
 
-    def get_voc(self, dics, lang):
+    def get_voc_page(self, dics, lang, size=1000, after='', prefix=''):
+        """A page of at most `size` vocabularies of each dictionary in order, after `after` and starting with
+        `prefix`, with one multi-search. `next` of a dictionary is the `after` of its next page, empty on the last page.
+
+        Elasticsearch 2.4 has no `search_after`, a page is a range of `_uid` sorted by `_uid`. Vocabularies are
+        document ids, so `_source` is not fetched."""
+        index_list = self._get_index_list(dics, lang)
+        if not index_list:
+            return []
+        filters = []
+        if after:
+            filters.append({'range': {'_uid': {'gt': '%s#%s' % (self.doc_type, get_unicode(after))}}})
+        if prefix:
+            filters.append({'prefix': {'_uid': '%s#%s' % (self.doc_type, self._normalize(prefix))}})
+        query = {'bool': {'filter': filters}} if filters else {'match_all': {}}
+        body = []
+        for index_name in index_list:
+            body.append({'index': index_name, 'type': self.doc_type})
+            body.append({'query': query, 'sort': [{'_uid': 'asc'}], '_source': False, 'size': size})
+        try:
+            responses = self.es.msearch(body=body)['responses']
+        except TransportError as ex:
+            self.logger.error('index not found: %s' % ex.message)
+            return []
         result = []
+        for index_name, response in zip(index_list, responses):
+            vocs = [hit['_id'] for hit in response.get('hits', {}).get('hits', [])]
+            result.append({
+                'dic': self._get_dic_name(index_name),
+                'vocs': vocs,
+                'next': vocs[-1] if len(vocs) == size else ''
+            })
+        return result
+
+    def count_voc(self, dics, lang, prefix=''):
+        """Number of vocabularies of each dictionary, starting with `prefix` if any, no vocabulary is transferred.
+        Counts of whole dictionaries are read from one `_cat/indices`, counts of a prefix need one multi-search."""
+        index_list = self._get_index_list(dics, lang)
+        if not index_list:
+            return []
+        counts = {}
+        try:
+            if prefix:
+                query = {'prefix': {'_uid': '%s#%s' % (self.doc_type, self._normalize(prefix))}}
+                body = []
+                for index_name in index_list:
+                    body.append({'index': index_name, 'type': self.doc_type})
+                    body.append({'query': query, 'size': 0})
+                for index_name, response in zip(index_list, self.es.msearch(body=body)['responses']):
+                    counts[index_name] = response.get('hits', {}).get('total', 0)
+            else:
+                # plain text lines of `index docs.count`
+                lines = self.es.cat.indices(index=','.join(index_list), h='index,docs.count')
+                for line in lines.splitlines():
+                    if line.strip():
+                        name, count = line.split()
+                        counts[name] = int(count)
+        except TransportError as ex:
+            self.logger.error('index not found: %s' % ex.message)
+        return [{'dic': self._get_dic_name(index_name), 'num_voc': counts[index_name]}
+                for index_name in index_list if index_name in counts]
+
+    def export_voc(self, dics, lang, size=1000):
+        """Stream (dic, voc) of dictionaries, if `dics` is empty, get all"""
         index_name = self._get_index_list_str(dics, lang)
         if not index_name:
-            return []
-        dic_vocs = {}
+            return
         query = {
             'query': {
                 'match_all': {}
             }
         }
-        hits = scan(client=self.es, index=index_name, doc_type=self.doc_type, query=query)
+        hits = scan(client=self.es, index=index_name, doc_type=self.doc_type, query=query, size=size,
+                    ignore_unavailable=True)
         try:
             for hit in hits:
-                dic_name = hit['_index'].split('-')[1]
-                doc = hit['_source']
-                if dic_name in dic_vocs:
-                    dic_vocs[dic_name].append(doc['voc'])
-                else:
-                    dic_vocs[dic_name] = [doc['voc']]
+                yield self._get_dic_name(hit['_index']), hit['_source']['voc']
         except TransportError as ex:
             self.logger.error('index not found: %s' % ex.message)
 
-        for dic, vocs in dic_vocs.items():
-            result.append({
-                'dic': dic,
-                'num_voc': len(vocs),
-                'vocs': vocs
-            })
-
-        return result
-
     def remove_dic(self, dics, lang):
         result = []
         for dic in dics:
             error = ''
             index_name = self._get_index_name(dic, lang)
             try:
-                if self.es.indices.exists(index_name):
+                if self.catalog.exists(index_name):
                     self.es.indices.delete(index_name)
+                    self.catalog.discard(index_name)
+                    self._on_change(dic, lang, 'drop')
                     self.logger.info('Delete dictionary %s successfully' % dic)
                 else:
                     error = "Dictionary '%s' does not exist" % dic
+            except NotFoundError:
+                self.catalog.discard(index_name)
+                error = "Dictionary '%s' does not exist" % dic
             except Exception as ex:
                 self.logger.info('Remove dictionary error: %s' % ex.message)
                 error = ex.message
@@ -173,6 +540,9 @@ class DictionaryES(Dictionary):
             })
         stats = bulk(self.es, delete_actions, stats_only=True, refresh=True)
         self.logger.info('Delete Success/Fail: %s/%s' % stats)
+        if stats[0]:
+            # which vocabularies failed is unknown, reload them all
+            self._on_change(dic, lang, 'reload' if stats[1] else 'remove', vocs)
         return stats
 
     def _get_exist_voc(self, vocs, index_name, doc_type):
@@ -195,40 +565,32 @@ class DictionaryES(Dictionary):
 
         return existed_voc
 
+    def _check_exist_voc(self, vocs, index_name, lang):
+        """Existing vocabularies of an index in the catalog, and whether the index was created again because another
+        worker or instance removed it since the catalog was loaded"""
+        try:
+            return self._get_exist_voc(vocs, index_name, self.doc_type), False
+        except NotFoundError:
+            self.logger.info('Index was removed: ' + index_name)
+            self.catalog.discard(index_name)
+            if self._create_index(index_name, lang):
+                return set(), True
+            return self._get_exist_voc(vocs, index_name, self.doc_type), False
+
     def add_voc(self, vocs, dic, lang):
         self.logger.info('Start add_voc...')
         index_name = self._get_index_name(dic, lang)
         first_init = False
         # check exist index
-        if not self.es.indices.exists(index_name):
-            first_init = True
-            # create index
-            self.logger.info('Create new index: ' + index_name)
-            body = {
-                'mappings': {
-                    self.doc_type: {
-                        'properties': {
-                            'voc': {
-                                'type': 'string',
-                                'analyzer': lang if lang in self.support_languages else 'standard'
-                            }
-                        }
-                    }
-                },
-                'settings': {
-                    'index': {
-                        'number_of_shards': 1
-                    }
-                }
-            }
-            self.es.indices.create(index_name, body=body)
+        if not self.catalog.exists(index_name):
+            first_init = self._create_index(index_name, lang)
 
         # normalize vocabularies
         vocs = [self._normalize(v) for v in vocs]
 
         # check exist vocs
         if not first_init:
-            existed_voc = self._get_exist_voc(vocs, index_name, self.doc_type)
+            existed_voc, first_init = self._check_exist_voc(vocs, index_name, lang)
             self.logger.debug('existed vocs: %s' % existed_voc)
             vocs = [v for v in vocs if v not in existed_voc]
 
@@ -251,8 +613,231 @@ class DictionaryES(Dictionary):
             })
         stats = bulk(self.es, index_actions, stats_only=True, refresh=True)
         self.logger.info('Index Success/Fail: %s/%s' % stats)
+        if stats[0]:
+            self._on_change(dic, lang, 'reload' if stats[1] else 'add', vocs)
         self.logger.info('End add_voc...')
         return stats
 
+    def import_voc(self, vocs, dic, lang, batch_size=1000, progress=None):
+        """Import a large iterable of vocabularies, `progress(stats)` is called after each batch"""
+        stats = {'success': 0, 'fail': 0}
+        for stats in self.iter_import_voc(vocs, dic, lang, batch_size):
+            if progress:
+                progress(stats)
+        return stats['success'], stats['fail']
+
+    def iter_import_voc(self, vocs, dic, lang, batch_size=1000):
+        """Stream vocabularies into a dictionary, yield accumulated stats after each batch.
+
+        Vocabularies are checked for existence and indexed batch by batch, the index is refreshed once
+        at the end.
+        """
+        self.logger.info('Start import_voc...')
+        index_name = self._get_index_name(dic, lang)
+        first_init = False
+        if not self.catalog.exists(index_name):
+            first_init = self._create_index(index_name, lang)
+
+        stats = {'batch': 0, 'success': 0, 'fail': 0, 'skip': 0}
+        for batch in iter_chunks((self._normalize(v) for v in vocs), batch_size):
+            num_vocs = len(batch)
+            batch = set(v for v in batch if v)
+            if not first_init:
+                existed_voc, first_init = self._check_exist_voc(list(batch), index_name, lang)
+                batch -= existed_voc
+            index_actions = ({
+                '_op_type': 'index',
+                '_index': index_name,
+                '_type': self.doc_type,
+                '_id': voc,
+                '_source': {
+                    'voc': voc
+                }
+            } for voc in batch)
+            # `bulk` sends actions through `streaming_bulk`, refresh once at the end
+            success, fail = bulk(self.es, index_actions, stats_only=True, chunk_size=batch_size,
+                                 raise_on_error=False)
+            stats['batch'] += 1
+            stats['success'] += success
+            stats['fail'] += fail
+            stats['skip'] += num_vocs - len(batch)
+            yield dict(stats)
+
+        self.es.indices.refresh(index_name)
+        if stats['success']:
+            self._on_change(dic, lang)
+        self.logger.info('Import Success/Fail/Skip: %s/%s/%s' % (stats['success'], stats['fail'], stats['skip']))
+
+    def _create_index(self, index_name, lang):
+        """Create a dictionary index, return False if it was already created by another worker"""
+        self.logger.info('Create new index: ' + index_name)
+        body = {
+            'mappings': {
+                self.doc_type: {
+                    'properties': {
+                        'voc': {
+                            'type': 'string',
+                            'analyzer': lang if lang in self.support_languages else 'standard'
+                        }
+                    }
+                }
+            },
+            'settings': {
+                'index': {
+                    'number_of_shards': 1
+                }
+            }
+        }
+        created = True
+        try:
+            self.es.indices.create(index_name, body=body)
+        except TransportError as ex:
+            if 'already_exists' not in str(ex.error):
+                raise
+            self.logger.info('Index already exists: ' + index_name)
+            created = False
+        self.catalog.add(index_name)
+        return created
+
+    def get_versions(self, dics, lang, max_age=0):
+        """Versions of dictionaries as sorted (dic, version) pairs, if `dics` is empty, version of all
+        dictionaries of the language"""
+        keys = [(dic, lang) for dic in sorted(set(dics))] or [('*', lang)]
+        versions = self.versions.get_versions(keys, max_age)
+        return tuple((key[0], versions[key]) for key in keys)
+
+    def _on_change(self, dic, lang, op='reload', terms=()):
+        """Bump the version of a changed dictionary, cached dictionaries of every worker are reloaded or updated with
+        the change from the change feed. `op` is `add` or `remove` of `terms`, `reload` or `drop`"""
+        version = self.versions.bump(dic, lang)
+        dictionary_cache.apply_change(dic, lang, op, terms, version)
+        change_feed.publish(dic, lang, op, terms, version)
+
     def _get_index_name(self, dic, lang):
         return '%s-%s-%s' % (self.prefix_index_name, dic, lang)
+
+    @staticmethod
+    def _get_dic_name(index_name):
+        return index_name.split('-')[1]
+
+
+class DictionaryLocal(DictionaryES):
+    """Tag texts in process, each dictionary index is loaded once into a cached snapshot and matched
+    by `matcher` (`aho_corasick`, `regex` or `analyzed`), vocabularies are still stored in Elasticsearch"""
+    def __init__(self, matcher='aho_corasick', es=None):
+        # matched in process, nothing to fan out
+        super(DictionaryLocal, self).__init__(es, fanout_threads=0)
+        self.matcher = matcher
+
+    def _load_vocs(self, dic, lang):
+        return [get_unicode(voc) for _, voc in self.export_voc([dic], lang)]
+
+    def preload(self, dics, lang):
+        """Load dictionaries into the process wide cache and build their matchers"""
+        self._get_matchers(dics, lang)
+
+    def _get_snapshots(self, dics, lang):
+        change_feed.subscribe()
+        keys = [(self._get_dic_name(idx), lang) for idx in self._get_index_list(dics, lang)]
+        snapshots = dictionary_cache.get_snapshots(keys, self._load_vocs, self.versions)
+        return [snapshots[key] for key in keys]
+
+    def _get_matchers(self, dics, lang):
+        """(dic, matcher) of dictionaries, if `dics` is empty, get all"""
+        return [(s.dic, s.get_matcher(self.matcher)) for s in self._get_snapshots(dics, lang)]
+
+    def tag(self, texts, dics, lang):
+        result = []
+        try:
+            with metrics.timer('load_matchers'):
+                matchers = self._get_matchers(dics, lang)
+        except TransportError as ex:
+            self.logger.error('Load dictionaries error: %s' % ex)
+            return [self._timed_out_tag(self._normalize(text), [], dics, FAILED) for text in texts]
+        if not matchers:
+            return []
+        with metrics.timer('normalize'):
+            n_texts = [self._normalize(text) for text in texts]
+        with metrics.timer('match'):
+            for n_text in n_texts:
+                if expired():
+                    result.append(self._timed_out_tag(n_text, [], dics))
+                    continue
+                spans = []
+                for dic, matcher in matchers:
+                    # fuzzy matches also have their edit distance
+                    spans.extend(match[:3] + (dic,) + match[3:] for match in matcher.find_all(n_text))
+                result.append(self._build_tag(n_text, select_spans(spans), dics))
+        return result
+
+    def tag_batch(self, texts, dics, lang):
+        # texts are matched in process, no multi-search to batch
+        return self.tag(texts, dics, lang)
+
+
+class DictionaryCompact(DictionaryLocal):
+    """Tag texts in process against compact dictionary files, see `compact_dictionary`.
+
+    A file is exported from the dictionary index once per version and memory mapped read-only, so all workers
+    on a host share its pages. Versions are checked at most every `check_interval` seconds.
+    """
+    def __init__(self, data_dir=compact_dir, check_interval=5, es=None):
+        super(DictionaryCompact, self).__init__('compact', es)
+        self.data_dir = data_dir
+        self.check_interval = check_interval
+        # (dic, lang) -> (CompactDictionary, checked at)
+        self._compacts = {}
+
+    def compile(self, dic, lang, version=None):
+        """Export a dictionary index to its compact file, return the number of vocabularies"""
+        if version is None:
+            version = self.versions.get_versions([(dic, lang)])[(dic, lang)]
+        return write_compact(get_compact_path(dic, lang, self.data_dir), self._load_vocs(dic, lang), dic, lang,
+                             version)
+
+    def _open_compact(self, dic, lang, version):
+        path = get_compact_path(dic, lang, self.data_dir)
+        if os.path.exists(path):
+            compact = CompactDictionary(path)
+            # keep the file when the version is unknown, e.g. Elasticsearch is unavailable
+            if version is None or compact.version == version:
+                return compact
+        self.logger.info('Compile dictionary %s-%s version %s' % (dic, lang, version))
+        self.compile(dic, lang, version)
+        return CompactDictionary(path)
+
+    def _on_change(self, dic, lang, op='reload', terms=()):
+        super(DictionaryCompact, self)._on_change(dic, lang, op, terms)
+        self._compacts.pop((dic, lang), None)
+
+    def _get_matchers(self, dics, lang):
+        keys = [(self._get_dic_name(idx), lang) for idx in self._get_index_list(dics, lang)]
+        now = time.time()
+        stale = [key for key in keys if key not in self._compacts or
+                 now - self._compacts[key][1] >= self.check_interval]
+        if stale:
+            try:
+                versions = self.versions.get_versions(stale)
+            except TransportError as ex:
+                self.logger.error('Get dictionary versions error: %s' % ex)
+                versions = dict((key, None) for key in stale)
+            for key in stale:
+                compact = self._compacts[key][0] if key in self._compacts else None
+                if compact is None or (versions[key] is not None and compact.version != versions[key]):
+                    compact = self._open_compact(key[0], key[1], versions[key])
+                self._compacts[key] = (compact, now)
+        return [(key[0], self._compacts[key][0]) for key in keys]
+
+
+def make_dictionary(engine='es', es=None):
+    """Dictionary tagging with Elasticsearch queries (`es`), in process matchers (`aho_corasick`, `regex`,
+    `analyzed`), memory mapped compact files (`compact`) or on the nodes of each dictionary (`sharded`)"""
+    if engine == 'es':
+        return DictionaryES(es)
+    if engine == 'compact':
+        return DictionaryCompact(es=es)
+    if engine == 'sharded':
+        # the router depends on this module
+        from shard_router import ShardedDictionary
+        return ShardedDictionary(es=es)
+    return DictionaryLocal(matcher=engine, es=es)
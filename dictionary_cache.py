@@ -0,0 +1,308 @@
+import time
+from fnmatch import fnmatch
+from threading import RLock
+
+from elasticsearch import NotFoundError, TransportError
+
+from analyzer import AnalyzedMatcher
+from fuzzy import FuzzyMatcher
+from matcher import AhoCorasick, DeltaMatcher, TrieRegex
+from util.cache import LRUCache
+from util.database import get_es_client
+from util.utils import get_logger
+
+# matchers could be built from the vocabularies and language of a dictionary snapshot, built lazily by name
+MATCHERS = {
+    'aho_corasick': lambda vocs, lang: AhoCorasick(vocs),
+    'regex': lambda vocs, lang: TrieRegex(vocs),
+    # same matches as tagging with Elasticsearch, see `analyzer`
+    'analyzed': lambda vocs, lang: AnalyzedMatcher(vocs, lang),
+    # typo tolerant, matches have their edit distance, see `fuzzy`
+    'fuzzy': lambda vocs, lang: FuzzyMatcher(vocs)
+}
+
+
+class DictionaryVersionStore(object):
+    """Versions of dictionaries, kept in Elasticsearch so every worker sees the same version.
+
+    Each (dic, lang) has one document in the version index, the version is the document `_version`
+    which Elasticsearch increases every time the document is indexed again. The ('*', lang) document is
+    bumped with every dictionary of the language.
+    """
+    def __init__(self, es=None, index_name='dic_version', doc_type='version'):
+        self.logger = get_logger(self.__class__.__name__)
+        self._es = es
+        self.index_name = index_name
+        self.doc_type = doc_type
+        # recently read versions, key -> (version, read at)
+        self._versions = {}
+
+    @property
+    def es(self):
+        return self._es or get_es_client()
+
+    @staticmethod
+    def _get_id(dic, lang):
+        return '%s-%s' % (dic, lang)
+
+    def bump(self, dic, lang):
+        version = None
+        now = time.time()
+        for key in ((dic, lang), ('*', lang)):
+            res = self.es.index(index=self.index_name, doc_type=self.doc_type, id=self._get_id(*key),
+                                body={'dic': key[0], 'lang': lang, 'updated_at': now})
+            self._versions[key] = (res['_version'], now)
+            version = version or res['_version']
+        return version
+
+    def get_versions(self, keys, max_age=0):
+        """Get versions of (dic, lang) keys, 0 if the dictionary has never been changed,
+        versions read less than `max_age` seconds ago are not read again"""
+        now = time.time()
+        versions = {}
+        stale = []
+        for key in keys:
+            version, read_at = self._versions.get(key, (0, 0))
+            if now - read_at < max_age:
+                versions[key] = version
+            else:
+                versions[key] = 0
+                stale.append(key)
+        if not stale:
+            return versions
+        try:
+            res = self.es.mget(index=self.index_name, doc_type=self.doc_type,
+                               body={'ids': [self._get_id(dic, lang) for dic, lang in stale]}, _source=False)
+            docs = res['docs']
+        except NotFoundError:
+            docs = [{} for _ in stale]
+        for key, doc in zip(stale, docs):
+            if doc.get('found'):
+                versions[key] = doc['_version']
+            self._versions[key] = (versions[key], now)
+        return versions
+
+
+class IndexCatalog(object):
+    """Names of dictionary indices, loaded with one `_alias` call and reloaded every `ttl` seconds.
+
+    A name which is not in the catalog triggers a reload, at most once every `min_reload_interval` seconds,
+    in case the index was created by another worker since the last load.
+    """
+    def __init__(self, es=None, pattern='dic-*', ttl=30, min_reload_interval=1):
+        self.logger = get_logger(self.__class__.__name__)
+        self._es = es
+        self.pattern = pattern
+        self.ttl = ttl
+        self.min_reload_interval = min_reload_interval
+        self._indices = frozenset()
+        self.loaded_at = 0
+        self.reloads = 0
+
+    @property
+    def es(self):
+        return self._es or get_es_client()
+
+    def __contains__(self, index_name):
+        return index_name in self._indices
+
+    def set_indices(self, indices):
+        self._indices = frozenset(indices)
+        self.loaded_at = time.time()
+        self.reloads += 1
+
+    def reload(self):
+        try:
+            indices = self.es.indices.get_alias(index=self.pattern).keys()
+        except NotFoundError:
+            indices = []
+        self.set_indices(indices)
+
+    def _get_indices(self):
+        if time.time() - self.loaded_at >= self.ttl:
+            self.reload()
+        return self._indices
+
+    def exists(self, index_name):
+        if index_name in self._get_indices():
+            return True
+        if time.time() - self.loaded_at >= self.min_reload_interval:
+            self.reload()
+        return index_name in self._indices
+
+    def match(self, pattern):
+        return sorted(idx for idx in self._get_indices() if fnmatch(idx, pattern))
+
+    def add(self, index_name):
+        self._indices = self._indices | {index_name}
+
+    def discard(self, index_name):
+        self._indices = self._indices - {index_name}
+
+
+class DictionarySnapshot(object):
+    """Vocabularies of one dictionary at one version, with its precompiled matchers"""
+    def __init__(self, dic, lang, vocs, version, max_delta=10000, max_delta_ratio=0.1):
+        self.dic = dic
+        self.lang = lang
+        self.vocs = set(vocs)
+        self.version = version
+        self.checked_at = time.time()
+        # matchers are rebuilt when changes since they were built exceed both limits
+        self.max_delta = max_delta
+        self.max_delta_ratio = max_delta_ratio
+        self._matchers = {}
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self.vocs)
+
+    def get_matcher(self, name='aho_corasick'):
+        if name not in self._matchers:
+            with self._lock:
+                if name not in self._matchers:
+                    self._matchers[name] = MATCHERS[name](self.vocs, self.lang)
+        return self._matchers[name]
+
+    def apply(self, op, terms, version):
+        """Add (`op` is `add`) or remove vocabularies and move to `version`. Built matchers are not rebuilt but
+        wrapped in a `DeltaMatcher`, matchers which return no overlapping candidates are dropped and rebuilt lazily"""
+        with self._lock:
+            if op == 'add':
+                added, removed = set(t for t in terms if t and t not in self.vocs), set()
+                self.vocs |= added
+            else:
+                added, removed = set(), set(t for t in terms if t in self.vocs)
+                self.vocs -= removed
+            max_delta = max(self.max_delta, len(self.vocs) * self.max_delta_ratio)
+            # matchers are replaced, not changed, requests which got a matcher keep a consistent one
+            matchers = {}
+            for name, matcher in self._matchers.items():
+                if isinstance(matcher, DeltaMatcher):
+                    matcher = matcher.update(added, removed)
+                elif matcher.overlapping:
+                    matcher = DeltaMatcher(matcher, lambda vocs, name=name: MATCHERS[name](vocs, self.lang),
+                                           added, removed)
+                else:
+                    continue
+                if matcher.delta_size <= max_delta:
+                    matchers[name] = matcher
+            self._matchers = matchers
+            self.version = version
+
+
+class DictionaryCache(object):
+    """Process wide LRU cache of dictionary snapshots keyed by (dic, lang).
+
+    Versions are checked at most every `check_interval` seconds, a snapshot is reloaded lazily when
+    its version changed, e.g. vocabularies were added or removed by another worker.
+    """
+    def __init__(self, max_vocs=5000000, check_interval=5, feed_check_interval=60):
+        self.logger = get_logger(self.__class__.__name__)
+        self._check_interval = check_interval
+        # changes are pushed while subscribed to the change feed, see `change_feed`
+        self.feed_check_interval = feed_check_interval
+        self.subscribed = False
+        self.snapshots = LRUCache(max_vocs, weight=len)
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.deltas = 0
+        self.gaps = 0
+
+    @property
+    def check_interval(self):
+        return self.feed_check_interval if self.subscribed else self._check_interval
+
+    def get_snapshots(self, keys, loader, version_store):
+        """Get snapshots of (dic, lang) keys, `loader(dic, lang)` returns vocabularies of a dictionary"""
+        result = {}
+        now = time.time()
+        stale = []
+        for key in keys:
+            snapshot = self.snapshots.get(key)
+            if snapshot is not None and now - snapshot.checked_at < self.check_interval:
+                result[key] = snapshot
+                self.hits += 1
+            else:
+                stale.append(key)
+        if not stale:
+            return result
+
+        try:
+            versions = version_store.get_versions(stale)
+        except TransportError as ex:
+            self.logger.error('Get dictionary versions error: %s' % ex)
+            versions = dict((key, None) for key in stale)
+
+        for key in stale:
+            snapshot = self.snapshots.get(key)
+            version = versions[key]
+            if snapshot is not None and (version is None or version == snapshot.version):
+                snapshot.checked_at = now
+                self.hits += 1
+            else:
+                if snapshot is None:
+                    self.misses += 1
+                else:
+                    self.reloads += 1
+                self.logger.info('Load dictionary %s-%s version %s' % (key[0], key[1], version))
+                snapshot = DictionarySnapshot(key[0], key[1], loader(*key), version)
+                self.snapshots.put(key, snapshot)
+            result[key] = snapshot
+        return result
+
+    def invalidate(self, dic, lang):
+        self.snapshots.pop((dic, lang))
+
+    def apply_change(self, dic, lang, op, terms, version):
+        """Apply a change of a dictionary to its cached snapshot. Changes other than `add` and `remove`, and changes
+        which do not follow the snapshot version (a change was missed) drop the snapshot, it is reloaded on next use.
+        Return False if the snapshot was dropped"""
+        key = (dic, lang)
+        snapshot = self.snapshots.get(key)
+        if snapshot is None:
+            return True
+        if version is not None and snapshot.version is not None and version <= snapshot.version:
+            # already loaded with the change
+            return True
+        if op not in ('add', 'remove') or version is None or snapshot.version is None or \
+                version != snapshot.version + 1:
+            if version is not None and snapshot.version is not None and version > snapshot.version + 1:
+                self.gaps += 1
+                self.logger.info('Missed changes of dictionary %s-%s from version %s to %s, reload it'
+                                 % (dic, lang, snapshot.version, version))
+            self.snapshots.pop(key)
+            return False
+        # taken out while its weight changes
+        self.snapshots.pop(key)
+        snapshot.apply(op, terms, version)
+        self.snapshots.put(key, snapshot)
+        self.deltas += 1
+        return True
+
+    def expire(self):
+        """Check versions of all snapshots on next use, e.g. changes may have been missed"""
+        for key in self.snapshots.keys():
+            snapshot = self.snapshots.get(key)
+            if snapshot is not None:
+                snapshot.checked_at = 0
+
+    def clear(self):
+        self.snapshots.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+            'deltas': self.deltas,
+            'gaps': self.gaps,
+            'subscribed': self.subscribed,
+            'evictions': self.snapshots.evictions,
+            'dictionaries': len(self.snapshots),
+            'vocabularies': self.snapshots.total_weight
+        }
+
+
+dictionary_cache = DictionaryCache()
@@ -0,0 +1,101 @@
+"""Import and export dictionaries with large files, one vocabulary per line, optionally gzip compressed
+
+Usage:
+    python dictionary_cli.py import cities.txt.gz --dic city --lang english --batch-size 5000
+    python dictionary_cli.py export --dic city --lang english -o cities.txt.gz
+    python dictionary_cli.py compile --dic city --lang english
+"""
+import argparse
+import gzip
+import sys
+import time
+
+from compact_dictionary import CompactDictionary, compact_dir, get_compact_path
+from dictionary import DictionaryCompact, DictionaryES
+from util.stream import iter_lines
+from util.utils import get_memory_usage
+
+
+def import_voc(args):
+    d = DictionaryES()
+    fileobj = sys.stdin if args.input == '-' else open(args.input, 'rb')
+    start = time.time()
+
+    def progress(stats):
+        sys.stderr.write('batch %(batch)s: %(success)s indexed, %(fail)s failed, %(skip)s skipped' % stats)
+        sys.stderr.write(', %.1f vocs/sec\n' % ((stats['success'] + stats['fail'] + stats['skip']) /
+                                                 (time.time() - start)))
+
+    try:
+        vocs = iter_lines(fileobj, gzipped=args.input.endswith('.gz'))
+        success, fail = d.import_voc(vocs, args.dic, args.lang, args.batch_size, progress)
+    finally:
+        if fileobj is not sys.stdin:
+            fileobj.close()
+    sys.stderr.write("%s vocabularies was imported to dictionary '%s' successfully, %s failed\n"
+                     % (success, args.dic, fail))
+
+
+def export_voc(args):
+    d = DictionaryES()
+    if args.output == '-':
+        output = sys.stdout
+    elif args.output.endswith('.gz'):
+        output = gzip.open(args.output, 'wb')
+    else:
+        output = open(args.output, 'wb')
+    num_voc = 0
+    try:
+        for _, voc in d.export_voc([args.dic], args.lang):
+            output.write((voc + u'\n').encode('utf-8'))
+            num_voc += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    sys.stderr.write("%s vocabularies was exported from dictionary '%s'\n" % (num_voc, args.dic))
+
+
+def compile_voc(args):
+    d = DictionaryCompact(data_dir=args.data_dir)
+    start = time.time()
+    num_voc = d.compile(args.dic, args.lang)
+    elapsed = time.time() - start
+
+    path = get_compact_path(args.dic, args.lang, args.data_dir)
+    rss = get_memory_usage()['rss']
+    start = time.time()
+    compact = CompactDictionary(path)
+    sys.stderr.write("%s vocabularies of dictionary '%s' version %s was compiled to %s (%.1f MB) in %.1f sec\n"
+                     % (num_voc, args.dic, compact.version, path, compact.size_bytes / 1048576.0, elapsed))
+    sys.stderr.write('Opened in %.2f ms, RSS +%.1f MB\n' % ((time.time() - start) * 1000,
+                                                            (get_memory_usage()['rss'] - rss) / 1048576.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers()
+
+    parser_import = subparsers.add_parser('import', help='Import vocabularies to a dictionary')
+    parser_import.add_argument('input', nargs='?', default='-', help='Input file, `-` for stdin')
+    parser_import.add_argument('--batch-size', type=int, default=1000, help='Number of vocabularies indexed at once')
+    parser_import.set_defaults(func=import_voc)
+
+    parser_export = subparsers.add_parser('export', help='Export vocabularies of a dictionary')
+    parser_export.add_argument('-o', '--output', default='-', help='Output file, `-` for stdout')
+    parser_export.set_defaults(func=export_voc)
+
+    parser_compile = subparsers.add_parser('compile', help='Export a dictionary to a memory mapped compact file')
+    parser_compile.add_argument('--data-dir', default=compact_dir, help='Directory of compact dictionary files')
+    parser_compile.set_defaults(func=compile_voc)
+
+    for sub in (parser_import, parser_export, parser_compile):
+        sub.add_argument('--dic', required=True, help='The dictionary name')
+        sub.add_argument('--lang', default='english', help='The dictionary language')
+
+    args = parser.parse_args()
+    args.dic = args.dic.strip().lower()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
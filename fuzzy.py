@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Typo tolerant matching of vocabularies with a precomputed symmetric delete index (as SymSpell)
+
+Every vocabulary is indexed under the strings made by deleting up to `max_edits` of its characters. A span of the
+text, i.e. a run of whole tokens, is looked up under its own deletes, so candidates within the edit distance are found
+with a few dictionary lookups whatever the size of the dictionary, then confirmed with the optimal string alignment
+distance (Levenshtein with adjacent transpositions).
+
+Short vocabularies only match exactly, as `fuzziness: AUTO` of Elasticsearch, 1 edit is allowed from
+`min_lengths[0]` characters and 2 from `min_lengths[1]`. The index takes about `len(voc)` entries per vocabulary for
+1 edit and `len(voc) ** 2 / 2` for 2 edits.
+"""
+import os
+import re
+
+from matcher import Matcher
+
+# max edit distance of fuzzy matches, could be overridden by environment variable
+fuzzy_max_distance = int(os.environ.get('FUZZY_MAX_DISTANCE', 1))
+
+
+def edit_distance(a, b, max_distance):
+    """Optimal string alignment distance of `a` and `b`, `max_distance + 1` if it is larger than `max_distance`"""
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    # common prefix and suffix do not change the distance
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not a or not b:
+        return min(len(a) + len(b), max_distance + 1)
+
+    before = None
+    previous = range(len(b) + 1)
+    for i in xrange(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in xrange(1, len(b) + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+        if min(current) > max_distance:
+            return max_distance + 1
+        before, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+def get_deletes(word, max_edits):
+    """`word` and all strings made by deleting up to `max_edits` of its characters"""
+    result = {word}
+    edits = {word}
+    for _ in xrange(max_edits):
+        edits = {edit[:i] + edit[i + 1:] for edit in edits for i in xrange(len(edit))}
+        result.update(edits)
+    return result
+
+
+class FuzzyMatcher(Matcher):
+    """Vocabularies within `max_distance` edits of a run of whole tokens of the text, `find_all` returns
+    (start, end, voc, distance), only the closest vocabularies of each span"""
+
+    # words, or runs of punctuation, as `LanguageAnalyzer`
+    token_pattern = re.compile(r'(\w+)|[^\w\s]+', re.UNICODE)
+    min_lengths = (5, 9)
+
+    def __init__(self, vocs=(), max_distance=fuzzy_max_distance):
+        self.max_distance = max(0, min(max_distance, len(self.min_lengths)))
+        self._vocs = set()
+        # delete -> vocabularies
+        self._index = {}
+        self._max_tokens = 0
+        self._min_length = None
+        self._max_length = 0
+        for voc in vocs:
+            self.add(voc)
+
+    def __len__(self):
+        return len(self._vocs)
+
+    def max_edits(self, length):
+        return min(self.max_distance, sum(1 for min_length in self.min_lengths if length >= min_length))
+
+    def add(self, voc):
+        if not voc or voc in self._vocs:
+            return
+        self._vocs.add(voc)
+        self._max_tokens = max(self._max_tokens, len(self.token_pattern.findall(voc)))
+        self._min_length = min(self._min_length, len(voc)) if self._min_length is not None else len(voc)
+        self._max_length = max(self._max_length, len(voc))
+        for delete in get_deletes(voc, self.max_edits(len(voc))):
+            self._index.setdefault(delete, []).append(voc)
+
+    def lookup(self, term):
+        """Closest vocabularies of `term` and their distance"""
+        if term in self._vocs:
+            return [term], 0
+        best, distance = [], self.max_distance + 1
+        if not self.max_distance or len(term) + self.max_distance < self.min_lengths[0]:
+            return best, distance
+        seen = set()
+        for delete in get_deletes(term, self.max_distance):
+            for voc in self._index.get(delete, ()):
+                if voc in seen:
+                    continue
+                seen.add(voc)
+                allowed = self.max_edits(len(voc))
+                value = edit_distance(term, voc, allowed)
+                if value > allowed or value > distance:
+                    continue
+                if value < distance:
+                    best, distance = [], value
+                best.append(voc)
+        return best, distance
+
+    def find_all(self, text):
+        result = []
+        if not self._vocs:
+            return result
+        tokens = [(m.start(), m.end(), m.group(1) is None) for m in self.token_pattern.finditer(text)]
+        # a typo could merge or split tokens
+        max_tokens = self._max_tokens + self.max_distance
+        min_length = self._min_length - self.max_distance
+        max_length = self._max_length + self.max_distance
+        for i, (start, _, punct_start) in enumerate(tokens):
+            for j in xrange(i, min(i + max_tokens, len(tokens))):
+                end, punct_end = tokens[j][1], tokens[j][2]
+                if end - start > max_length:
+                    break
+                if end - start < min_length:
+                    continue
+                term = text[start:end]
+                if punct_start or punct_end:
+                    # punctuation next to a word is not a typo of the word, e.g. `paris,`
+                    if term in self._vocs:
+                        result.append((start, end, term, 0))
+                    continue
+                vocs, distance = self.lookup(term)
+                result.extend((start, end, voc, distance) for voc in vocs)
+        return result
@@ -0,0 +1,31 @@
+"""gunicorn settings, `gunicorn -c gunicorn.conf.py main:app`
+
+The app is loaded and warmed up once in the master (`preload_app`), workers are forked with dictionaries and
+matchers in memory, shared copy-on-write, so workers recycled by `max_requests` start warm. The jitter spreads
+recycling so workers do not restart at the same time.
+
+Each worker serves requests in `threads` threads, tagging requests beyond `MAX_IN_FLIGHT` of a worker wait in its
+queue or are rejected with 429, see `util.admission`. Threads should be more than `MAX_IN_FLIGHT` so that cheap
+requests, e.g. `/health/ready`, are served while tagging requests run.
+
+Workers write their metrics to `METRICS_DIR`, by default `ner-metrics` in the temp directory, so `/metrics` of any
+worker sums all of them, see `util.metrics`.
+"""
+import os
+import tempfile
+
+# before the app is loaded
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'ner-metrics'))
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:1999')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+preload_app = True
+
+
+def post_fork(server, worker):
+    from api import warmup
+    warmup.after_fork()
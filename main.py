@@ -1,4 +1,7 @@
-from api import app
+from api import app, warmup
+
+# before the first request, once in the gunicorn master with `preload_app`
+warmup.run()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8100)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+from abc import ABCMeta, abstractmethod
+from bisect import bisect_left
+from collections import deque
+import re
+
+
+def is_word_char(ch):
+    return ch.isalnum() or ch == u'_'
+
+
+def is_boundary(text, pos):
+    # pos does not split a word, like regex `\b` but also valid next to
+    # punctuation so vocabularies as `c++` or `u.s.` can match
+    before = pos > 0 and is_word_char(text[pos - 1])
+    after = pos < len(text) and is_word_char(text[pos])
+    return not (before and after)
+
+
+def select_spans(spans):
+    """Select non-overlapping spans, longest match wins, then leftmost, ties of the same text are broken by the
+    rest of the span, e.g. dictionary name, so the result does not depend on the order of spans"""
+    selected = []
+    starts = []
+    for span in sorted(spans, key=lambda s: (s[0] - s[1],) + tuple(s)):
+        start, end = span[0], span[1]
+        idx = bisect_left(starts, start)
+        # overlap with the previous selected span
+        if idx > 0 and selected[idx - 1][1] > start:
+            continue
+        # overlap with the next selected span
+        if idx < len(selected) and selected[idx][0] < end:
+            continue
+        starts.insert(idx, start)
+        selected.insert(idx, span)
+    return selected
+
+
+def find_vocs(text, vocs):
+    """Find all occurrences of a few candidate vocabularies, cheaper than compiling a matcher for them"""
+    result = []
+    for voc in vocs:
+        if not voc:
+            continue
+        start = text.find(voc)
+        while start >= 0:
+            end = start + len(voc)
+            if is_boundary(text, start) and is_boundary(text, end):
+                result.append((start, end, voc))
+            start = text.find(voc, start + 1)
+    return result
+
+
+class Matcher(object):
+    __metaclass__ = ABCMeta
+    # whether `find_all` returns overlapping candidates, see `DeltaMatcher`
+    overlapping = True
+
+    @abstractmethod
+    def find_all(self, text):
+        """Return all (start, end, voc) candidates, overlapping included"""
+        pass
+
+    def find(self, text):
+        return select_spans(self.find_all(text))
+
+
+class AhoCorasick(Matcher):
+    """Aho-Corasick automaton over vocabularies, matches are checked on word boundaries"""
+
+    def __init__(self, vocs=()):
+        self._goto = [{}]
+        self._term = [None]
+        self._fail = [0]
+        self._link = [0]
+        self._size = 0
+        for voc in vocs:
+            self.add(voc)
+        self.build()
+
+    def __len__(self):
+        return self._size
+
+    def add(self, voc):
+        if not voc:
+            return
+        node = 0
+        for ch in voc:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._term.append(None)
+                self._fail.append(0)
+                self._link.append(0)
+            node = nxt
+        if self._term[node] is None:
+            self._term[node] = voc
+            self._size += 1
+
+    def build(self):
+        # breadth first to compute failure links and output links (nearest failure state holding a voc)
+        goto, fail, link, term = self._goto, self._fail, self._link, self._term
+        queue = deque()
+        for nxt in goto[0].values():
+            fail[nxt] = 0
+            link[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                fail[nxt] = goto[state].get(ch, 0)
+                link[nxt] = fail[nxt] if term[fail[nxt]] is not None else link[fail[nxt]]
+
+    def find_all(self, text):
+        result = []
+        goto, fail, link, term = self._goto, self._fail, self._link, self._term
+        node = 0
+        for idx, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            state = node if term[node] is not None else link[node]
+            while state:
+                voc = term[state]
+                end = idx + 1
+                start = end - len(voc)
+                if is_boundary(text, start) and is_boundary(text, end):
+                    result.append((start, end, voc))
+                state = link[state]
+        return result
+
+
+class TrieRegex(Matcher):
+    """One compiled regex per vocabulary set, alternation is built from a trie of escaped vocabularies
+    so longer vocabularies are tried first and common prefixes are matched once.
+
+    Alternation is leftmost-first, a single scan would miss a longer match starting inside a shorter one, so
+    `find_all` returns every vocabulary at each position as candidates for `select_spans`, longest match wins
+    as with other matchers. Matching is case sensitive like other matchers, texts are normalized to lower case.
+    """
+
+    # `\b` but also valid next to punctuation, see `is_boundary`
+    boundary = r'(?:(?<!\w)|(?!\w))'
+
+    def __init__(self, vocs=()):
+        trie = {}
+        self._size = 0
+        for voc in vocs:
+            if not voc:
+                continue
+            node = trie
+            for ch in voc:
+                node = node.setdefault(ch, {})
+            if '' not in node:
+                node[''] = True
+                self._size += 1
+        regex = r'%s(?:%s)' % (self.boundary, self._to_regex(trie) if trie else r'(?!)')
+        # longest vocabulary at a position, without the boundary at its end
+        self.pattern = re.compile(regex, re.UNICODE)
+        # positions where a vocabulary starts
+        self._starts = re.compile(r'(?=%s)' % regex, re.UNICODE)
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def _to_regex(cls, node):
+        terminal = '' in node
+        alternatives = []
+        chars = []
+        for ch in sorted(k for k in node if k != ''):
+            child = node[ch]
+            if len(child) == 1 and '' in child:
+                chars.append(re.escape(ch))
+            else:
+                alternatives.append(re.escape(ch) + cls._to_regex(child))
+        if chars:
+            alternatives.append(chars[0] if len(chars) == 1 else '[%s]' % ''.join(chars))
+
+        if len(alternatives) == 1:
+            result = alternatives[0]
+        else:
+            result = '(?:%s)' % '|'.join(alternatives)
+        if terminal:
+            result = '(?:%s)?' % result
+        return result
+
+    def find_all(self, text):
+        result = []
+        for start in self._starts.finditer(text):
+            start = start.start()
+            endpos = len(text)
+            # the longest vocabulary ending before `endpos`, then shorter ones, all are prefixes of the longest
+            match = self.pattern.match(text, start, endpos)
+            while match:
+                end = match.end()
+                if is_boundary(text, end):
+                    result.append((start, end, match.group()))
+                match = self.pattern.match(text, start, end - 1) if end - 1 > start else None
+        return result
+
+    def sub(self, repl, text):
+        """Replace the matches of `find` by `repl`"""
+        parts = []
+        last = 0
+        for start, end, _ in self.find(text):
+            parts.append(text[last:start])
+            parts.append(repl)
+            last = end
+        parts.append(text[last:])
+        return ''.join(parts)
+
+
+class DeltaMatcher(Matcher):
+    """A matcher with vocabularies added or removed since it was built. Added vocabularies are matched by a small
+    matcher built by `factory`, removed ones are filtered out of the candidates of the base matcher, which must
+    return overlapping candidates so a shorter vocabulary is still found when a longer one is removed"""
+    def __init__(self, base, factory, added=(), removed=()):
+        self.base = base
+        self.factory = factory
+        self.added = frozenset(added)
+        self.removed = frozenset(removed)
+        self._added_matcher = factory(self.added) if self.added else None
+
+    def __len__(self):
+        return len(self.base) + len(self.added) - len(self.removed)
+
+    @property
+    def delta_size(self):
+        return len(self.added) + len(self.removed)
+
+    def update(self, added, removed):
+        """New matcher with more changes, `added` must not be in the matcher and `removed` must be in it"""
+        return DeltaMatcher(self.base, self.factory, (self.added - removed) | (added - self.removed),
+                            (self.removed - added) | (removed - self.added))
+
+    def find_all(self, text, *args):
+        result = self.base.find_all(text, *args)
+        if self.removed:
+            result = [match for match in result if match[2] not in self.removed]
+        if self._added_matcher is not None:
+            result.extend(self._added_matcher.find_all(text, *args))
+        return result
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+
+from redis import RedisError
+
+from util.cache import LRUCache
+from util.database import get_redis_conn
+from util.utils import get_logger
+
+# result cache settings, could be overridden by environment variables
+result_cache_size = int(os.environ.get('RESULT_CACHE_SIZE', 100000))
+result_cache_redis = os.environ.get('RESULT_CACHE_REDIS', '').lower() in ('1', 'true', 'yes')
+result_cache_ttl = int(os.environ.get('RESULT_CACHE_TTL', 24 * 3600))
+
+
+class TagResultCache(object):
+    """Cache of tagging results keyed by (normalized text, sorted lookup dics, lang, dictionary versions).
+
+    Results are kept in a process LRU and optionally in Redis to be shared by workers, changing a
+    dictionary bumps its version so results tagged with the previous version are never read again.
+    """
+    def __init__(self, max_size=result_cache_size, use_redis=result_cache_redis, ttl=result_cache_ttl,
+                 version_max_age=5, prefix='ner:tag:2:'):
+        self.logger = get_logger(self.__class__.__name__)
+        self.results = LRUCache(max_size)
+        self.use_redis = use_redis
+        self.ttl = ttl
+        self.version_max_age = version_max_age
+        self.prefix = prefix
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _get_key(self, n_text, dics, lang, versions):
+        key = json.dumps([n_text, sorted(dics), lang, versions])
+        return self.prefix + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def tag(self, dictionary, texts, dics, lang):
+        """Same as `dictionary.tag_langs` of languages in `lang` separated by comma, only texts which are not
+        cached are tagged"""
+        langs = lang.split(',')
+        versions = [dictionary.get_versions(dics, l, self.version_max_age) for l in langs]
+        keys = [self._get_key(dictionary._normalize(text), dics, lang, versions) for text in texts]
+        result = [self.results.get(key) for key in keys]
+
+        missing = [idx for idx, tag in enumerate(result) if tag is None]
+        if missing and self.use_redis:
+            try:
+                values = get_redis_conn().mget([keys[idx] for idx in missing])
+            except RedisError as ex:
+                self.logger.error('Get cached results error: %s' % ex)
+                values = [None] * len(missing)
+            for idx, value in zip(missing, values):
+                if value is not None:
+                    result[idx] = json.loads(value)
+                    self.results.put(keys[idx], result[idx])
+                    self.redis_hits += 1
+        missing = [idx for idx, tag in enumerate(result) if tag is None]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if not missing:
+            return result
+
+        tags = dictionary.tag_langs([texts[idx] for idx in missing], dics, langs)
+        if len(tags) != len(missing):
+            # no dictionary found, e.g. removed since cached results were tagged: all texts are tagged again so the
+            # result is consistent, and not cached
+            if len(missing) == len(texts):
+                return tags
+            return dictionary.tag_langs(texts, dics, langs)
+        # partial results, cut by a deadline, a slow or a failed dictionary, are tagged again next time
+        complete = []
+        for idx, tag in zip(missing, tags):
+            result[idx] = tag
+            if 'timed_out' not in tag and 'failed' not in tag:
+                self.results.put(keys[idx], tag)
+                complete.append(idx)
+        if self.use_redis and complete:
+            try:
+                pipe = get_redis_conn().pipeline(transaction=False)
+                for idx in complete:
+                    pipe.set(keys[idx], json.dumps(result[idx]), ex=self.ttl)
+                pipe.execute()
+            except RedisError as ex:
+                self.logger.error('Set cached results error: %s' % ex)
+        return result
+
+    def clear(self):
+        self.results.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'redis_hits': self.redis_hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / total if total else 0.0,
+            'size': len(self.results),
+            'evictions': self.results.evictions
+        }
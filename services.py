@@ -0,0 +1,19 @@
+import os
+
+from dictionary import make_dictionary
+from result_cache import TagResultCache
+from text_stats import TextStats
+from tokenizer import FastTokenizer
+
+# how texts are tagged: `es`, `aho_corasick`, `regex`, `analyzed`, `compact` or `sharded`, see `make_dictionary`
+tag_engine = os.environ.get('TAG_ENGINE', 'es')
+
+
+class Services(object):
+    """Service objects built once per worker process and shared by all requests"""
+    def __init__(self, dictionary=None, tokenizer=None, result_cache=None):
+        self.tokenizer = tokenizer or FastTokenizer()
+        self.dictionary = dictionary or make_dictionary(tag_engine)
+        self.result_cache = result_cache or TagResultCache()
+        self.text_stats = TextStats(dictionary=self.dictionary, tokenizer=self.tokenizer,
+                                    result_cache=self.result_cache)
@@ -0,0 +1,70 @@
+"""Run a sharded tagging cluster on one machine: tagger nodes and a router, each a process serving `api.app` with
+its own settings, see `shard_router`
+
+Each language of `--langs` gets `--nodes` nodes on the ports after `--port`, which split its dictionaries by name,
+tag in process with `--engine` and warm up their shard. The router listens on `--port`, Elasticsearch is `ES_HOSTS`.
+Metrics of each process are in its own directory under `METRICS_DIR`.
+
+Usage: python shard_local.py --langs english,french --nodes 2 --port 1999
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def serve(port):
+    from api import app, warmup
+    warmup.run()
+    app.run(host='127.0.0.1', port=port, threaded=True, use_reloader=False)
+
+
+def start(port, env):
+    metrics_dir = os.path.join(os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'ner-metrics')),
+                               str(port))
+    env = dict(os.environ, METRICS_DIR=metrics_dir, **env)
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(port)], env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--langs', default='english')
+    parser.add_argument('--nodes', type=int, default=2, help='Nodes per language')
+    parser.add_argument('--port', type=int, default=1999)
+    parser.add_argument('--engine', default='aho_corasick', help='`TAG_ENGINE` of the nodes')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.serve)
+
+    processes = []
+    nodes = []
+    port = args.port + 1
+    try:
+        for lang in [l.strip() for l in args.langs.split(',') if l.strip()]:
+            urls = []
+            for index in range(args.nodes):
+                processes.append(start(port, {'TAG_ENGINE': args.engine, 'WARMUP': 'true', 'WARMUP_LANGS': lang,
+                                              'WARMUP_SHARD': '%s/%s' % (index, args.nodes)}))
+                urls.append('http://127.0.0.1:%s' % port)
+                port += 1
+            nodes.append('%s=%s' % (lang, '|'.join(urls)))
+        print('Nodes: %s' % ','.join(nodes))
+        processes.append(start(args.port, {'TAG_ENGINE': 'sharded', 'SHARD_NODES': ','.join(nodes)}))
+        print('Router: http://127.0.0.1:%s' % args.port)
+        while all(p.poll() is None for p in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in processes:
+            if p.poll() is None:
+                p.terminate()
+        for p in processes:
+            p.wait()
+
+
+if __name__ == '__main__':
+    main()
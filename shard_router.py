@@ -0,0 +1,184 @@
+"""Tagging across nodes which each hold a shard of the dictionaries
+
+`SHARD_NODES` maps languages to tagger nodes, e.g. `english=http://a:1999|http://b:1999,french=http://c:1999,
+*=http://d:1999`, nodes of `*` serve the languages without nodes of their own. A language with several nodes is
+split by a stable hash of the dictionary name, a dictionary is always tagged by the same node, which keeps only its
+shard in memory with an in-process engine (warmed up with `WARMUP_LANGS` and `WARMUP_SHARD`, see `warmup`).
+
+A router is the same app with `TAG_ENGINE=sharded`: `ShardedDictionary` scatters each batch to the nodes of its
+dictionaries through their `/stats/ner/bulk`, concurrently, and merges the spans of each text, longest match wins,
+as `tag_langs`. Dictionaries are managed in Elasticsearch as usual, nodes follow changes by their versions.
+Dictionaries of nodes which do not answer within `SHARD_TIMEOUT` seconds, or the deadline of the request, are listed
+in `timed_out`, dictionaries of nodes which fail or of languages without nodes in `failed`. `shard_local.py` runs
+nodes and a router on one machine.
+"""
+import json
+import os
+from multiprocessing import TimeoutError
+import time
+import urllib
+import zlib
+
+import urllib3
+
+from dictionary import FAILED, TIMED_OUT, DictionaryES
+from matcher import select_spans
+from util.admission import get_deadline
+from util.metrics import metrics
+
+# shard settings, could be overridden by environment variables
+shard_nodes = os.environ.get('SHARD_NODES', '')
+shard_timeout = float(os.environ.get('SHARD_TIMEOUT', 10))
+shard_threads = int(os.environ.get('SHARD_THREADS', 8))
+
+
+def parse_nodes(spec):
+    """{lang: [node url]} of `lang=url|url,lang=url`"""
+    nodes = {}
+    for part in spec.split(','):
+        if '=' not in part:
+            continue
+        lang, urls = part.split('=', 1)
+        urls = [url.strip().rstrip('/') for url in urls.split('|') if url.strip()]
+        if urls:
+            nodes[lang.strip()] = urls
+    return nodes
+
+
+def parse_shard(spec):
+    """(index, count) of `index/count`, None if empty"""
+    if not spec:
+        return None
+    index, count = [int(v) for v in spec.split('/')]
+    if not 0 <= index < count:
+        raise ValueError('Invalid shard: %s' % spec)
+    return index, count
+
+
+def get_shard(dic, count):
+    """Shard of a dictionary among `count` nodes, the same in every process unlike `hash`"""
+    return (zlib.crc32(dic.encode('utf-8')) & 0xffffffff) % count
+
+
+class ShardMap(object):
+    """Nodes of each language, dictionaries of a language with several nodes are split by name"""
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def get_nodes(self, lang):
+        return self.nodes.get(lang) or self.nodes.get('*', [])
+
+    def get_node(self, dic, lang):
+        nodes = self.get_nodes(lang)
+        if not nodes:
+            return None
+        return nodes[get_shard(dic, len(nodes))]
+
+    def route(self, dics, lang):
+        """{node: dictionaries} of dictionaries of a language, dictionaries without a node are left out"""
+        result = {}
+        for dic in dics:
+            node = self.get_node(dic, lang)
+            if node:
+                result.setdefault(node, []).append(dic)
+        return result
+
+
+class ShardedDictionary(DictionaryES):
+    """Tag texts on the nodes of their dictionaries, dictionaries are managed in Elasticsearch"""
+    def __init__(self, shard_map=None, es=None, timeout=shard_timeout, threads=shard_threads):
+        super(ShardedDictionary, self).__init__(es, fanout_threads=threads)
+        self.shard_map = shard_map or ShardMap(parse_nodes(shard_nodes))
+        self.timeout = timeout
+        self._http = None
+        self._http_pid = None
+
+    def _get_http(self):
+        # pooled connections to the nodes, not shared with forked workers
+        if self._http is None or self._http_pid != os.getpid():
+            self._http = urllib3.PoolManager(maxsize=self.fanout_threads)
+            self._http_pid = os.getpid()
+        return self._http
+
+    def tag(self, texts, dics, lang):
+        return self.tag_langs(texts, dics, [lang])
+
+    def tag_batch(self, texts, dics, lang):
+        return self.tag_langs(texts, dics, [lang])
+
+    def _post(self, node, n_texts, dics, lang, timeout):
+        """Spans of each text tagged by `node`, and its `timed_out` and `failed` dictionaries"""
+        query = urllib.urlencode({'lookup': ','.join(dics), 'lang': lang, 'spans': 'true',
+                                  'chunk_size': max(len(n_texts), 1)})
+        body = ''.join(json.dumps({'text': n_text}) + '\n' for n_text in n_texts)
+        response = self._get_http().request('POST', '%s/stats/ner/bulk?%s' % (node, query), body=body,
+                                            headers={'Content-Type': 'application/x-ndjson'},
+                                            timeout=timeout, retries=False)
+        if response.status != 200:
+            raise IOError('HTTP %s' % response.status)
+        results = [json.loads(line) for line in response.data.splitlines() if line.strip()]
+        if len(results) != len(n_texts):
+            raise IOError('%s results of %s texts' % (len(results), len(n_texts)))
+        return results
+
+    def tag_langs(self, texts, dics, langs):
+        """Scatter texts to the nodes of the dictionaries in each language, dictionaries of nodes which answer too
+        late are listed as `timed_out` in each result, dictionaries of nodes which fail or without a node as
+        `failed`"""
+        routes = []
+        unrouted = set()
+        for lang in langs:
+            lang_dics = [self._get_dic_name(idx) for idx in self._get_index_list(dics, lang)]
+            routes.extend((node, lang, node_dics) for node, node_dics in
+                          sorted(self.shard_map.route(lang_dics, lang).items()))
+            unrouted.update(dic for dic in lang_dics if self.shard_map.get_node(dic, lang) is None)
+        if not routes and not unrouted:
+            return []
+        if unrouted:
+            self.logger.error('No node for dictionaries %s of languages %s' % (', '.join(sorted(unrouted)),
+                                                                               ', '.join(langs)))
+        with metrics.timer('normalize'):
+            # nodes normalize texts again, spans of the normalized text need no offsets
+            n_texts = [self._normalize(text) for text in texts]
+
+        deadline = time.time() + self.timeout
+        request_deadline = get_deadline()
+        if request_deadline is not None:
+            deadline = min(deadline, request_deadline.expires_at)
+        timeout = max(deadline - time.time(), 0.001)
+        pool = self._get_pool()
+        post = metrics.bind(self._post)
+        tasks = [(node, node_dics, pool.apply_async(post, (node, n_texts, node_dics, lang, timeout)))
+                 for node, lang, node_dics in routes]
+
+        spans = [[] for _ in n_texts]
+        # dictionaries of each text which timed out or failed
+        incomplete = [{TIMED_OUT: set(), FAILED: set(unrouted)} for _ in n_texts]
+        with metrics.timer('shard_query'):
+            for node, node_dics, task in tasks:
+                try:
+                    results = task.get(max(deadline - time.time(), 0))
+                except (TimeoutError, IOError, ValueError, urllib3.exceptions.HTTPError) as ex:
+                    self.logger.error('Node %s failed to tag %s: %s' % (node, ', '.join(node_dics), ex))
+                    metrics.inc('ner_shard_requests_total', node=node, status='error')
+                    # a refused connection is a `ConnectTimeoutError` too
+                    timed_out = (isinstance(ex, (TimeoutError, urllib3.exceptions.TimeoutError)) and
+                                 not isinstance(ex, urllib3.exceptions.NewConnectionError))
+                    for text_incomplete in incomplete:
+                        text_incomplete[TIMED_OUT if timed_out else FAILED].update(node_dics)
+                    continue
+                metrics.inc('ner_shard_requests_total', node=node, status='ok')
+                for idx, result in enumerate(results):
+                    spans[idx].extend((s['start'], s['end'], s['term'], s['dic']) +
+                                      ((s['distance'],) if 'distance' in s else ()) for s in result.get('spans', ()))
+                    for reason in (TIMED_OUT, FAILED):
+                        incomplete[idx][reason].update(result.get(reason, ()))
+
+        result = []
+        for n_text, text_spans, text_incomplete in zip(n_texts, spans, incomplete):
+            tag = self._build_tag(n_text, select_spans(text_spans), dics)
+            for reason, incomplete_dics in text_incomplete.items():
+                if incomplete_dics:
+                    tag[reason] = sorted(incomplete_dics)
+            result.append(tag)
+        return result
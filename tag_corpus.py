@@ -0,0 +1,131 @@
+"""Tag large corpora offline with a pool of worker processes
+
+Input files are JSON lines (a text string or an object with a text field), CSV with a header row or
+plain text with one document per line, optionally gzip compressed, `-` or no file reads stdin.
+Output is JSON lines with the fields of `TextStats.get_stats`, in the same order as the input. Invalid documents,
+e.g. malformed JSON, are logged with their line number and output as an error record in their place.
+
+Usage: python tag_corpus.py corpus.jsonl.gz -o tagged.jsonl --lookup city,color --workers 8
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from dictionary import make_dictionary
+from text_stats import TextStats
+from util.stream import iter_chunks, iter_lines
+
+_stats = None
+
+
+def _init_worker(engine, lookup, lang):
+    global _stats
+    dictionary = make_dictionary(engine)
+    if engine != 'es':
+        dictionary.preload(lookup, lang)
+    _stats = TextStats(dictionary=dictionary)
+    # load tokenizer state before the first chunk
+    _stats.tokenizer.tokenize('warm up')
+
+
+def _tag_chunk(args):
+    docs, count_only, lookup, lang, spans = args
+    texts = [text for text, error in docs if not error]
+    results = iter(_stats.get_stats(texts, count_only, lookup, lang, spans) if texts else [])
+    return [{'error': True, 'message': error} if error else next(results) for _, error in docs]
+
+
+def get_format(path, fmt):
+    if fmt != 'auto':
+        return fmt
+    name = path[:-3] if path.endswith('.gz') else path
+    ext = os.path.splitext(name)[1].lower()
+    return {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl', '.csv': 'csv'}.get(ext, 'text')
+
+
+def iter_texts(path, fmt, text_field):
+    """(text, error) of each document of a file, error is empty unless the document is invalid"""
+    fileobj = sys.stdin if path == '-' else open(path, 'rb')
+    fmt = get_format(path, fmt)
+    try:
+        lines = iter_lines(getattr(fileobj, 'buffer', fileobj), gzipped=path.endswith('.gz'))
+        if fmt == 'csv':
+            rows = csv.DictReader((line + u'\n').encode('utf-8') for line in lines)
+            for row in rows:
+                yield (row.get(text_field) or '').decode('utf-8', 'ignore').strip().lower(), ''
+        else:
+            for line_no, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                if fmt == 'jsonl':
+                    try:
+                        doc = json.loads(line)
+                        line = doc.get(text_field, '') if isinstance(doc, dict) else doc
+                        line = line.strip()
+                    except (ValueError, AttributeError) as ex:
+                        error = 'Invalid document at %s line %s: %s' % (path, line_no, ex)
+                        sys.stderr.write(error + '\n')
+                        yield '', error
+                        continue
+                yield line.strip().lower(), ''
+    finally:
+        if fileobj is not sys.stdin:
+            fileobj.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='*', default=['-'], help='Input files, `-` for stdin')
+    parser.add_argument('-o', '--output', default='-', help='Output file, `-` for stdout')
+    parser.add_argument('--format', default='auto', choices=['auto', 'jsonl', 'csv', 'text'])
+    parser.add_argument('--text-field', default='text', help='Text field of JSON lines and CSV inputs')
+    parser.add_argument('--count-only', default='', help='Specific string for counting in each text')
+    parser.add_argument('--lookup', default='', help='Dictionaries for tagging, separate by comma, if empty, get all')
+    parser.add_argument('--lang', default='english')
+    parser.add_argument('--engine', default='aho_corasick', choices=['es', 'aho_corasick', 'regex', 'analyzed', 'fuzzy', 'compact'],
+                        help='Tag with Elasticsearch queries or with dictionaries preloaded in each worker')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Number of texts sent to a worker at once')
+    parser.add_argument('--spans', action='store_true', help='Add matched entities with offsets in `text`')
+    args = parser.parse_args()
+
+    lookup = [l.strip().lower() for l in args.lookup.split(',') if l]
+    docs = (doc for path in args.inputs for doc in iter_texts(path, args.format, args.text_field))
+    tasks = ((chunk, args.count_only, lookup, args.lang, args.spans) for chunk in iter_chunks(docs, args.chunk_size))
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    pool = multiprocessing.Pool(args.workers, initializer=_init_worker, initargs=(args.engine, lookup, args.lang))
+    start = last_report = time.time()
+    num_docs = 0
+    num_errors = 0
+    try:
+        # imap keeps results in the same order as input chunks
+        for result in pool.imap(_tag_chunk, tasks):
+            for ret in result:
+                output.write(json.dumps(ret) + '\n')
+            num_docs += len(result)
+            num_errors += sum(1 for ret in result if ret.get('error') is True)
+            now = time.time()
+            if now - last_report >= 5:
+                last_report = now
+                sys.stderr.write('%s docs, %.1f docs/sec\n' % (num_docs, num_docs / (now - start)))
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.time() - start
+    sys.stderr.write('Tagged %s docs, %s invalid, in %.1f sec, %.1f docs/sec with %s workers\n'
+                     % (num_docs, num_errors, elapsed, num_docs / elapsed if elapsed else 0, args.workers))
+
+
+if __name__ == '__main__':
+    main()
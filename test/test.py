@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 import unittest
 
-from dictionary import DictionaryES
+from analyzer import get_analyzer
+from dictionary import DictionaryES, DictionaryLocal
 from pprint import pprint
 
 from text_stats import TextStats
@@ -21,6 +22,14 @@ class MyTestCase(unittest.TestCase):
         d.add_voc(['Schwarz', 'weiß', "gelb", "rot", "grün", "blau", "Orange"], 'color', 'german')
         d.add_voc(['Schwarz', 'weiß', "gelb", "rot", "grün", "blau", "Orange"], 'color', 'abc')
 
+    def test_import_export_vocs(self):
+        d = DictionaryES()
+        success, fail = d.import_voc(('voc %s' % i for i in range(2500)), 'bulk', 'english', batch_size=1000)
+        self.assertEqual((2500, 0), (success, fail))
+        self.assertEqual(2500, len(list(d.export_voc(['bulk'], 'english'))))
+        self.assertEqual((0, 0), d.import_voc(['voc 1', 'Voc  2'], 'bulk', 'english'))
+        d.remove_dic(['bulk'], 'english')
+
     def test_get_vocs(self):
         d = DictionaryES()
         pprint(d.get_voc(['city'], 'english'))
@@ -40,6 +49,48 @@ class MyTestCase(unittest.TestCase):
                     'english')
         self.logger.info(res)
 
+    def test_tag_batch(self):
+        d = DictionaryES()
+        texts = ['hotel in chicAgo', 'a beautiful blue (blau) sky green', 'blue sky in beijing']
+        self.assertEqual(d.tag(texts, ['city', 'color'], 'english'),
+                         d.tag_batch(texts, ['city', 'color'], 'english', chunk_size=2))
+
+    def test_tag_texts_aho_corasick(self):
+        d = DictionaryLocal()
+        texts = ['hotel in chicAgo', 'a beautiful blue (blau) sky green', 'blue sky in beijing']
+        res = d.tag(texts, ['city', 'color'], 'english')
+        self.logger.info(res)
+        self.assertEqual(len(texts), len(res))
+        self.assertEqual('hotel in [city]', res[0]['norm_text'])
+
+    def test_tag_stemmed(self):
+        d = DictionaryES()
+        res = d.tag_batch(['cheap hotels in chicago'], ['city'], 'english')
+        self.assertEqual('cheap hotels in [city]', res[0]['norm_text'])
+        d.add_voc(['hotel'], 'lodging', 'english')
+        res = d.tag_batch(['cheap hotels in chicago'], ['lodging'], 'english')
+        self.assertEqual('cheap [lodging] in chicago', res[0]['norm_text'])
+        d.remove_dic(['lodging'], 'english')
+
+    def test_analyzer_parity(self):
+        # languages with the same stemmer as Elasticsearch must produce the same terms
+        texts = {
+            'english': u"The hotels of John's cities are running generously, ponies caresses",
+            'danish': u'Hotellerne i byerne er billige og smukke',
+            'dutch': u'De hotels in de steden zijn goedkoop en mooi',
+            'finnish': u'Kaupunkien hotellit ovat halpoja ja kauniita',
+            'hungarian': u'A városok szállodái olcsók és szépek',
+            'norwegian': u'Hotellene i byene er billige og vakre',
+            'romanian': u'Hotelurile din orașe sunt ieftine și frumoase',
+            'russian': u'Гостиницы в городах дешевые и красивые',
+            'swedish': u'Hotellen i städerna är billiga och vackra'
+        }
+        d = DictionaryES()
+        for lang, text in texts.items():
+            tokens = d.es.indices.analyze(body={'analyzer': lang, 'text': text})['tokens']
+            terms = [t[2] for t in get_analyzer(lang).tokenize(text.lower()) if t[3]]
+            self.assertEqual([t['token'] for t in tokens], terms, lang)
+
     def test_stats(self):
         stats = TextStats()
         ret = stats.get_stats(['hotel in chicAgo', 'a beautiful blue (blau) sky green', 'blue sky in beijing'], ' ', '', 'english')
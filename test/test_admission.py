@@ -0,0 +1,43 @@
+import threading
+import time
+import unittest
+
+from util.admission import Admission, deadline_scope, expired, get_deadline
+
+
+class AdmissionTestCase(unittest.TestCase):
+    def test_queue(self):
+        admission = Admission(max_in_flight=1, max_queue=0, queue_timeout=0.05)
+        self.assertTrue(admission.acquire())
+        self.assertFalse(admission.acquire())
+        admission.max_queue = 1
+        self.assertFalse(admission.acquire())
+        self.assertEqual({'queue_full': 1, 'queue_timeout': 1}, admission.stats()['rejected'])
+
+        # a queued request gets the slot when it is released
+        admission.queue_timeout = 5
+        threading.Timer(0.02, admission.release).start()
+        with admission.slot() as admitted:
+            self.assertTrue(admitted)
+            self.assertEqual((1, 0), (admission.in_flight, admission.queued))
+        stats = admission.stats()
+        self.assertEqual((0, 2), (stats['in_flight'], stats['admitted']))
+
+    def test_deadline(self):
+        self.assertFalse(expired())
+        with deadline_scope(10) as outer:
+            # the earlier deadline is kept
+            with deadline_scope(20) as inner:
+                self.assertIs(outer, inner)
+            with deadline_scope(0.01) as inner:
+                self.assertIsNot(outer, inner)
+                time.sleep(0.02)
+                self.assertTrue(expired())
+                self.assertTrue(inner.exceeded)
+            self.assertIs(outer, get_deadline())
+            self.assertFalse(expired())
+        self.assertIsNone(get_deadline())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from analyzer import AnalyzedMatcher, get_analyzer
+
+
+class AnalyzerTestCase(unittest.TestCase):
+    def test_stemmed_match(self):
+        matcher = AnalyzedMatcher([u'hotel', u'new york'], 'english')
+        self.assertEqual([(6, 12, u'hotel'), (16, 24, u'new york')], matcher.find_all(u'cheap hotels in new york'))
+
+    def test_punctuation_and_boundary(self):
+        matcher = AnalyzedMatcher([u'c++', u'u.s.', u'york'], 'english')
+        self.assertEqual([(0, 3, u'c++'), (7, 11, u'u.s.')], matcher.find_all(u'c++ in u.s.'))
+        self.assertEqual([], matcher.find_all(u'c is in newyork'))
+
+    def test_stopwords(self):
+        matcher = AnalyzedMatcher([u'the', u'hotel in chicago'], 'english')
+        self.assertEqual(1, len(matcher))
+        self.assertEqual([], matcher.find_all(u'hotel of chicago'))
+        self.assertEqual([(4, 21, u'hotel in chicago')], matcher.find_all(u'the hotels in chicago'))
+
+    def test_possessive_and_elision(self):
+        self.assertEqual([(0, 4, u'john')], AnalyzedMatcher([u'john'], 'english').find_all(u"john's"))
+        self.assertEqual([(2, 8, u'hôtel')], AnalyzedMatcher([u'hôtel'], 'french').find_all(u"l'hôtels"))
+
+    def test_not_stemmed_language(self):
+        analyzer = get_analyzer('abc')
+        self.assertEqual([(0, 6, u'hotels', True)], analyzer.tokenize(u'hotels'))
+
+
+if __name__ == '__main__':
+    unittest.main()
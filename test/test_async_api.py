@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import json
+import urllib
+
+from tornado import httpserver
+from tornado.testing import AsyncHTTPTestCase, bind_unused_port
+
+from async_api import make_app
+from benchmark.fake_es import FakeServer, make_client, make_http_app
+from dictionary import DictionaryES
+from util.async_es import AsyncElasticsearch
+
+
+class AsyncApiTestCase(AsyncHTTPTestCase):
+    """`async_api` against the fake Elasticsearch served over HTTP on the IO loop of the test"""
+    def get_app(self):
+        self.server = FakeServer()
+        self.d = DictionaryES(make_client(self.server))
+        self.d.add_voc(['new york', 'chicago', 'hotel'], 'city', 'english')
+        self.d.add_voc(['blue', 'green'], 'color', 'english')
+        sock, port = bind_unused_port()
+        self.es_server = httpserver.HTTPServer(make_http_app(self.server))
+        self.es_server.add_sockets([sock])
+        return make_app(dictionary=self.d, es=AsyncElasticsearch(hosts=['127.0.0.1:%s' % port]))
+
+    def tearDown(self):
+        self.es_server.stop()
+        super(AsyncApiTestCase, self).tearDown()
+
+    def tag(self, texts, **params):
+        params = dict(params, texts=','.join(texts))
+        response = self.fetch('/stats/ner', method='POST', body=urllib.urlencode(params))
+        return json.loads(response.body)['texts']
+
+    def test_tag(self):
+        texts = ['cheap hotels in new york', 'blue sky', 'nothing here']
+        expected = self.d.tag_batch(texts, [], 'english')
+        result = self.tag(texts, spans='true')
+        self.assertEqual([t['norm_text'] for t in expected], [t['norm_text'] for t in result])
+        self.assertEqual([t['tag'] for t in expected], [t['tag'] for t in result])
+        self.assertEqual([self.d.get_spans(text, t) for text, t in zip(texts, expected)],
+                         [t['spans'] for t in result])
+        self.assertEqual(5, result[0]['num_word'])
+
+    def test_msearch_per_chunk(self):
+        texts = ['hotel %s in chicago' % i for i in range(250)]
+        self.tag(texts[:1], lookup='city,color')
+        requests = self.server.requests
+        result = self.tag(texts, lookup='city,color')
+        # one multi-search per 100 texts whatever the number of dictionaries
+        self.assertEqual(3, self.server.requests - requests)
+        self.assertEqual(['[city] %s in [city]' % i for i in range(250)], [t['norm_text'] for t in result])
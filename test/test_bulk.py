@@ -0,0 +1,53 @@
+import gzip
+import io
+import json
+import unittest
+
+import api
+from benchmark.fake_es import FakeServer, make_client
+from dictionary import DictionaryES
+
+
+class BulkTaggingTestCase(unittest.TestCase):
+    """`/stats/ner/bulk` against the in-process fake Elasticsearch"""
+    def setUp(self):
+        d = DictionaryES(make_client(FakeServer()))
+        d.add_voc(['new york', 'hotel'], 'city', 'english')
+        text_stats = api.services.text_stats
+        self.saved = text_stats.dictionary, text_stats.result_cache
+        text_stats.dictionary, text_stats.result_cache = d, None
+        self.client = api.app.test_client()
+
+    def tearDown(self):
+        api.services.text_stats.dictionary, api.services.text_stats.result_cache = self.saved
+
+    def post(self, body, query='lookup=city', **kwargs):
+        response = self.client.post('/stats/ner/bulk?' + query, data=body, **kwargs)
+        return [json.loads(line) for line in response.data.splitlines()]
+
+    def test_bulk(self):
+        lines = ['"Hotel in New York"', '{not json', '{"id": 7, "text": "new york"}', '', '{"id": 8}',
+                 '{"text": "hotel", "error": "x"}', '{"text": 3}', '"chicago"']
+        results = self.post('\n'.join(lines), 'lookup=city&chunk_size=3')
+        self.assertEqual(['[city] in [city]', None, '[city]', None, '[city]', None, 'chicago'],
+                         [r.get('norm_text') for r in results])
+        self.assertEqual([False, True, False, True, False, True, False], [r.get('error', False) is True
+                                                                          for r in results])
+        self.assertIn('line 2', results[1]['message'])
+        self.assertIn('line 5', results[3]['message'])
+        self.assertEqual([None, None, 7, None, None, None, None], [r.get('id') for r in results])
+
+    def test_gzip(self):
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+            f.write(b'"hotel"\n"new york"\n')
+        results = self.post(buf.getvalue(), headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(['[city]', '[city]'], [r['norm_text'] for r in results])
+
+    def test_chunk_size(self):
+        for chunk_size in ('abc', '0', '-1'):
+            self.assertTrue(self.post('"hotel"', 'chunk_size=' + chunk_size)[0]['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from compact_dictionary import CompactDictionary, write_compact
+from matcher import AhoCorasick
+
+
+class CompactDictionaryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.data_dir, 'city-english.ndic')
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def _write(self, vocs, version=1):
+        write_compact(self.path, vocs, 'city', 'english', version)
+        return CompactDictionary(self.path)
+
+    def test_header(self):
+        compact = self._write([u'new york', u'chicago', u'chicago', u''], version=7)
+        self.assertEqual(('city', 'english', 7, 2), (compact.dic, compact.lang, compact.version, len(compact)))
+        self.assertEqual([u'chicago', u'new york'], list(compact))
+        self.assertTrue(u'chicago' in compact)
+        self.assertFalse(u'chicag' in compact)
+
+    def test_find_all(self):
+        vocs = [u'new york', u'new', u'york', u'a', u'c++', u'u.s.', u'weiß', u'grün']
+        compact = self._write(vocs)
+        automaton = AhoCorasick(vocs)
+        for text in [u'she lives in new york', u'newyork yorker', u'c++ in u.s.', u'weiß - grün', u'a new a', u'']:
+            self.assertEqual(sorted(automaton.find_all(text)), sorted(compact.find_all(text)))
+
+    def test_empty(self):
+        compact = self._write([])
+        self.assertEqual(0, len(compact))
+        self.assertEqual([], compact.find_all(u'new york'))
+
+
+if __name__ == '__main__':
+    unittest.main()
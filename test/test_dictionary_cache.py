@@ -0,0 +1,134 @@
+import json
+import unittest
+
+from change_feed import ChangeFeed
+from dictionary_cache import DictionaryCache, IndexCatalog
+from matcher import DeltaMatcher
+from util.cache import LRUCache
+
+
+class VersionStore(object):
+    def __init__(self):
+        self.versions = {}
+
+    def get_versions(self, keys):
+        return dict((key, self.versions.get(key, 0)) for key in keys)
+
+
+class Indices(object):
+    def __init__(self, names):
+        self.names = names
+        self.calls = 0
+
+    def get_alias(self, index):
+        self.calls += 1
+        return dict((name, {}) for name in self.names)
+
+
+class ES(object):
+    def __init__(self, names):
+        self.indices = Indices(names)
+
+
+class DictionaryCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loaded = []
+        self.vocs = {('city', 'english'): ['chicago', 'new york'], ('color', 'english'): ['blue']}
+        self.version_store = VersionStore()
+
+    def _load(self, dic, lang):
+        self.loaded.append((dic, lang))
+        return self.vocs[(dic, lang)]
+
+    def test_hit_miss_reload(self):
+        cache = DictionaryCache(check_interval=0)
+        keys = [('city', 'english')]
+        snapshot = cache.get_snapshots(keys, self._load, self.version_store)[keys[0]]
+        self.assertEqual({'chicago', 'new york'}, snapshot.vocs)
+        cache.get_snapshots(keys, self._load, self.version_store)
+        self.assertEqual(1, len(self.loaded))
+
+        self.version_store.versions[keys[0]] = 2
+        self.vocs[keys[0]] = ['chicago']
+        snapshot = cache.get_snapshots(keys, self._load, self.version_store)[keys[0]]
+        self.assertEqual({'chicago'}, snapshot.vocs)
+        self.assertEqual(2, snapshot.version)
+        self.assertEqual({'hits': 1, 'misses': 1, 'reloads': 1}, dict((k, v) for k, v in cache.stats().items()
+                                                                      if k in ('hits', 'misses', 'reloads')))
+
+    def test_apply_change(self):
+        cache = DictionaryCache()
+        key = ('city', 'english')
+        self.version_store.versions[key] = 3
+        snapshot = cache.get_snapshots([key], self._load, self.version_store)[key]
+        automaton = snapshot.get_matcher('aho_corasick')
+        snapshot.get_matcher('regex')
+
+        self.assertTrue(cache.apply_change('city', 'english', 'add', [u'boston', u'chicago'], 4))
+        self.assertTrue(cache.apply_change('city', 'english', 'remove', [u'new york'], 5))
+        self.assertTrue(cache.apply_change('city', 'english', 'add', [u'new york', u'york'], 6))
+        # already applied
+        self.assertTrue(cache.apply_change('city', 'english', 'remove', [u'boston'], 6))
+        self.assertEqual(6, snapshot.version)
+        self.assertEqual({'chicago', 'new york', 'boston', 'york'}, snapshot.vocs)
+        self.assertEqual(4, cache.snapshots.total_weight)
+        matcher = snapshot.get_matcher('aho_corasick')
+        self.assertIsInstance(matcher, DeltaMatcher)
+        self.assertIs(automaton, matcher.base)
+        self.assertEqual({'boston', 'york'}, matcher.added)
+        text = u'boston, new york, chicago'
+        self.assertEqual(sorted(snapshot.get_matcher('regex').find(text)), sorted(matcher.find(text)))
+        self.assertEqual(1, len(self.loaded))
+
+        # a missed change reloads the dictionary
+        self.assertFalse(cache.apply_change('city', 'english', 'add', [u'denver'], 8))
+        self.assertEqual(1, cache.stats()['gaps'])
+        self.assertNotIn(key, cache.snapshots)
+
+    def test_change_feed(self):
+        cache = DictionaryCache()
+        feed = ChangeFeed(cache, enabled=False)
+        key = ('city', 'english')
+        snapshot = cache.get_snapshots([key], self._load, self.version_store)[key]
+        feed.handle(json.dumps({'dic': 'city', 'lang': 'english', 'op': 'add', 'terms': ['boston'], 'seq': 1}))
+        feed.handle('not json')
+        self.assertEqual({'chicago', 'new york', 'boston'}, snapshot.vocs)
+        feed.handle(json.dumps({'dic': 'city', 'lang': 'english', 'op': 'reload', 'terms': [], 'seq': 2}))
+        self.assertEqual(2, feed.received)
+        self.assertNotIn(key, cache.snapshots)
+
+    def test_lru_eviction(self):
+        cache = DictionaryCache(max_vocs=2)
+        cache.get_snapshots([('city', 'english')], self._load, self.version_store)
+        cache.get_snapshots([('color', 'english')], self._load, self.version_store)
+        self.assertEqual([('color', 'english')], cache.snapshots.keys())
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_index_catalog(self):
+        es = ES(['dic-city-english', 'dic-color-english', 'dic-city-french'])
+        catalog = IndexCatalog(es, ttl=60, min_reload_interval=60)
+        self.assertTrue(catalog.exists('dic-city-english'))
+        self.assertFalse(catalog.exists('dic-fruit-english'))
+        self.assertEqual(['dic-city-english', 'dic-color-english'], catalog.match('dic-*-english'))
+        self.assertEqual(1, es.indices.calls)
+
+        catalog.add('dic-fruit-english')
+        catalog.discard('dic-city-english')
+        self.assertEqual(['dic-color-english', 'dic-fruit-english'], catalog.match('dic-*-english'))
+
+        # a missing name reloads once the catalog is older than min_reload_interval
+        catalog.min_reload_interval = 0
+        self.assertTrue(catalog.exists('dic-city-english'))
+        self.assertEqual(2, es.indices.calls)
+
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(['a', 'c'], cache.keys())
+
+
+if __name__ == '__main__':
+    unittest.main()
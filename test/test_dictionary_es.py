@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import socket
+import time
+import unittest
+
+from elasticsearch import Elasticsearch
+
+from benchmark.fake_es import FakeServer, make_client
+from dictionary import DictionaryES, DictionaryLocal
+from dictionary_cache import dictionary_cache
+from result_cache import TagResultCache
+from text_stats import TextStats
+from util.admission import deadline_scope
+
+
+class DictionaryESTestCase(unittest.TestCase):
+    """`DictionaryES` against the in-process fake Elasticsearch"""
+    def setUp(self):
+        self.server = FakeServer()
+        self.es = make_client(self.server)
+        self.d = DictionaryES(self.es)
+        self.d.add_voc(['new york', 'Chicago', 'hotel'], 'city', 'english')
+        self.d.add_voc(['blue', 'green'], 'color', 'english')
+        dictionary_cache.clear()
+
+    def test_add_get_remove(self):
+        self.assertEqual((1, 0), self.d.add_voc(['new york', 'boston'], 'city', 'english'))
+        self.assertEqual({'new york', 'chicago', 'hotel', 'boston'}, set(self.d.get_voc(['city'], 'english')[0]['vocs']))
+        self.assertEqual((1, 0), self.d.remove_voc('city', ['boston'], 'english'))
+        self.assertFalse(self.d.remove_dic(['color'], 'english')[0]['error'])
+        self.assertTrue(self.d.remove_dic(['color'], 'english')[0]['error'])
+        self.assertEqual(['city'], [dic['dic'] for dic in self.d.get_voc([], 'english')])
+
+    def test_stale_catalog(self):
+        # another instance removes a dictionary its catalog still lists
+        other = DictionaryES(self.es)
+        self.assertEqual(['[city]'], [t['norm_text'] for t in other.tag(['chicago'], ['city'], 'english')])
+        self.d.remove_dic(['city'], 'english')
+        self.assertEqual((1, 0), other.add_voc(['boston'], 'city', 'english'))
+        DictionaryES(self.es).remove_dic(['city'], 'english')
+        self.assertEqual((2, 0), other.import_voc(['denver', 'austin'], 'city', 'english'))
+        self.assertEqual(['austin', 'denver'], sorted(other.get_voc(['city'], 'english')[0]['vocs']))
+        # created with its mapping, not by the bulk request
+        self.assertEqual('english', self.server.indices['dic-city-english'].analyzers.get('voc'))
+
+    def test_voc_page(self):
+        self.d.add_voc(['new delhi', 'newark', 'boston'], 'city', 'english')
+        pages = self.d.get_voc_page(['city', 'color'], 'english', size=4)
+        self.assertEqual([('city', ['boston', 'chicago', 'hotel', 'new delhi'], 'new delhi'),
+                          ('color', ['blue', 'green'], '')], [(p['dic'], p['vocs'], p['next']) for p in pages])
+        page = self.d.get_voc_page(['city'], 'english', size=4, after=pages[0]['next'])[0]
+        self.assertEqual((['new york', 'newark'], ''), (page['vocs'], page['next']))
+        page = self.d.get_voc_page(['city'], 'english', size=2, prefix='NEW')[0]
+        self.assertEqual((['new delhi', 'new york'], 'new york'), (page['vocs'], page['next']))
+
+        requests = self.server.requests
+        self.assertEqual([{'dic': 'city', 'num_voc': 6}, {'dic': 'color', 'num_voc': 2}],
+                         self.d.count_voc([], 'english'))
+        self.assertEqual([{'dic': 'city', 'num_voc': 3}], self.d.count_voc(['city'], 'english', prefix='new'))
+        self.assertEqual(2, self.server.requests - requests)
+
+    def test_tag(self):
+        texts = ['cheap hotels in New York', 'blue sky']
+        expected = ['cheap [city] in [city]', '[color] sky']
+        self.assertEqual(expected, [t['norm_text'] for t in self.d.tag(texts, ['city', 'color'], 'english')])
+        self.assertEqual(expected, [t['norm_text'] for t in self.d.tag_batch(texts, [], 'english')])
+        local = DictionaryLocal(matcher='analyzed', es=self.es)
+        self.assertEqual(expected, [t['norm_text'] for t in local.tag_batch(texts, ['city', 'color'], 'english')])
+
+    def test_spans(self):
+        self.d.add_voc(['new york', 'york'], 'state', 'english')
+        text = u'  Cheap HOTELS in \t New  York, York '
+        stats = TextStats(dictionary=self.d).get_stats([text], '', ['city', 'state'], 'english', spans=True)[0]
+        self.assertEqual('cheap [city] in [city], [state]', stats['norm_text'])
+        self.assertEqual([(u'HOTELS', 'city', 'hotel'), (u'New  York', 'city', 'new york'), (u'York', 'state', 'york')],
+                         [(text[s['start']:s['end']], s['dic'], s['term']) for s in stats['spans']])
+        self.assertNotIn('spans', TextStats(dictionary=self.d).get_stats([text], '', ['city'], 'english')[0])
+
+    def test_fuzzy(self):
+        local = DictionaryLocal(matcher='fuzzy', es=self.es)
+        tag = local.tag([u'Chicgao hotel in new yrok, bleu'], ['city', 'color'], 'english')[0]
+        self.assertEqual('[city] [city] in [city], bleu', tag['norm_text'])
+        self.assertEqual([(u'chicago', 1), (u'hotel', 0), (u'new york', 1)],
+                         [(s['term'], s['distance']) for s in tag['spans']])
+        self.assertEqual(['chicago', 'hotel', 'new york'], sorted(tag['tag']['city']['matches']))
+
+    def test_fanout(self):
+        self.d.add_voc([u'hôtel', u'bleu'], 'lodging', 'french')
+        d = DictionaryES(self.es, fanout_threads=4)
+        texts = [u'hotels and hôtels in New York', u'bleu blue']
+        expected = ['[city] and [lodging] in [city]', '[lodging] [color]']
+        self.assertEqual(expected, [t['norm_text'] for t in d.tag_langs(texts, [], ['english', 'french'])])
+        self.assertEqual(expected, [t['norm_text'] for t in self.d.tag_langs(texts, [], ['english', 'french'])])
+        self.assertEqual([u'[city] and hôtels in [city]', u'bleu [color]'],
+                         [t['norm_text'] for t in d.tag_batch(texts, [], 'english')])
+
+        # slow dictionaries are left out
+        d.fanout_timeout = 0.05
+        self.server.latency = 0.2
+        tags = d.tag_langs(texts, ['city'], ['english', 'french'])
+        self.assertEqual(['city'], tags[0]['timed_out'])
+        self.assertEqual(texts[0].lower(), tags[0]['norm_text'])
+
+    def test_deadline(self):
+        texts = ['hotel in chicago', 'blue hotel', 'new york']
+        self.server.latency = 0.05
+        with deadline_scope(0.01) as deadline:
+            tags = self.d.tag(texts, ['city'], 'english')
+        self.assertTrue(deadline.exceeded)
+        self.assertEqual((3, ['city']), (len(tags), tags[-1]['timed_out']))
+        self.assertEqual('new york', tags[-1]['norm_text'])
+
+        # texts of the chunks after the deadline are not searched
+        with deadline_scope(0.01):
+            tags = self.d.tag_batch(texts, ['city'], 'english', chunk_size=1)
+        self.assertEqual(['[city] in [city]', 'blue hotel', 'new york'], [t['norm_text'] for t in tags])
+        self.assertEqual([False, True, True], ['timed_out' in t for t in tags])
+
+        # partial results are not cached
+        self.server.latency = 0
+        stats = TextStats(dictionary=self.d, result_cache=TagResultCache())
+        with deadline_scope(0.0001):
+            time.sleep(0.001)
+            self.assertEqual(['*'], stats.get_stats(texts, '', [], 'english')[0]['timed_out'])
+        self.assertNotIn('timed_out', stats.get_stats(texts, '', [], 'english')[0])
+
+    def test_failed_search(self):
+        texts = ['hotel in chicago', 'blue sky']
+        self.server.fail('_search', 500)
+        self.assertEqual([['city'], None], [t.get('failed') for t in self.d.tag(texts, ['city'], 'english')])
+        d = DictionaryES(self.es, fanout_threads=2)
+        self.server.fail('_msearch', 500, times=2)
+        self.assertEqual([['city', 'color']] * 2, [t.get('failed') for t in d.tag_langs(texts, [], ['english'])])
+
+        # failed results are not cached
+        stats = TextStats(dictionary=self.d, result_cache=TagResultCache())
+        self.server.fail('_msearch', 500)
+        self.assertEqual([['*']] * 2, [t.get('failed') for t in stats.get_stats(texts, '', [], 'english')])
+        tags = stats.get_stats(texts, '', [], 'english')
+        self.assertEqual(['[city] in [city]', '[color] sky'], [t['norm_text'] for t in tags])
+        self.assertEqual([None, None], [t.get('failed') for t in tags])
+
+    def test_import_export_versions(self):
+        version = dict(self.d.get_versions(['city'], 'english'))['city']
+        self.assertEqual((2500, 0), self.d.import_voc(('voc %s' % i for i in range(2500)), 'city', 'english',
+                                                      batch_size=1000))
+        self.assertEqual(2503, len(list(self.d.export_voc(['city'], 'english'))))
+        self.assertEqual(version + 1, dict(self.d.get_versions(['city'], 'english'))['city'])
+        self.assertEqual({}, self.server.scrolls)
+
+
+class HungServerTestCase(unittest.TestCase):
+    """Searches bound to a deadline against a server which accepts connections and never answers"""
+    def setUp(self):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        es = Elasticsearch(hosts=[{'host': '127.0.0.1', 'port': self.sock.getsockname()[1]}],
+                           max_retries=3, retry_on_timeout=True)
+        self.d = DictionaryES(es)
+        self.d.catalog.set_indices(['dic-city-english'])
+
+    def tearDown(self):
+        self.sock.close()
+
+    def tag_within_deadline(self, tag, *args):
+        start = time.time()
+        with deadline_scope(0.5):
+            tags = tag(*args)
+        self.assertLess(time.time() - start, 1)
+        return tags
+
+    def test_not_retried(self):
+        tags = self.tag_within_deadline(self.d.tag, ['new york'], ['city'], 'english')
+        self.assertEqual(['city'], tags[0]['timed_out'])
+        tags = self.tag_within_deadline(self.d.tag_batch, ['new york', 'chicago'], ['city'], 'english')
+        self.assertEqual([['city'], ['city']], [t['timed_out'] for t in tags])
+        self.d.fanout_threads = 2
+        tags = self.tag_within_deadline(self.d.tag_langs, ['new york'], ['city'], ['english'])
+        self.assertEqual(['city'], tags[0]['timed_out'])
+
+if __name__ == '__main__':
+    unittest.main()
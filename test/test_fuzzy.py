@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from fuzzy import FuzzyMatcher, edit_distance
+
+
+class FuzzyMatcherTestCase(unittest.TestCase):
+    def test_edit_distance(self):
+        self.assertEqual(0, edit_distance(u'paris', u'paris', 2))
+        self.assertEqual(1, edit_distance(u'paris', u'pairs', 2))
+        self.assertEqual(1, edit_distance(u'london', u'londn', 2))
+        self.assertEqual(2, edit_distance(u'new york', u'nwe yrok', 2))
+        self.assertEqual(3, edit_distance(u'berlin', u'madrid', 2))
+
+    def test_find(self):
+        matcher = FuzzyMatcher([u'new york', u'paris', u'rome', u'san francisco'], max_distance=1)
+        text = u'from new yrok to pariss, rone and sna fransisco'
+        self.assertEqual([(5, 13, u'new york', 1), (17, 23, u'paris', 1)], matcher.find(text))
+        # 2 edits are allowed from 9 characters
+        matcher = FuzzyMatcher([u'new york', u'san francisco'], max_distance=2)
+        self.assertEqual([(5, 13, u'new york', 1), (34, 47, u'san francisco', 2)], matcher.find(text))
+        self.assertEqual([(0, 8, u'newyork', 1)], FuzzyMatcher([u'newyork']).find(u'new york'))
+
+    def test_closest(self):
+        matcher = FuzzyMatcher([u'berlin', u'berlia', u'berlins'], max_distance=1)
+        self.assertEqual([(0, 6, u'berlin', 0)], matcher.find_all(u'berlin'))
+        self.assertEqual(([u'berlin', u'berlins'], 1), matcher.lookup(u'berlinn'))
+
+    def test_punctuation(self):
+        matcher = FuzzyMatcher([u'paris', u'c++'], max_distance=1)
+        self.assertEqual([(0, 5, u'paris', 0), (7, 10, u'c++', 0)], matcher.find(u'paris, c++ c+'))
+
+
+if __name__ == '__main__':
+    unittest.main()
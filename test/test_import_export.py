@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import json
+import unittest
+
+import api
+from benchmark.fake_es import FakeServer, make_client
+from dictionary import DictionaryES
+
+
+def gzip_bytes(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+class ImportExportTestCase(unittest.TestCase):
+    """Streaming import and export of dictionaries against the in-process fake Elasticsearch"""
+    def setUp(self):
+        self.server = FakeServer()
+        self.d = DictionaryES(make_client(self.server))
+        self.dictionary = api.services.dictionary
+        api.services.dictionary = self.d
+        self.client = api.app.test_client()
+
+    def tearDown(self):
+        api.services.dictionary = self.dictionary
+
+    def test_iter_import(self):
+        stats = list(self.d.iter_import_voc((u'voc %s' % i for i in range(250)), 'bulk', 'english', batch_size=100))
+        self.assertEqual([1, 2, 3], [s['batch'] for s in stats])
+        self.assertEqual({'batch': 3, 'success': 250, 'fail': 0, 'skip': 0}, stats[-1])
+        # normalized vocabularies already in the dictionary, and empty lines, are skipped
+        stats = list(self.d.iter_import_voc([u'VOC  1', u'voc 2', u'', u'new voc'], 'bulk', 'english'))
+        self.assertEqual({'batch': 1, 'success': 1, 'fail': 0, 'skip': 3}, stats[-1])
+        self.assertEqual(251, len(list(self.d.export_voc(['bulk'], 'english'))))
+
+    def test_import_endpoint(self):
+        body = u'new york\nchicago\n\nhôtel'.encode('utf-8')
+        response = self.client.put('/dictionary/import?dic=city&lang=english&batch_size=2', data=body)
+        stats = [json.loads(line) for line in response.data.splitlines()]
+        self.assertEqual([(1, 2), (2, 3)], [(s['batch'], s['success']) for s in stats])
+
+        # gzip compressed body, and uploaded gzip file
+        response = self.client.put('/dictionary/import?dic=city', data=gzip_bytes(b'boston\nchicago'),
+                                   headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(1, json.loads(response.data.splitlines()[-1])['success'])
+        response = self.client.put('/dictionary/import?dic=city',
+                                   data={'file': (io.BytesIO(gzip_bytes(b'denver')), 'cities.txt.gz')})
+        self.assertEqual(1, json.loads(response.data.splitlines()[-1])['success'])
+        self.assertTrue(json.loads(self.client.put('/dictionary/import').data)['error'])
+        for batch_size in ('abc', '0', '-1'):
+            response = self.client.put('/dictionary/import?dic=city&batch_size=' + batch_size, data=b'boston')
+            self.assertTrue(json.loads(response.data)['error'])
+
+    def test_export_endpoint(self):
+        self.d.add_voc([u'new york', u'hôtel'], 'city', 'english')
+        response = self.client.get('/dictionary/export?dic=city&lang=english')
+        self.assertEqual({u'new york', u'hôtel'}, set(response.data.decode('utf-8').splitlines()))
+        self.assertEqual('', self.client.get('/dictionary/export?dic=missing').data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from matcher import AhoCorasick, DeltaMatcher, TrieRegex, find_vocs, select_spans
+
+
+class AhoCorasickTestCase(unittest.TestCase):
+    def test_find_all(self):
+        automaton = AhoCorasick([u'new york', u'york', u'he', u'she', u'hers'])
+        spans = automaton.find_all(u'she lives in new york')
+        self.assertEqual([(0, 3, u'she'), (13, 21, u'new york'), (17, 21, u'york')], spans)
+
+    def test_word_boundary(self):
+        automaton = AhoCorasick([u'york', u'c++', u'u.s.'])
+        self.assertEqual([], automaton.find_all(u'newyork yorker'))
+        self.assertEqual([(0, 3, u'c++'), (7, 11, u'u.s.')], automaton.find_all(u'c++ in u.s.'))
+
+    def test_unicode(self):
+        automaton = AhoCorasick([u'weiß', u'grün'])
+        self.assertEqual([(0, 4, u'weiß'), (7, 11, u'grün')], automaton.find_all(u'weiß - grün'))
+
+    def test_find_vocs(self):
+        vocs = [u'new york', u'york', u'c++']
+        self.assertEqual(sorted(AhoCorasick(vocs).find_all(u'new york c++ york newyork')),
+                         sorted(find_vocs(u'new york c++ york newyork', vocs)))
+
+    def test_select_spans(self):
+        spans = [(0, 3, u'new'), (0, 8, u'new york'), (4, 8, u'york'), (9, 12, u'bar')]
+        self.assertEqual([(0, 8, u'new york'), (9, 12, u'bar')], select_spans(spans))
+
+
+class DeltaMatcherTestCase(unittest.TestCase):
+    def test_find_all(self):
+        matcher = DeltaMatcher(AhoCorasick([u'new york', u'york']), AhoCorasick, [u'new'], [u'new york'])
+        self.assertEqual([(4, 8, u'york'), (0, 3, u'new')], matcher.find_all(u'new york'))
+        # removing an added vocabulary and adding back a removed one leave the base matcher only
+        matcher = matcher.update({u'new york'}, {u'new'})
+        self.assertEqual(0, matcher.delta_size)
+        self.assertEqual(2, len(matcher))
+        self.assertEqual([(0, 8, u'new york')], matcher.find(u'new york'))
+
+
+class TrieRegexTestCase(unittest.TestCase):
+    def test_find(self):
+        pattern = TrieRegex([u'new', u'new york', u'york', u'c++', u'u.s.', u'weiß'])
+        spans = pattern.find(u'new york, newyork, c++ in u.s. weiß new New')
+        self.assertEqual([(0, 8, u'new york'), (19, 22, u'c++'), (26, 30, u'u.s.'), (31, 35, u'weiß'),
+                          (36, 39, u'new')], spans)
+        self.assertEqual(u'[dic], newyork', pattern.sub(u'[dic]', u'new york, newyork'))
+
+    def test_longest_match(self):
+        # a longer match starting inside the leftmost one wins
+        pattern = TrieRegex([u'new', u'new york', u'york city'])
+        self.assertEqual([(0, 8, u'new york'), (0, 3, u'new'), (4, 13, u'york city')],
+                         pattern.find_all(u'new york city'))
+        self.assertEqual([(0, 3, u'new'), (4, 13, u'york city')], pattern.find(u'new york city'))
+
+    def test_same_as_aho_corasick(self):
+        vocs = [u'a', u'ab', u'abc', u'b', u'bc', u'c d', u'd']
+        text = u'a ab abc b bc c d abcd'
+        self.assertEqual(AhoCorasick(vocs).find(text), TrieRegex(vocs).find(text))
+
+    def test_empty(self):
+        self.assertEqual([], TrieRegex([]).find_all(u'new york'))
+
+
+if __name__ == '__main__':
+    unittest.main()
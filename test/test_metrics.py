@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from util.database import get_es_operation
+from util.metrics import COUNT_BUCKETS, Metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_render(self):
+        m = Metrics(self.directory, flush_interval=0)
+        m.inc('ner_es_requests_total', op='search')
+        m.inc('ner_es_requests_total', 2, op='search')
+        m.observe('ner_texts_per_request', 3, COUNT_BUCKETS)
+        m.observe('ner_texts_per_request', 2000, COUNT_BUCKETS)
+        lines = m.render().splitlines()
+        self.assertIn('# TYPE ner_es_requests_total counter', lines)
+        self.assertIn('ner_es_requests_total{op="search"} 3', lines)
+        self.assertIn('ner_texts_per_request_bucket{le="2.0"} 0', lines)
+        self.assertIn('ner_texts_per_request_bucket{le="5.0"} 1', lines)
+        self.assertIn('ner_texts_per_request_bucket{le="+Inf"} 2', lines)
+        self.assertIn('ner_texts_per_request_sum 2003.0', lines)
+        self.assertIn('ner_worker_processes 1', lines)
+
+    def test_request_scope(self):
+        m = Metrics(self.directory, flush_interval=0)
+        m.begin_request()
+        with m.timer('es_query'):
+            m.inc('ner_es_requests_total', op='msearch')
+        with m.timer('es_query'):
+            pass
+        profile = m.scope.to_dict()
+        self.assertEqual(2, profile['stages']['es_query']['count'])
+        self.assertEqual({'ner_es_requests_total': 1}, profile['counters'])
+        m.end_request('/stats/ner', 'POST', 200)
+        self.assertIsNone(m.scope)
+        self.assertIn('ner_es_requests_per_request_sum{endpoint="/stats/ner"} 1.0', m.render().splitlines())
+
+    def test_workers(self):
+        # workers of the same master are summed
+        m = Metrics(self.directory, flush_interval=0)
+        for worker in range(3):
+            pid = os.fork()
+            if not pid:
+                m.inc('ner_hits_scanned_total', 10)
+                if worker == 2:
+                    with open(os.path.join(self.directory, 'metrics.txt'), 'w') as f:
+                        f.write(m.render())
+                else:
+                    m.flush()
+                os._exit(0)
+            os.waitpid(pid, 0)
+        with open(os.path.join(self.directory, 'metrics.txt')) as f:
+            lines = f.read().splitlines()
+        self.assertIn('ner_hits_scanned_total 30', lines)
+        self.assertIn('ner_worker_processes 3', lines)
+
+    def test_without_directory(self):
+        m = Metrics('', flush_interval=0.01)
+        m.inc('ner_hits_scanned_total', 10)
+        lines = m.render().splitlines()
+        self.assertIn('ner_hits_scanned_total 10', lines)
+        self.assertIn('ner_worker_processes 1', lines)
+        self.assertFalse([t for t in threading.enumerate() if t.name == 'metrics-flush'])
+
+    def test_prune(self):
+        # snapshots of a master which has exited are removed, the ones of the current master are kept
+        pid = os.fork()
+        if not pid:
+            os._exit(0)
+        os.waitpid(pid, 0)
+        stale = os.path.join(self.directory, '%s-%s.json' % (pid, pid + 1))
+        current = os.path.join(self.directory, '%s-%s.json' % (os.getppid(), pid))
+        for path in (stale, current):
+            with open(path, 'w') as f:
+                f.write('{"counters": [], "histograms": []}')
+        Metrics(self.directory, flush_interval=0).prune()
+        self.assertEqual([os.path.basename(current)], os.listdir(self.directory))
+
+    def test_es_operation(self):
+        self.assertEqual('search', get_es_operation('GET', '/dic-*-english/vocab/_search?scroll=5m'))
+        self.assertEqual('scroll', get_es_operation('GET', '/_search/scroll'))
+        self.assertEqual('msearch', get_es_operation('POST', '/_msearch'))
+        self.assertEqual('head', get_es_operation('HEAD', '/dic-city-english'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+from dictionary import Dictionary
+from result_cache import TagResultCache
+
+
+class CountingDictionary(Dictionary):
+    def __init__(self):
+        self.tagged = []
+        self.version = 1
+        self.removed = False
+
+    def add_voc(self, vocs, dic, lang):
+        self.version += 1
+
+    def get_voc(self, dics, lang):
+        return []
+
+    def get_versions(self, dics, lang, max_age=0):
+        return tuple((dic, self.version) for dic in sorted(dics))
+
+    def tag(self, texts, dics, lang):
+        self.tagged.extend(texts)
+        if self.removed:
+            return []
+        return [{'norm_text': self._normalize(text), 'tag': {}} for text in texts]
+
+
+class TagResultCacheTestCase(unittest.TestCase):
+    def test_cache(self):
+        cache = TagResultCache(use_redis=False)
+        d = CountingDictionary()
+        cache.tag(d, ['Hotel in  Chicago', 'blue sky'], ['city'], 'english')
+        res = cache.tag(d, ['hotel in chicago', 'red sky', 'blue sky'], ['city'], 'english')
+        self.assertEqual(['hotel in chicago', 'red sky', 'blue sky'], [r['norm_text'] for r in res])
+        self.assertEqual(['Hotel in  Chicago', 'blue sky', 'red sky'], d.tagged)
+        self.assertEqual({'hits': 2, 'misses': 3}, dict((k, v) for k, v in cache.stats().items()
+                                                        if k in ('hits', 'misses')))
+
+    def test_invalidate_on_version(self):
+        cache = TagResultCache(use_redis=False)
+        d = CountingDictionary()
+        cache.tag(d, ['blue sky'], ['color'], 'english')
+        cache.tag(d, ['blue sky'], ['city'], 'english')
+        d.add_voc(['sky'], 'color', 'english')
+        cache.tag(d, ['blue sky'], ['color'], 'english')
+        self.assertEqual(3, len(d.tagged))
+
+    def test_removed_dictionary(self):
+        cache = TagResultCache(use_redis=False)
+        d = CountingDictionary()
+        cache.tag(d, ['blue sky'], ['color'], 'english')
+        # versions are still the cached ones
+        d.removed = True
+        self.assertEqual([], cache.tag(d, ['blue sky', 'red sky'], ['color'], 'english'))
+        self.assertEqual(['blue sky', 'red sky', 'blue sky', 'red sky'], d.tagged)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+from werkzeug.serving import make_server
+
+import api
+from benchmark.fake_es import FakeServer, make_client
+from dictionary import DictionaryES, DictionaryLocal
+from dictionary_cache import dictionary_cache
+from shard_router import ShardMap, ShardedDictionary, get_shard, parse_nodes, parse_shard
+
+
+class ShardRouterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer()
+        self.es = make_client(self.server)
+        self.d = DictionaryES(self.es)
+        self.d.add_voc(['new york', 'chicago'], 'city', 'english')
+        self.d.add_voc(['blue', 'green'], 'color', 'english')
+        self.d.add_voc(['hotel'], 'lodging', 'english')
+        self.d.add_voc([u'hôtel', u'bleu'], 'lodging', 'french')
+        dictionary_cache.clear()
+
+    def test_shard_map(self):
+        nodes = parse_nodes('english=http://a:1999/|http://b:1999, *=http://c:1999,french=')
+        self.assertEqual({'english': ['http://a:1999', 'http://b:1999'], '*': ['http://c:1999']}, nodes)
+        self.assertEqual((1, 3), parse_shard('1/3'))
+        self.assertRaises(ValueError, parse_shard, '3/3')
+        shard_map = ShardMap(nodes)
+        self.assertEqual(['http://c:1999'], shard_map.get_nodes('french'))
+        routes = shard_map.route(['city', 'color', 'lodging'], 'english')
+        self.assertEqual(['city', 'color', 'lodging'], sorted(dic for dics in routes.values() for dic in dics))
+        for node, dics in routes.items():
+            self.assertEqual({nodes['english'].index(node)}, set(get_shard(dic, 2) for dic in dics))
+
+    def test_tag(self):
+        # nodes serving the app, with in-process dictionaries
+        text_stats = api.services.text_stats
+        dictionary, result_cache = text_stats.dictionary, text_stats.result_cache
+        text_stats.dictionary, text_stats.result_cache = DictionaryLocal(es=self.es), None
+        servers = [make_server('127.0.0.1', 0, api.app, threaded=True) for _ in range(2)]
+        for server in servers:
+            threading.Thread(target=server.serve_forever).start()
+        try:
+            urls = ['http://127.0.0.1:%s' % server.server_port for server in servers]
+            router = ShardedDictionary(ShardMap({'english': urls, 'french': urls[:1]}), es=self.es)
+            texts = [u'hotel and hôtel in  New York', u'bleu blue', u'nothing']
+            expected = self.d.tag_langs(texts, [], ['english', 'french'])
+            tags = router.tag_langs(texts, [], ['english', 'french'])
+            self.assertEqual([t['norm_text'] for t in expected], [t['norm_text'] for t in tags])
+            self.assertEqual([t['spans'] for t in expected], [t['spans'] for t in tags])
+            self.assertEqual(['[city]'], [t['norm_text'] for t in router.tag([u'chicago'], ['city'], 'english')])
+
+            # dictionaries of a node which is down are left out
+            router.shard_map = ShardMap({'english': urls, 'french': ['http://127.0.0.1:1']})
+            tags = router.tag_langs(texts, [], ['english', 'french'])
+            self.assertEqual(['lodging'], tags[1]['failed'])
+            self.assertEqual('bleu [color]', tags[1]['norm_text'])
+
+            # and dictionaries of a language without nodes
+            router.shard_map = ShardMap({'english': urls})
+            tags = router.tag_langs(texts, [], ['english', 'french'])
+            self.assertEqual((['lodging'], 'bleu [color]'), (tags[1]['failed'], tags[1]['norm_text']))
+            self.assertEqual([['lodging']], [t['failed'] for t in router.tag([u'bleu'], [], 'french')])
+        finally:
+            for server in servers:
+                server.shutdown()
+            text_stats.dictionary, text_stats.result_cache = dictionary, result_cache
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import unittest
+
+from util.stream import iter_chunks, iter_lines
+
+
+class StreamTestCase(unittest.TestCase):
+    data = u'new york\nhôtel\n\nlast line'.encode('utf-8')
+    expected = [u'new york', u'hôtel', u'', u'last line']
+
+    def test_lines(self):
+        self.assertEqual(self.expected, list(iter_lines(io.BytesIO(self.data))))
+        # lines and multi-byte characters split across reads
+        for chunk_size in (1, 2, 3, 7):
+            self.assertEqual(self.expected, list(iter_lines(io.BytesIO(self.data), chunk_size=chunk_size)))
+        self.assertEqual([u'a', u'b'], list(iter_lines(io.BytesIO(b'a\nb\n'))))
+
+    def test_gzip(self):
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+            f.write(self.data)
+        for chunk_size in (5, 64 * 1024):
+            self.assertEqual(self.expected, list(iter_lines(io.BytesIO(buf.getvalue()), True, chunk_size)))
+
+    def test_chunks(self):
+        self.assertEqual([[0, 1], [2, 3], [4]], list(iter_chunks(xrange(5), 2)))
+        self.assertEqual([], list(iter_chunks([], 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import tag_corpus
+from benchmark.fake_es import FakeServer, make_client
+from dictionary import DictionaryES, DictionaryLocal
+from dictionary_cache import dictionary_cache
+from text_stats import TextStats
+
+
+class TagCorpusTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with (gzip.open(path, 'wb') if name.endswith('.gz') else open(path, 'wb')) as f:
+            f.write(data)
+        return path
+
+    def test_formats(self):
+        jsonl = u'{"text": " Hotel in  Chicago"}\n\n"blue sky"\n{"id": 1}\n'.encode('utf-8')
+        expected = [(u'hotel in  chicago', ''), (u'blue sky', ''), (u'', '')]
+        self.assertEqual(expected, list(tag_corpus.iter_texts(self.write('a.jsonl', jsonl), 'auto', 'text')))
+        self.assertEqual(expected, list(tag_corpus.iter_texts(self.write('a.jsonl.gz', jsonl), 'auto', 'text')))
+
+        csv_data = u'id,body\n1,Hôtel in Paris\n2,"a, b"\n'.encode('utf-8')
+        self.assertEqual([(u'hôtel in paris', ''), (u'a, b', '')],
+                         list(tag_corpus.iter_texts(self.write('a.csv.gz', csv_data), 'auto', 'body')))
+        self.assertEqual([(u'{"text": 1}', '')],
+                         list(tag_corpus.iter_texts(self.write('a.txt', b'{"text": 1}\n'), 'auto', 'text')))
+
+    def test_bad_lines(self):
+        path = self.write('bad.jsonl', b'"new york"\n{not json\n{"text": 3}\n"chicago"\n')
+        docs = list(tag_corpus.iter_texts(path, 'auto', 'text'))
+        self.assertEqual([u'new york', '', '', u'chicago'], [text for text, _ in docs])
+        self.assertEqual([False, True, True, False], [bool(error) for _, error in docs])
+        self.assertIn('line 2', docs[1][1])
+        self.assertIn('line 3', docs[2][1])
+
+        # error records keep the output aligned with the input
+        es = make_client(FakeServer())
+        DictionaryES(es).add_voc(['new york'], 'city', 'english')
+        dictionary_cache.clear()
+        tag_corpus._stats = TextStats(dictionary=DictionaryLocal(es=es))
+        try:
+            results = tag_corpus._tag_chunk((docs, '', ['city'], 'english', False))
+        finally:
+            tag_corpus._stats = None
+        self.assertEqual(['[city]', None, None, 'chicago'], [r.get('norm_text') for r in results])
+        self.assertEqual(docs[1][1], results[1]['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()
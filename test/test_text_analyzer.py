@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import re
+import unittest
+
+from text_stats import TextAnalyzer, get_type
+from tokenizer import FastTokenizer, GeneralTokenizer
+
+# url pattern before TextAnalyzer
+url_pattern = re.compile(r'(?:http[s]?://|www)(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+
+TEXTS = [u'hotel in chicAgo', u'a beautiful blue (blau) sky green', u'www.abc.com', u'see http://abc.com/x?y=1 now',
+         u'http://a.com http://b.com', u'__init__ of c++, u.s. & $100.00!!!', u'weiß grün € 5€ ©2017 ...',
+         u'abchttp://abc.com€ ]€! _x_ tab\there\nnew line', u'https://a.b/%2F%zz?q=(1),x www', u'', u'   ', u'?!', u'東京 タワー']
+
+
+class TextAnalyzerTestCase(unittest.TestCase):
+    def test_same_tokens(self):
+        general, fast = GeneralTokenizer(), FastTokenizer()
+        for text in TEXTS:
+            self.assertEqual(general.tokenize(text), fast.tokenize(text))
+            self.assertEqual(general.tokenize(text.encode('utf-8')), fast.tokenize(text.encode('utf-8')))
+
+    def test_same_stats(self):
+        analyzer = TextAnalyzer()
+        tokenizer = GeneralTokenizer()
+        for text in TEXTS:
+            stats = analyzer.analyze(text, u'C')
+            self.assertEqual(len(tokenizer.tokenize(url_pattern.sub('[url]', text))), stats['num_word'])
+            self.assertEqual(get_type(text, url_pattern.findall(text)), stats['type'])
+            self.assertEqual(len(text), stats['num_char'])
+            self.assertEqual(len(re.findall(u'c', text.lower())), stats['num_count_only'])
+
+    def test_batch(self):
+        for tokenizer in (FastTokenizer(), GeneralTokenizer()):
+            analyzer = TextAnalyzer(tokenizer)
+            for texts in (TEXTS, [text.encode('utf-8') for text in TEXTS]):
+                expected = []
+                for text in texts:
+                    stats = analyzer.analyze(text, 'c')
+                    del stats['tokens']
+                    stats['text'] = text
+                    expected.append(stats)
+                self.assertEqual(expected, analyzer.analyze_batch(texts, 'c').to_dicts())
+
+    def test_columns(self):
+        import numpy
+        columns = TextAnalyzer().analyze_batch(numpy.array([u'see www.abc.com', u'blue sky', u'']))
+        self.assertEqual([2, 2, 0], columns.num_word)
+        self.assertEqual(['mixed', 'word', 'word'], columns.type)
+        self.assertEqual([15, 8, 0], columns.to_numpy()['num_char'].tolist())
+
+    def test_type(self):
+        analyzer = TextAnalyzer()
+        self.assertEqual('url', analyzer.analyze(u'www.abc.com')['type'])
+        self.assertEqual('mixed', analyzer.analyze(u'see www.abc.com')['type'])
+        self.assertEqual('word', analyzer.analyze(u'see abc')['type'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import unittest
+
+from benchmark.fake_es import FakeServer, make_client
+from dictionary import DictionaryES, DictionaryLocal
+from dictionary_cache import dictionary_cache
+from services import Services
+from warmup import Warmup
+
+
+class WarmupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer()
+        self.es = make_client(self.server)
+        DictionaryES(self.es).add_voc(['new york', 'chicago'], 'city', 'english')
+        dictionary_cache.clear()
+
+    def test_run(self):
+        services = Services(dictionary=DictionaryLocal(es=self.es))
+        warmup = Warmup(services, enabled=True, dics=['city'], langs=['english'])
+        self.assertTrue(warmup.run())
+        self.assertIn(('city', 'english'), dictionary_cache.snapshots)
+        requests = self.server.requests
+        self.assertTrue(warmup.run())
+        self.assertEqual(requests, self.server.requests)
+        status = warmup.to_dict()
+        self.assertEqual((1, False), (status['attempts'], status['preloaded']))
+        self.assertGreaterEqual(status['warmup_seconds'], 0)
+
+        # a forked worker reuses the warm snapshots
+        pid = os.fork()
+        if not pid:
+            warmup.after_fork()
+            requests = self.server.requests
+            tags = services.dictionary.tag(['chicago'], ['city'], 'english')
+            ok = warmup.to_dict()['preloaded'] and tags[0]['norm_text'] == '[city]' and \
+                self.server.requests == requests
+            os._exit(0 if ok else 1)
+        self.assertEqual(0, os.waitpid(pid, 0)[1])
+
+    def test_retry(self):
+        services = Services(dictionary=DictionaryLocal(es=self.es))
+        warmup = Warmup(services, enabled=True, dics=['city'], langs=['english'], retry_interval=0)
+        self.server.handle = lambda *args: (503, {'error': {'type': 'unavailable', 'reason': 'down'}, 'status': 503})
+        self.assertFalse(warmup.run())
+        self.assertTrue(warmup.error)
+        del self.server.handle
+        self.assertTrue(warmup.retry())
+        self.assertEqual(2, warmup.attempts)
+        self.assertTrue(Warmup(services, enabled=False).ready)
+
+
+if __name__ == '__main__':
+    unittest.main()
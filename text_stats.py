@@ -1,48 +1,157 @@
 import re
+from itertools import compress, izip
+from operator import methodcaller
 
 from dictionary import DictionaryES
-from tokenizer import GeneralTokenizer
+from tokenizer import FastTokenizer
+from util.metrics import COUNT_BUCKETS, metrics
 from util.utils import get_logger
 
+# one char class instead of alternatives, `%` and hex digits are already in range `$-_`
+url_pattern = re.compile(r'(?:https?://|www)[a-zA-Z0-9$-_@.&+!*(),]+')
+
+
+def get_type(text, urls):
+    text_type = 'word'
+    if urls and len(urls) == 1 and len(urls[0]) == len(text):
+        text_type = 'url'
+    elif urls and len(urls[0]) != len(text):
+        text_type = 'mixed'
+
+    return text_type
+
+
+def to_list(texts):
+    """Texts of a list, or of a NumPy or Arrow string array"""
+    if hasattr(texts, 'to_pylist'):
+        return texts.to_pylist()
+    if hasattr(texts, 'tolist'):
+        return texts.tolist()
+    return list(texts)
+
+
+class TextColumns(object):
+    """Stats of a batch of texts as columns, one list per stat with a value per text"""
+    names = ('num_word', 'num_char', 'num_count_only', 'type')
+
+    def __init__(self, texts, num_word, num_char, num_count_only, types):
+        self.text = texts
+        self.num_word = num_word
+        self.num_char = num_char
+        self.num_count_only = num_count_only
+        self.type = types
+
+    def __len__(self):
+        return len(self.text)
+
+    def to_dicts(self):
+        """Stats of each text as `TextAnalyzer.analyze` without tokens, and the text"""
+        return [{'text': text, 'num_word': num_word, 'num_char': num_char, 'num_count_only': num_count_only,
+                 'type': text_type}
+                for text, num_word, num_char, num_count_only, text_type in izip(
+                    self.text, self.num_word, self.num_char, self.num_count_only, self.type)]
+
+    def to_numpy(self):
+        """Columns as NumPy arrays, NumPy is only needed here"""
+        import numpy
+        columns = dict((name, numpy.array(getattr(self, name), dtype=numpy.int64))
+                       for name in ('num_word', 'num_char', 'num_count_only'))
+        columns['text'] = numpy.array(self.text, dtype=object)
+        columns['type'] = numpy.array(self.type, dtype=object)
+        return columns
+
+
+class TextAnalyzer(object):
+    """Basic stats of a text with one scan for urls and one tokenization"""
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer or FastTokenizer()
+
+    @staticmethod
+    def _replace_urls(text, pos=0):
+        """Text with urls replaced by `[url]`, and the urls for text type, no url starts before `pos`"""
+        urls = []
+        parts = []
+        last = 0
+        for match in url_pattern.finditer(text, pos):
+            parts.append(text[last:match.start()])
+            parts.append('[url]')
+            urls.append(match.group())
+            last = match.end()
+        parts.append(text[last:])
+        return ''.join(parts), urls
+
+    def analyze(self, text, count_only=''):
+        replaced, urls = self._replace_urls(text)
+        tokens = self.tokenizer.tokenize(replaced)
+
+        return {
+            'num_word': len(tokens),
+            'num_char': len(text),
+            'num_count_only': text.lower().count(count_only.lower()) if count_only else 0,
+            'type': get_type(text, urls),
+            'tokens': tokens
+        }
+
+    def analyze_batch(self, texts, count_only=''):
+        """Same stats as `analyze` of many texts as `TextColumns`, each stat is computed for the whole batch
+        by `map` over the texts instead of a python loop"""
+        texts = to_list(texts)
+        num_char = map(len, texts)
+        if count_only:
+            num_count_only = map(methodcaller('count', count_only.lower()), map(methodcaller('lower'), texts))
+        else:
+            num_count_only = [0] * len(texts)
+        types = ['word'] * len(texts)
+        # only texts with a url are scanned again, from their first url
+        replaced = texts
+        matches = map(url_pattern.search, texts)
+        url_indices = list(compress(xrange(len(texts)), matches))
+        if url_indices:
+            replaced = list(texts)
+            for idx in url_indices:
+                replaced[idx], urls = self._replace_urls(texts[idx], matches[idx].start())
+                types[idx] = get_type(texts[idx], urls)
+        return TextColumns(texts, self.tokenizer.count_batch(replaced), num_char, num_count_only, types)
+
 
 class TextStats(object):
-    def __init__(self):
+    def __init__(self, dictionary=None, tokenizer=None, result_cache=None):
         self.logger = get_logger(self.__class__.__name__)
-        self.tokenizer = GeneralTokenizer()
-        self.url_pattern = re.compile(r'(?:http[s]?://|www)(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
-        self.dictionary = DictionaryES()
-
-    def _count_word(self, text):
-        text = self.url_pattern.sub('[url]', text)
-        return len(self.tokenizer.tokenize(text))
-
-    def _get_type(self, text):
-        text_type = 'word'
-        urls = self.url_pattern.findall(text)
-        if urls and len(urls) == 1 and len(urls[0]) == len(text):
-            text_type = 'url'
-        elif urls and len(urls[0]) != len(text):
-            text_type = 'mixed'
-
-        return text_type
-
-    def get_stats(self, texts, count_only, lookup, lang):
-        result = []
+        self.tokenizer = tokenizer or FastTokenizer()
+        self.analyzer = TextAnalyzer(self.tokenizer)
+        self.dictionary = dictionary or DictionaryES()
+        self.result_cache = result_cache
+
+    def get_columns(self, texts, count_only=''):
+        """Basic stats of a list or array of texts as `TextColumns`, without tagging"""
+        metrics.observe('ner_texts_per_request', len(texts), COUNT_BUCKETS)
+        with metrics.timer('tokenize'):
+            return self.analyzer.analyze_batch(texts, count_only)
+
+    def get_stats(self, texts, count_only, lookup, lang, spans=False):
+        """Basic stats and tags of texts with dictionaries of one or more languages separated by comma in `lang`,
+        `spans` adds matched entities with offsets of each text. Texts which were not completely tagged before the
+        deadline of the request (see `util.admission`) or by dictionaries answering too slowly have `timed_out`,
+        texts which some dictionaries failed to tag have `failed`"""
+        lang = ','.join(l.strip() for l in lang.split(',') if l.strip())
+        texts = to_list(texts)
         # basic stats
-        for text in texts:
-            result.append({
-                'text': text,
-                'num_word': self._count_word(text),
-                'num_char': len(text),
-                'num_count_only': text.lower().count(count_only.lower()) if count_only else 0,
-                'type': self._get_type(text)
-            })
+        result = self.get_columns(texts, count_only).to_dicts()
 
         # named entity tagging
-        tags = self.dictionary.tag(texts, lookup, lang)
+        with metrics.timer('tag'):
+            if self.result_cache:
+                tags = self.result_cache.tag(self.dictionary, texts, lookup, lang)
+            else:
+                tags = self.dictionary.tag_langs(texts, lookup, lang.split(','))
 
         for idx, tag in enumerate(tags):
             result[idx]['norm_text'] = tag['norm_text']
             result[idx]['tag'] = tag['tag']
+            if spans:
+                result[idx]['spans'] = self.dictionary.get_spans(texts[idx], tag)
+            for reason in ('timed_out', 'failed'):
+                if reason in tag:
+                    result[idx][reason] = tag[reason]
 
         return result
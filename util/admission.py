@@ -0,0 +1,150 @@
+"""Admission control and deadlines of expensive requests
+
+At most `MAX_IN_FLIGHT` admitted requests run at once in a worker, up to `MAX_QUEUE` more wait at most
+`QUEUE_TIMEOUT` seconds for a slot, others are rejected so clients get a 429 instead of a timeout.
+
+An admitted request runs with a deadline of `REQUEST_TIMEOUT` seconds, kept per thread as the metrics scope of the
+request. Tagging checks it between texts, scroll pages and multi-search chunks, texts which were not tagged in time
+are returned with `timed_out`. Checks are cooperative, unlike `util.timeout` they work in any thread.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from util.metrics import LATENCY_BUCKETS, metrics
+
+# admission settings, could be overridden by environment variables
+max_in_flight = int(os.environ.get('MAX_IN_FLIGHT', 4))
+max_queue = int(os.environ.get('MAX_QUEUE', 16))
+queue_timeout = float(os.environ.get('QUEUE_TIMEOUT', 5))
+request_timeout = float(os.environ.get('REQUEST_TIMEOUT', 30))
+max_texts = int(os.environ.get('MAX_TEXTS', 1000))
+max_request_bytes = int(os.environ.get('MAX_REQUEST_BYTES', 1024 * 1024))
+
+_local = threading.local()
+
+
+class Deadline(object):
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.time() + seconds
+        # whether any work was skipped because of the deadline
+        self.exceeded = False
+
+    def remaining(self):
+        return max(self.expires_at - time.time(), 0)
+
+    def expired(self):
+        if not self.exceeded and time.time() >= self.expires_at:
+            self.exceeded = True
+            metrics.inc('ner_deadline_exceeded_total')
+        return self.exceeded
+
+
+def get_deadline():
+    """Deadline of the current request, None if it has none"""
+    return getattr(_local, 'deadline', None)
+
+
+def expired():
+    deadline = get_deadline()
+    return deadline is not None and deadline.expired()
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """Run the block with a deadline in `seconds`, a deadline of an enclosing block is kept if it is earlier"""
+    previous = get_deadline()
+    deadline = Deadline(seconds)
+    if previous is not None and previous.expires_at < deadline.expires_at:
+        deadline = previous
+    _local.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _local.deadline = previous
+
+
+class Admission(object):
+    """Bounded number of running requests with a bounded queue, per worker process"""
+    def __init__(self, max_in_flight=max_in_flight, max_queue=max_queue, queue_timeout=queue_timeout,
+                 request_timeout=request_timeout, max_texts=max_texts, max_request_bytes=max_request_bytes):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.max_texts = max_texts
+        self.max_request_bytes = max_request_bytes
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = {}
+        self._cond = threading.Condition()
+
+    def reject(self, reason):
+        """Count a rejected request, e.g. `queue_full`, `queue_timeout` or `too_large`"""
+        with self._cond:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        metrics.inc('ner_admission_rejected_total', reason=reason)
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if all are taken, return False if the request is rejected"""
+        start = time.time()
+        reason = None
+        with self._cond:
+            # queued requests go first
+            if self.queued >= self.max_queue and (self.queued or self.in_flight >= self.max_in_flight):
+                reason = 'queue_full'
+            elif self.queued or self.in_flight >= self.max_in_flight:
+                self.queued += 1
+                try:
+                    while self.in_flight >= self.max_in_flight:
+                        left = start + self.queue_timeout - time.time()
+                        if left <= 0:
+                            reason = 'queue_timeout'
+                            break
+                        self._cond.wait(left)
+                finally:
+                    self.queued -= 1
+            if not reason:
+                self.in_flight += 1
+                self.admitted += 1
+        if reason:
+            self.reject(reason)
+            return False
+        metrics.observe('ner_admission_wait_seconds', time.time() - start, LATENCY_BUCKETS)
+        return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot while the block runs, yield False without running the work if the request is rejected"""
+        if not self.acquire():
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            self.release()
+
+    def stats(self):
+        return {
+            'max_in_flight': self.max_in_flight,
+            'max_queue': self.max_queue,
+            'queue_timeout': self.queue_timeout,
+            'request_timeout': self.request_timeout,
+            'max_texts': self.max_texts,
+            'max_request_bytes': self.max_request_bytes,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected)
+        }
+
+
+admission = Admission()
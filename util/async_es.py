@@ -0,0 +1,66 @@
+import itertools
+import json
+from urllib import urlencode
+
+from elasticsearch import ConnectionError, NotFoundError, TransportError
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.locks import Semaphore
+
+from util.database import es_hosts, es_pool_size, es_timeout
+
+
+class AsyncElasticsearch(object):
+    """Non-blocking Elasticsearch client for the tornado IO loop, covers the APIs used for tagging.
+
+    In-flight requests are capped by a semaphore, other requests wait for a free slot.
+    """
+    def __init__(self, hosts=es_hosts, max_in_flight=es_pool_size, timeout=es_timeout):
+        self.hosts = itertools.cycle([h if h.startswith('http') else 'http://' + h for h in hosts])
+        self.timeout = timeout
+        self.semaphore = Semaphore(max_in_flight)
+        self.http = AsyncHTTPClient(max_clients=max_in_flight)
+
+    @gen.coroutine
+    def perform_request(self, method, path, body=None, params=None):
+        url = next(self.hosts).rstrip('/') + path
+        if params:
+            url += '?' + urlencode(params)
+        if body is not None and not isinstance(body, basestring):
+            body = json.dumps(body)
+        with (yield self.semaphore.acquire()):
+            response = yield self.http.fetch(url, method=method, body=body, raise_error=False,
+                                             request_timeout=self.timeout,
+                                             headers={'Content-Type': 'application/json'})
+        if response.code == 599:
+            raise ConnectionError('N/A', str(response.error), response.error)
+        if response.code == 404:
+            raise NotFoundError(response.code, response.body, response.body)
+        if response.code >= 400:
+            raise TransportError(response.code, response.body, response.body)
+        raise gen.Return(json.loads(response.body) if response.body else None)
+
+    @gen.coroutine
+    def exists(self, index):
+        try:
+            yield self.perform_request('HEAD', '/%s' % index)
+        except NotFoundError:
+            raise gen.Return(False)
+        raise gen.Return(True)
+
+    @gen.coroutine
+    def get_alias(self, index):
+        res = yield self.perform_request('GET', '/%s/_alias' % index)
+        raise gen.Return(res)
+
+    @gen.coroutine
+    def search(self, index, doc_type, body, params=None):
+        res = yield self.perform_request('POST', '/%s/%s/_search' % (index, doc_type), body, params)
+        raise gen.Return(res)
+
+    @gen.coroutine
+    def msearch(self, body, params=None):
+        """Multi-search of (header, query) pairs of `body`, sent as newline-delimited JSON"""
+        lines = ''.join(json.dumps(line) + '\n' for line in body)
+        res = yield self.perform_request('POST', '/_msearch', lines, params)
+        raise gen.Return(res)
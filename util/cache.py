@@ -0,0 +1,55 @@
+from collections import OrderedDict
+from threading import RLock
+
+
+class LRUCache(object):
+    """Thread safe LRU cache, bounded by the total weight of its values"""
+    def __init__(self, max_weight, weight=lambda value: 1):
+        self.max_weight = max_weight
+        self.weight = weight
+        self.total_weight = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self._data[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self.pop(key)
+            self._data[key] = value
+            self.total_weight += self.weight(value)
+            # evict least recently used, always keep the newest value
+            while self.total_weight > self.max_weight and len(self._data) > 1:
+                _, evicted = self._data.popitem(last=False)
+                self.total_weight -= self.weight(evicted)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self.total_weight -= self.weight(value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.total_weight = 0
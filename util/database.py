@@ -1,15 +1,81 @@
 # from pymongo import MongoClient
+import copy
+import os
+
 import redis
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, Urllib3HttpConnection
+
+from util.metrics import metrics
 
 
 dev_server = 'localhost'
 prod_server = '159.203.170.25'
 
+redis_host = os.environ.get('REDIS_HOST', prod_server)
+
+# elasticsearch client settings, could be overridden by environment variables
+es_hosts = os.environ.get('ES_HOSTS', 'elasticsearch:9200').split(',')
+es_pool_size = int(os.environ.get('ES_POOL_SIZE', 10))
+es_timeout = float(os.environ.get('ES_TIMEOUT', 30))
+es_max_retries = int(os.environ.get('ES_MAX_RETRIES', 3))
+es_sniff = os.environ.get('ES_SNIFF', '').lower() in ('1', 'true', 'yes')
+
+_es_clients = {}
+_redis_conns = {}
+
 
 def get_redis_conn():
-    return redis.Redis(host=prod_server)
+    """Get the pooled connection of the current process"""
+    pid = os.getpid()
+    if pid not in _redis_conns:
+        _redis_conns.clear()
+        _redis_conns[pid] = redis.Redis(host=redis_host)
+    return _redis_conns[pid]
+
+
+def get_es_operation(method, url):
+    """Operation of an Elasticsearch request for metrics, e.g. `search`, `scroll` or `bulk`"""
+    path = url.split('?')[0]
+    if path.startswith('/_search/scroll'):
+        return 'scroll'
+    apis = [part for part in path.split('/') if part.startswith('_')]
+    return apis[-1][1:] if apis else method.lower()
+
+
+def instrument_connection(connection_class):
+    """Subclass of an Elasticsearch connection class which times and counts every round-trip"""
+    class InstrumentedConnection(connection_class):
+        def perform_request(self, method, url, *args, **kwargs):
+            metrics.inc('ner_es_requests_total', op=get_es_operation(method, url))
+            with metrics.timer('es_request'):
+                return super(InstrumentedConnection, self).perform_request(method, url, *args, **kwargs)
+
+    InstrumentedConnection.__name__ = 'Instrumented' + connection_class.__name__
+    return InstrumentedConnection
 
 
 def get_es_client():
-    return Elasticsearch(hosts=['elasticsearch:9200'])
+    """Get the pooled client of the current process, forked workers never share the connections of their parent"""
+    pid = os.getpid()
+    if pid not in _es_clients:
+        _es_clients.clear()
+        _es_clients[pid] = Elasticsearch(hosts=es_hosts,
+                                         connection_class=instrument_connection(Urllib3HttpConnection),
+                                         maxsize=es_pool_size,
+                                         timeout=es_timeout,
+                                         max_retries=es_max_retries,
+                                         retry_on_timeout=True,
+                                         sniff_on_start=es_sniff,
+                                         sniff_on_connection_fail=es_sniff,
+                                         sniffer_timeout=60 if es_sniff else None)
+    return _es_clients[pid]
+
+
+def without_retries(es):
+    """Client sharing the connections of `es` which does not retry failed requests, for requests bound to a
+    deadline: each retry of a timed out request would wait for the timeout again"""
+    client = copy.copy(es)
+    client.transport = copy.copy(es.transport)
+    client.transport.max_retries = 0
+    client.transport.retry_on_timeout = False
+    return client
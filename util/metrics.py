@@ -0,0 +1,334 @@
+"""Counters and histograms of the hot paths, exported in the Prometheus text format
+
+Each worker process records into its own registry and writes a snapshot to `METRICS_DIR/<master pid>-<pid>.json`
+every `METRICS_FLUSH_INTERVAL` seconds. `/metrics` sums the snapshots of all workers of the same master, so a
+scrape which reaches any worker sees the whole server, and counters of workers recycled by `--max-requests` are
+kept until the master exits, snapshots of masters which have exited are removed. Without `METRICS_DIR`, e.g. in
+tests and command line tools, nothing is written and `/metrics` has the metrics of the process only,
+`gunicorn.conf.py` sets it.
+
+Stages of a request are timed with `metrics.timer(stage)`, they are also added to the scope of the current
+request, which is returned as the request profile.
+"""
+import atexit
+import bisect
+import errno
+import json
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from StringIO import StringIO
+
+from util.utils import get_logger
+
+metrics_dir = os.environ.get('METRICS_DIR', '')
+metrics_flush_interval = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+# requests sending this header get their profile in the response, `cprofile` also profiles functions, empty disables
+profile_header = os.environ.get('PROFILE_HEADER', 'X-Profile')
+
+# upper bounds of histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+HELP = {
+    'ner_http_requests_total': 'HTTP requests by endpoint, method and status',
+    'ner_http_request_seconds': 'HTTP request latency, streamed responses until the last chunk',
+    'ner_stage_seconds': 'Latency of stages of tagging and text stats',
+    'ner_es_requests_total': 'Elasticsearch round-trips by operation, a scroll page is one `scroll`',
+    'ner_es_requests_per_request': 'Elasticsearch round-trips of an HTTP request',
+    'ner_texts_per_request': 'Texts per text stats call, a chunk of a bulk request is one call',
+    'ner_hits_scanned_total': 'Candidate vocabularies returned by Elasticsearch',
+    'ner_hits_confirmed_total': 'Candidate vocabularies confirmed in the text',
+    'ner_fanout_timeouts_total': 'Dictionaries left out of a tagging result because they did not answer in time',
+    'ner_admission_rejected_total': 'Tagging requests rejected by reason, `queue_full` and `queue_timeout` are 429',
+    'ner_admission_wait_seconds': 'Time admitted tagging requests waited in the queue of the worker',
+    'ner_deadline_exceeded_total': 'Requests or bulk chunks returned partial results because of their deadline',
+    'ner_shard_requests_total': 'Tagging requests of a router to its nodes by node and status',
+    'ner_change_feed_events_total': 'Dictionary changes received from the change feed, applied or reloaded',
+    'ner_worker_processes': 'Worker processes with metrics in the metrics directory'
+}
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{%s}' % ','.join('%s="%s"' % (k, escape(v)) for k, v in pairs)
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_profile(profiler, limit=30):
+    """Lines of the functions of a `cProfile.Profile` with the most cumulative time"""
+    out = StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return [line for line in out.getvalue().splitlines() if line.strip()]
+
+
+class RequestScope(object):
+    """Stage timings and counters of one request"""
+    def __init__(self):
+        self.started_at = time.time()
+        # stage -> [count, seconds]
+        self.stages = defaultdict(lambda: [0, 0.0])
+        self.counters = defaultdict(int)
+
+    def to_dict(self):
+        return {
+            'total_ms': (time.time() - self.started_at) * 1000,
+            'stages': dict((stage, {'count': count, 'ms': seconds * 1000})
+                           for stage, (count, seconds) in self.stages.items()),
+            'counters': dict(self.counters)
+        }
+
+
+class Metrics(object):
+    """Metrics of the current process. `flush_interval` 0 disables the background writer, call `flush`, an empty
+    `directory` disables snapshots"""
+    def __init__(self, directory=metrics_dir, flush_interval=metrics_flush_interval):
+        self.logger = get_logger(self.__class__.__name__)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = None
+        self._reset()
+        atexit.register(self._flush_at_exit)
+
+    def _reset(self):
+        # (name, labels) -> value
+        self.counters = {}
+        # (name, labels) -> [count per bucket..., count above the last bucket], sum
+        self.histograms = {}
+        self.buckets = {}
+        self._dirty = False
+
+    def _check_process(self):
+        # values recorded before a fork belong to the parent, e.g. a warm up of a preloaded app
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._reset()
+            if self.directory and self.flush_interval > 0:
+                thread = threading.Thread(target=self._flush_loop, name='metrics-flush')
+                thread.daemon = True
+                thread.start()
+
+    def after_fork(self):
+        """Call in a forked child before other threads start, the lock could be held by a thread of the parent"""
+        self._lock = threading.Lock()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        self.prune()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def _flush_at_exit(self):
+        if self._dirty and self._pid == os.getpid():
+            self.flush()
+
+    def inc(self, name, value=1, **labels):
+        self._check_process()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            self._dirty = True
+        scope = self.scope
+        if scope is not None:
+            scope.counters[name] += value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        self._check_process()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                self.buckets.setdefault(name, buckets)
+                histogram = self.histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            histogram[0][bisect.bisect_left(self.buckets[name], value)] += 1
+            histogram[1] += value
+            self._dirty = True
+
+    @contextmanager
+    def timer(self, stage):
+        """Time a stage into `ner_stage_seconds` and the scope of the current request"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            self.observe('ner_stage_seconds', elapsed, stage=stage)
+            scope = self.scope
+            if scope is not None:
+                timing = scope.stages[stage]
+                timing[0] += 1
+                timing[1] += elapsed
+
+    @property
+    def scope(self):
+        return getattr(self._local, 'scope', None)
+
+    def bind(self, func):
+        """Run `func` in the scope of the current request, e.g. in a thread pool"""
+        scope = self.scope
+
+        def wrapper(*args, **kwargs):
+            previous = self.scope
+            self._local.scope = scope
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.scope = previous
+
+        return wrapper
+
+    def begin_request(self):
+        self._local.scope = RequestScope()
+        return self._local.scope
+
+    def end_request(self, endpoint, method, status):
+        scope = self.scope
+        self._local.scope = None
+        self.inc('ner_http_requests_total', endpoint=endpoint, method=method, status=status)
+        if scope is not None:
+            self.observe('ner_http_request_seconds', time.time() - scope.started_at, endpoint=endpoint)
+            self.observe('ner_es_requests_per_request', scope.counters.get('ner_es_requests_total', 0),
+                         COUNT_BUCKETS, endpoint=endpoint)
+        return scope
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(self.buckets[name]), list(counts), total]
+                               for (name, labels), (counts, total) in self.histograms.items()]
+            }
+
+    def _get_path(self, pid=None):
+        return os.path.join(self.directory, '%s-%s.json' % (os.getppid(), pid or os.getpid()))
+
+    def flush(self):
+        """Write the snapshot of the process, replaced atomically so readers never see a partial file"""
+        self._check_process()
+        if not self.directory:
+            return
+        self._dirty = False
+        path = self._get_path()
+        tmp_path = path + '.tmp'
+        try:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as ex:
+            self.logger.error('Write metrics error: %s' % ex)
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except OSError as ex:
+            return ex.errno == errno.EPERM
+        return True
+
+    def _list_snapshots(self):
+        """(master pid, file name) of the snapshots in the directory"""
+        try:
+            file_names = os.listdir(self.directory) if self.directory else []
+        except OSError:
+            file_names = []
+        for file_name in file_names:
+            group, _, rest = file_name.partition('-')
+            if rest.endswith('.json'):
+                yield group, file_name
+
+    def prune(self):
+        """Remove the snapshots of masters which have exited"""
+        master = str(os.getppid())
+        for group, file_name in self._list_snapshots():
+            if group != master and group.isdigit() and not self._is_alive(int(group)):
+                try:
+                    os.remove(os.path.join(self.directory, file_name))
+                except OSError:
+                    pass
+
+    def _load_snapshots(self):
+        if not self.directory:
+            yield self.snapshot()
+            return
+        master = str(os.getppid())
+        for group, file_name in self._list_snapshots():
+            if group != master:
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name)) as f:
+                    yield json.load(f)
+            except (IOError, ValueError):
+                continue
+
+    def collect(self):
+        """Sum the snapshots of all workers of the master of this process, snapshots of other masters
+        which have exited are removed"""
+        self.flush()
+        self.prune()
+        counters = defaultdict(int)
+        histograms = {}
+        buckets = {}
+        workers = 0
+        for snapshot in self._load_snapshots():
+            workers += 1
+            for name, labels, value in snapshot['counters']:
+                counters[(name, tuple(tuple(label) for label in labels))] += value
+            for name, labels, bounds, counts, total in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                buckets.setdefault(name, bounds)
+                if key not in histograms:
+                    histograms[key] = [[0] * len(counts), 0.0]
+                histogram = histograms[key]
+                histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+                histogram[1] += total
+        counters[('ner_worker_processes', ())] = workers
+        return counters, histograms, buckets
+
+    def render(self):
+        """Metrics of all workers in the Prometheus text format"""
+        counters, histograms, buckets = self.collect()
+        lines = []
+        described = set()
+
+        def describe(name, metric_type):
+            if name not in described:
+                described.add(name)
+                lines.append('# HELP %s %s' % (name, HELP.get(name, name)))
+                lines.append('# TYPE %s %s' % (name, metric_type))
+
+        for (name, labels), value in sorted(counters.items()):
+            describe(name, 'gauge' if name == 'ner_worker_processes' else 'counter')
+            lines.append('%s%s %s' % (name, _format_labels(labels), _format_value(value)))
+        for (name, labels), (counts, total) in sorted(histograms.items()):
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(list(buckets[name]) + ['+Inf'], counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_value(float(bound))
+                lines.append('%s_bucket%s %s' % (name, _format_labels(labels, [('le', le)]), cumulative))
+            lines.append('%s_sum%s %s' % (name, _format_labels(labels), _format_value(total)))
+            lines.append('%s_count%s %s' % (name, _format_labels(labels), cumulative))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
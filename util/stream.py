@@ -0,0 +1,34 @@
+import zlib
+from itertools import islice
+
+
+def iter_lines(fileobj, gzipped=False, chunk_size=64 * 1024):
+    """Iterate decoded lines of a file-like object in constant memory, optionally gzip compressed.
+
+    The stream does not need to be seekable, so it works for request bodies and stdin.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+    remain = b''
+    while True:
+        data = fileobj.read(chunk_size)
+        if not data:
+            break
+        if decompressor:
+            data = decompressor.decompress(data)
+        lines = (remain + data).split(b'\n')
+        remain = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8', 'ignore')
+    if decompressor:
+        remain += decompressor.flush()
+    if remain:
+        yield remain.decode('utf-8', 'ignore')
+
+
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            break
+        yield chunk
@@ -7,6 +7,7 @@ class TimeoutError(Exception):
 
 
 def timeout(seconds=10):
+    # SIGALRM is only delivered to the main thread, wait on `AsyncResult.get(timeout)` in worker threads
     def decorator(func):
         def _handle_timeout(signum, frame):
             raise TimeoutError('Function got timeout after running %s seconds' % seconds)
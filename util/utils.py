@@ -46,3 +46,23 @@ def get_unicode(text):
     if isinstance(text, unicode):
         return text
     return unicode(text, encoding='utf-8', errors='ignore')
+
+
+def get_memory_usage():
+    """Memory of the current process in bytes, `rss` counts pages shared with other processes in full,
+    `pss` (Linux only) splits them evenly between the processes sharing them"""
+    usage = {}
+    for path, fields in (('/proc/self/status', {'VmRSS:': 'rss'}), ('/proc/self/smaps_rollup', {'Pss:': 'pss'})):
+        try:
+            with open(path) as f:
+                for line in f:
+                    parts = line.split()
+                    if parts and parts[0] in fields:
+                        usage[fields[parts[0]]] = int(parts[1]) * 1024
+        except IOError:
+            pass
+    if 'rss' not in usage:
+        import resource
+        # peak rss, kilobytes on Linux
+        usage['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return usage
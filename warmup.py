@@ -0,0 +1,128 @@
+"""Warm-up of the services before a worker serves requests
+
+Dictionaries of `WARMUP_DICS` (all if empty) in `WARMUP_LANGS` are loaded and their matchers built, the tokenizer
+and text analyzer run once, and a tagging round-trip opens an Elasticsearch connection. With gunicorn `preload_app`
+(see `gunicorn.conf.py`) it runs once in the master, workers are forked with everything in memory and share its
+pages copy-on-write, so a worker recycled by `max_requests` starts warm. `/health/ready` reports whether the
+warm-up succeeded and how long it took, a failed warm-up is retried by the next readiness check.
+
+A node of a sharded cluster (see `shard_router`) warms up only the dictionaries of its shard `WARMUP_SHARD`, e.g.
+`1/3` for the second of 3 nodes of `WARMUP_LANGS`.
+"""
+import os
+import threading
+import time
+
+from change_feed import change_feed
+from dictionary_cache import dictionary_cache
+from shard_router import get_shard, parse_shard
+from util.metrics import metrics
+from util.utils import get_logger
+
+# warm-up settings, could be overridden by environment variables
+warmup_enabled = os.environ.get('WARMUP', '').lower() in ('1', 'true', 'yes')
+warmup_dics = [d.strip().lower() for d in os.environ.get('WARMUP_DICS', '').split(',') if d.strip()]
+warmup_langs = [l.strip() for l in os.environ.get('WARMUP_LANGS', 'english').split(',') if l.strip()]
+warmup_retry_interval = float(os.environ.get('WARMUP_RETRY_INTERVAL', 10))
+warmup_shard = parse_shard(os.environ.get('WARMUP_SHARD', ''))
+
+
+class Warmup(object):
+    """Warm up `services` once per process tree, disabled warm-up is always ready"""
+    def __init__(self, services, enabled=warmup_enabled, dics=warmup_dics, langs=warmup_langs,
+                 retry_interval=warmup_retry_interval, shard=warmup_shard):
+        self.logger = get_logger(self.__class__.__name__)
+        self.services = services
+        self.enabled = enabled
+        self.dics = dics
+        self.langs = langs
+        self.retry_interval = retry_interval
+        # (index, count) of the shard of the node, None warms up all dictionaries
+        self.shard = shard
+        self.ready = not enabled
+        self.error = ''
+        self.attempts = 0
+        self.seconds = None
+        self.attempted_at = 0
+        # process which ran the warm-up, the gunicorn master with `preload_app`
+        self.pid = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        """Warm up unless already done, return whether the services are ready"""
+        with self._lock:
+            if self.ready:
+                return True
+            self.attempts += 1
+            self.attempted_at = time.time()
+            # listen to dictionary changes in workers only, snapshots are checked again when they subscribe
+            feed_enabled = change_feed.enabled
+            change_feed.enabled = False
+            try:
+                self._warm()
+            except Exception as ex:
+                self.error = '%s: %s' % (ex.__class__.__name__, ex)
+                self.logger.exception('Warm-up failed')
+            else:
+                self.ready = True
+                self.error = ''
+                self.pid = os.getpid()
+                self.seconds = time.time() - self.attempted_at
+                self.logger.info('Warmed up %s in %.2f sec' % (', '.join(self.langs), self.seconds))
+            finally:
+                change_feed.enabled = feed_enabled
+            return self.ready
+
+    def _warm(self):
+        services = self.services
+        # dictionaries are empty rather than failing when Elasticsearch is down
+        if not services.dictionary.es.ping():
+            raise IOError('Elasticsearch is not available')
+        services.tokenizer.tokenize(u'warm up')
+        services.text_stats.analyzer.analyze(u'warm up www.example.com')
+        for lang in self.langs:
+            dics = self._get_dics(lang)
+            if self.shard and not dics:
+                # no dictionary is in the shard, empty `dics` would warm up all
+                continue
+            if hasattr(services.dictionary, 'preload'):
+                services.dictionary.preload(dics, lang)
+            # an Elasticsearch round-trip, or the matchers of in-process engines
+            services.dictionary.tag_batch([u'warm up'], dics, lang)
+
+    def _get_dics(self, lang):
+        if not self.shard:
+            return self.dics
+        index, count = self.shard
+        dictionary = self.services.dictionary
+        dics = self.dics or [dictionary._get_dic_name(idx) for idx in dictionary._get_index_list([], lang)]
+        return [dic for dic in dics if get_shard(dic, count) == index]
+
+    def retry(self):
+        """Warm up again if the last attempt failed more than `retry_interval` seconds ago"""
+        if not self.ready and time.time() - self.attempted_at >= self.retry_interval:
+            self.run()
+        return self.ready
+
+    def after_fork(self):
+        """Call in a forked worker before it serves, e.g. gunicorn `post_fork`. Locks which threads of the master
+        held at fork time would never be released, the Elasticsearch client of the worker is opened"""
+        metrics.after_fork()
+        self._lock = threading.Lock()
+        if self.ready and self.enabled:
+            start = time.time()
+            self.services.dictionary.es.ping()
+            self.logger.info('Worker %s connected in %.3f sec' % (os.getpid(), time.time() - start))
+
+    def to_dict(self):
+        return {
+            'ready': self.ready,
+            'enabled': self.enabled,
+            'warmup_seconds': self.seconds,
+            'attempts': self.attempts,
+            'error': self.error,
+            'preloaded': self.pid is not None and self.pid != os.getpid(),
+            'dictionaries': len(dictionary_cache.snapshots),
+            'langs': self.langs,
+            'shard': '%s/%s' % self.shard if self.shard else ''
+        }